@@ -0,0 +1,20 @@
+import importlib.util
+import os
+import tempfile
+from types import ModuleType
+
+# XXX the package applies the migrations and opens its files on import, so it has to be pointed at scratch ones before any benchmark imports it
+_directory = tempfile.mkdtemp(prefix="purrcafe-benchmarks-")
+
+os.environ['PURRCAFE_DB_PATH'] = os.path.join(_directory, "purrcafe.sqlite3")
+os.environ['PURRCAFE_BLOBS_PATH'] = os.path.join(_directory, "purrcafe_blobs")
+os.environ['PURRCAFE_ACCESS_LOG_PATH'] = os.path.join(_directory, "requests.log")
+
+
+def load_module(path: str) -> ModuleType:
+    # XXX lets an older revision of a module (eg. `git show <rev>:<path> > old.py`) be measured next to the current one
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
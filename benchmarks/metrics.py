@@ -0,0 +1,117 @@
+"""Metrics: per-thread shard updates against a counter behind a lock, and the overhead of MetricsMiddleware.
+
+python -m benchmarks.metrics [--updates 1000000] [--threads 4] [--requests 100000]
+"""
+import argparse
+import asyncio
+import threading
+import time
+import timeit
+
+from . import _common  # noqa: F401
+
+
+class _LockedCounter:
+    # XXX the obvious alternative to the shards, one dict shared by every thread
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+def measure_updates(updates_count: int) -> None:
+    from purrcafe._utils import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("benchmark_total", "", ("method",))
+    histogram = registry.histogram("benchmark_seconds", "", ("method",))
+    locked_counter = _LockedCounter()
+
+    for name, statement in (
+            ("Counter.inc", lambda: counter.inc("GET")),
+            ("Histogram.observe", lambda: histogram.observe(0.003, "GET")),
+            ("locked dict counter", lambda: locked_counter.inc("GET"))
+    ):
+        duration = min(timeit.repeat(statement, number=updates_count, repeat=5))
+
+        print(f"{name}: {duration / updates_count * 1e9:.0f} ns")
+
+
+def measure_contention(updates_count: int, threads_count: int) -> None:
+    from purrcafe._utils import MetricsRegistry
+
+    counter = MetricsRegistry().counter("benchmark_total", "", ("method",))
+    locked_counter = _LockedCounter()
+
+    for name, inc in (("Counter.inc", counter.inc), ("locked dict counter", locked_counter.inc)):
+        barrier = threading.Barrier(threads_count + 1)
+
+        def work() -> None:
+            barrier.wait()
+
+            for _ in range(updates_count // threads_count):
+                inc("GET")
+
+        threads = [threading.Thread(target=work) for _ in range(threads_count)]
+
+        for thread in threads:
+            thread.start()
+
+        barrier.wait()
+        start_time = time.perf_counter()
+
+        for thread in threads:
+            thread.join()
+
+        duration = time.perf_counter() - start_time
+
+        print(f"{name} from {threads_count} threads at once: {duration / updates_count * 1e9:.0f} ns")
+
+
+def measure_middleware(requests_count: int) -> None:
+    from purrcafe._middlewares import MetricsMiddleware
+
+    scope = {'type': "http", 'method': "GET", 'path': "/", 'headers': []}
+
+    async def app(scope, receive, send) -> None:
+        await receive()
+        await send({'type': "http.response.start", 'status': 200, 'headers': []})
+        await send({'type': "http.response.body", 'body': b"meow"})
+
+    async def receive() -> dict:
+        return {'type': "http.request", 'body': b"", 'more_body': False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    async def run(asgi_app) -> float:
+        start_time = time.perf_counter()
+
+        for _ in range(requests_count):
+            await asgi_app(scope, receive, send)
+
+        return time.perf_counter() - start_time
+
+    for name, asgi_app in (("bare", app), ("with MetricsMiddleware", MetricsMiddleware(app))):
+        duration = min(asyncio.run(run(asgi_app)) for _ in range(5))
+
+        print(f"request {name}: {duration / requests_count * 1e6:.2f} us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args()
+
+    measure_updates(args.updates)
+    measure_contention(args.updates, args.threads)
+    measure_middleware(args.requests)
+
+
+if __name__ == "__main__":
+    main()
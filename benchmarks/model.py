@@ -0,0 +1,104 @@
+"""Model objects: memory of ID-only File handles and the cost of reading a loaded column.
+
+python -m benchmarks.model [--handles 1000000] [--reads 1000000]
+"""
+import argparse
+import datetime
+import time
+import timeit
+import tracemalloc
+
+from . import _common  # noqa: F401
+
+
+_MISSING = object()
+
+
+class _PropertyFile:
+    # XXX the shape models had before the column descriptors, a hand-written property per column over a __dict__
+    def __init__(self, id: int, filename: str | None | object = _MISSING) -> None:
+        self._id = id
+        self._filename = filename
+
+    @property
+    def filename(self) -> str | None:
+        if self._filename is _MISSING:
+            raise LookupError("only loaded columns are measured")
+
+        return self._filename
+
+
+def measure_handles(handles_count: int) -> None:
+    from purrcafe._database import File
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+
+    handles = [File(i) for i in range(1 << 40, (1 << 40) + handles_count)]
+
+    duration = time.perf_counter() - start_time
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{handles_count} File handles from IDs: {size / 1048576:.0f} MiB, {size / len(handles):.0f} B/handle, {duration:.1f}s to build")
+
+
+def measure_reads(reads_count: int) -> None:
+    from purrcafe._database import File
+
+    file = File(1, filename="meow.txt", upload_datetime=datetime.datetime.now(datetime.UTC))
+    reference = _PropertyFile(1, "meow.txt")
+
+    for name, obj in (("Column", file), ("property", reference)):
+        duration = min(timeit.repeat("obj.filename", number=reads_count, repeat=5, globals={'obj': obj}))
+
+        print(f"loaded column read through {name}: {duration / reads_count * 1e9:.0f} ns")
+
+
+def measure_statements(files_count: int) -> None:
+    from purrcafe._database import File
+    from purrcafe._database._database import database as db, database_lock as db_l
+
+    now = datetime.datetime.now(datetime.UTC)
+    ids = range(1 << 41, (1 << 41) + files_count)
+
+    with db_l.writer:
+        db.executemany(
+            "INSERT INTO files (id, uploader_id, uploader_hidden, upload_datetime, expiration_datetime, data_key, mime_type, data_access_count, meta_access_count, file_size) VALUES (?, 0, 0, ?, ?, ?, 'text/plain', 0, 0, 0)",
+            ((id_, now, now + datetime.timedelta(days=1), f"{id_:064x}") for id_ in ids)
+        )
+        db.commit()
+
+    statements_count = 0
+    execute = db.execute
+
+    def counting_execute(*args, **kwargs):
+        nonlocal statements_count
+        statements_count += 1
+
+        return execute(*args, **kwargs)
+
+    db.execute = counting_execute
+
+    try:
+        for file in (File(id_) for id_ in ids):
+            file.filename, file.mime_type, file.expiration_datetime
+    finally:
+        del db.execute
+
+    print(f"filename, mime_type and expiration_datetime of {files_count} ID-only files: {statements_count} statements")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handles", type=int, default=1000000)
+    parser.add_argument("--reads", type=int, default=1000000)
+    args = parser.parse_args()
+
+    measure_handles(args.handles)
+    measure_reads(args.reads)
+    measure_statements(20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""RWLock contention: threads loop over `with lock.reader` around a dict read, some of the operations write instead.
+
+python -m benchmarks.rwlock [--threads 8 16 32 64] [--duration 2] [--writes-per-mille 10] [--lock-file old_rwlock.py]
+"""
+import argparse
+import random
+import threading
+import time
+
+from ._common import load_module
+
+
+def run(lock_class: type, threads_count: int, duration: float, writes_per_mille: int) -> int | None:
+    lock = lock_class()
+    data = {i: i for i in range(1024)}
+    counts = [0] * threads_count
+    is_stopped = threading.Event()
+    barrier = threading.Barrier(threads_count + 1)
+
+    def work(index: int) -> None:
+        rng = random.Random(index)
+        count = 0
+
+        barrier.wait()
+
+        while not is_stopped.is_set():
+            key = rng.randrange(1024)
+
+            if rng.randrange(1000) < writes_per_mille:
+                with lock.writer:
+                    data[key] += 1
+            else:
+                with lock.reader:
+                    data[key]
+
+            count += 1
+
+        counts[index] = count
+
+    # XXX daemonic, so a lock that loses a wake-up can be reported as stalled instead of hanging the benchmark
+    threads = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(threads_count)]
+
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    time.sleep(duration)
+    is_stopped.set()
+
+    deadline = time.monotonic() + max(duration, 1.0)
+
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+
+    if any(thread.is_alive() for thread in threads):
+        return None
+
+    return sum(counts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per run")
+    parser.add_argument("--writes-per-mille", type=int, default=0)
+    parser.add_argument("--lock-file", help="measure the RWLock of this file instead of the current one")
+    args = parser.parse_args()
+
+    if args.lock_file is not None:
+        lock_class = load_module(args.lock_file).RWLock
+    else:
+        from purrcafe._utils import RWLock as lock_class
+
+    print(f"{'threads':>8} {'ops/s':>12}")
+
+    for threads_count in args.threads:
+        ops = run(lock_class, threads_count, args.duration, args.writes_per_mille)
+        rate = "stalled" if ops is None else round(ops / args.duration)
+
+        print(f"{threads_count:>8} {rate:>12}")
+
+
+if __name__ == "__main__":
+    main()
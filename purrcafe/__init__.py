@@ -3,18 +3,31 @@ import os
 import slowapi
 from slowapi.errors import RateLimitExceeded
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
 
 from . import _background as background
-from ._middlewares import LoggingMiddleware
+from ._middlewares import AccessLogWriter, LoggingMiddleware, MetricsMiddleware
 from ._routers._limiting import get_request_identifier, limiter
 from ._routers.v1 import router as v1_api
+from ._utils import HashingPoolFullError
 
 app = FastAPI(
     openapi_url="/openapi.json" if os.environ.get('PURRCAFE_DOCS') == '1' else None
 )
 
-app.add_middleware(LoggingMiddleware)
+access_log = AccessLogWriter(
+    os.environ.get('PURRCAFE_ACCESS_LOG_PATH', "requests.log"),
+    int(os.environ.get('PURRCAFE_ACCESS_LOG_MAX_SIZE', 67108864)),  # 64 MiB
+    float(os.environ.get('PURRCAFE_ACCESS_LOG_ROTATION_INTERVAL', 86400)),
+    int(os.environ.get('PURRCAFE_ACCESS_LOG_BACKUPS', 7)),
+    float(os.environ.get('PURRCAFE_ACCESS_LOG_FLUSH_DELAY', 1)),
+    int(os.environ.get('PURRCAFE_ACCESS_LOG_BATCH_SIZE', 512))
+)
+
+app.add_middleware(LoggingMiddleware, writer=access_log)
+app.add_middleware(MetricsMiddleware)
 
 
 app.add_middleware(
@@ -31,7 +44,20 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, slowapi._rate_limit_exceeded_handler)
 
 
+def _hashing_pool_full_handler(request: Request, exc: HashingPoolFullError) -> JSONResponse:
+    return JSONResponse(
+        {'detail': str(exc)},
+        status_code=503,
+        headers={'Retry-After': str(exc.retry_after)}
+    )
+
+
+app.add_exception_handler(HashingPoolFullError, _hashing_pool_full_handler)
+
+
 app.include_router(v1_api, prefix="/v1")
 
 
-background.start_jobs()
+app.add_event_handler("startup", background.start_jobs)
+app.add_event_handler("shutdown", background.stop_jobs)
+app.add_event_handler("shutdown", access_log.close)
@@ -4,10 +4,13 @@ import uvicorn
 
 from . import app
 
+workers_count = int(os.environ.get('PURRCAFE_WORKERS', 1))
 
+# XXX importing the package above already applied the migrations, spawned workers import it anew with their own database connections and find nothing left to apply
 uvicorn.run(
-    app,
+    "purrcafe:app" if workers_count > 1 else app,
     host="0.0.0.0" if os.environ.get('PURRCAFE_LISTEN') == '1' else "localhost",
     port=int(os.environ.get('PURRCAFE_PORT', 8080)),
-    log_level=os.environ.get('PURRCAFE_UVICORN_LOGLEVEL', "error")
+    log_level=os.environ.get('PURRCAFE_UVICORN_LOGLEVEL', "error"),
+    workers=workers_count
 )
@@ -3,15 +3,93 @@ import os
 import threading
 import time
 
-from ._database import File
+from ._database import File, Upload
+from ._database._database import access_counters, database_lock, expiry_scheduler
+from ._logging import logger
+from ._utils import FileLock, hashing_pool
+
+# XXX held by the worker running the jobs which must not run once per worker, it's released when that worker exits
+leader_lock = FileLock(f"{database_lock.path}.leader.lock")
+
+
+def _get_retry_delay(failures_count: int, max_delay: float) -> float:
+    # XXX a failed job is retried soon at first and less often the longer it keeps failing, but never less often than it normally runs
+    return min(2 ** failures_count, max_delay)
 
 
 def _expired_deleter_worker() -> None:
+    check_delay = datetime.timedelta(hours=int(os.environ.get('PURRCAFE_EXPIRED_CHECK_DELAY', 1))).total_seconds()
+    # XXX deadlines are scheduled in the memory of the worker which set them, so with several workers the leader reloads the earliest one from the index this often, a file expiring sooner than the leader knows of is deleted at most this late
+    poll_delay = check_delay if int(os.environ.get('PURRCAFE_WORKERS', 1)) == 1 else min(float(os.environ.get('PURRCAFE_EXPIRY_POLL_DELAY', 10)), check_delay)
+    failures_count = 0
+    is_due = True
+
     while True:
-        File.delete_all_expired()
+        try:
+            if is_due:
+                File.delete_all_expired()
 
-        time.sleep(datetime.timedelta(hours=int(os.environ.get('PURRCAFE_EXPIRED_CHECK_DELAY', 1))).total_seconds())
+                deleted_at = time.monotonic()
 
+            expiry_scheduler.reset(File.get_next_expiration_datetimes(expiry_scheduler.max_size if is_due else 1))
+        except Exception:
+            logger.exception("failed to delete expired files")
+
+            failures_count += 1
+            time.sleep(_get_retry_delay(failures_count, check_delay))
+
+            continue
+
+        failures_count = 0
+        is_due = expiry_scheduler.wait(poll_delay) or time.monotonic() - deleted_at >= check_delay
+
+
+def _abandoned_uploads_deleter_worker() -> None:
+    check_delay = datetime.timedelta(hours=int(os.environ.get('PURRCAFE_ABANDONED_CHECK_DELAY', 1))).total_seconds()
+    failures_count = 0
+
+    while True:
+        try:
+            Upload.delete_all_abandoned()
+        except Exception:
+            logger.exception("failed to delete abandoned uploads")
+
+            failures_count += 1
+            time.sleep(_get_retry_delay(failures_count, check_delay))
+
+            continue
+
+        failures_count = 0
+        time.sleep(check_delay)
+
+
+def _access_counters_flusher_worker() -> None:
+    while True:
+        access_counters.wait(float(os.environ.get('PURRCAFE_COUNTERS_FLUSH_DELAY', 5)))
+
+        # XXX a failed flush keeps its batch pending, so it's just tried again after the delay
+        try:
+            access_counters.flush()
+        except Exception:
+            logger.exception("failed to flush access counters")
+
+
+def _leader_worker() -> None:
+    # XXX every worker waits for the lock, so if the leader dies another one takes over its jobs
+    leader_lock.acquire()
+
+    logger.info(f"process {os.getpid()} is running the background jobs")
 
-def start_jobs() -> None:
     threading.Thread(daemon=True, target=_expired_deleter_worker).start()
+    threading.Thread(daemon=True, target=_abandoned_uploads_deleter_worker).start()
+
+
+def start_jobs() -> None:
+    threading.Thread(daemon=True, target=_leader_worker).start()
+    # XXX access counters are accumulated in the memory of each worker, so each one flushes its own
+    threading.Thread(daemon=True, target=_access_counters_flusher_worker).start()
+
+
+def stop_jobs() -> None:
+    access_counters.flush()
+    hashing_pool.shutdown()
@@ -1,22 +1,39 @@
 from pathlib import Path
 
+from .._utils import FileLock
 from ._database import database, database_lock
 from ._utils import complete_migrations
 from ._users import User
 from ._sessions import Session
 from ._files import File
+from ._uploads import Upload
+
+
+def _has_tables() -> bool:
+    with database_lock.reader:
+        return database.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchone() is not None
 
 
 def _complete_migrations():
     migrations_path = Path(__file__).parent.joinpath("migrations")
 
-    state_file = migrations_path.joinpath("state")
-    last_migration = int(state_file.read_text()) if state_file.exists() else -1
+    # XXX the state belongs to the database it describes, the one kept among the migrations is only trusted for an already migrated database
+    state_file = Path(f"{database_lock.path}.migrations")
+    legacy_state_file = migrations_path.joinpath("state")
+
+    # XXX every process importing the package gets here, the lock makes the first one apply the migrations while the rest wait and find nothing left to do
+    with FileLock(f"{database_lock.path}.migrations.lock"):
+        if state_file.exists():
+            last_migration = int(state_file.read_text())
+        elif legacy_state_file.exists() and _has_tables():
+            last_migration = int(legacy_state_file.read_text())
+        else:
+            last_migration = -1
 
-    with database_lock.writer:
-        final_migration = complete_migrations(database, migrations_path, last_migration)
+        with database_lock.exclusive:
+            final_migration = complete_migrations(database, migrations_path, last_migration)
 
-    state_file.write_text(str(final_migration))
+        state_file.write_text(str(final_migration))
 
 
 _complete_migrations()
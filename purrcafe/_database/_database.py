@@ -1,13 +1,73 @@
 # XXX the reason this is moved into a separate module is the (beloved) circular import issue
 
+import asyncio
+import concurrent.futures
+import functools
 import os
-import sqlite3
+from typing import Callable, Iterable
 
-from .._utils import RWLock
+from .._utils import LRUCache, PayloadCache, metrics
+from ._utils import BlobStore, ConnectionPool, ConnectionProxy, CounterAccumulator, DeadlineScheduler
+from .exceptions import DatabaseInternalError
 
-database = sqlite3.connect(os.environ.get('PURRCAFE_DB_PATH', "purrcafe.sqlite3"), check_same_thread=False)
-database_lock = RWLock()
+# XXX `database_lock.reader`/`database_lock.writer` check out a pooled connection for the current thread, `database` runs statements on it
+database_lock = ConnectionPool(os.environ.get('PURRCAFE_DB_PATH', "purrcafe.sqlite3"), int(os.environ.get('PURRCAFE_DB_READERS', 8)))
+database = ConnectionProxy(
+    database_lock,
+    metrics.histogram(
+        "purrcafe_db_statement_duration_seconds",
+        "Time spent executing database statements, fetching rows of cursors isn't included.",
+        ("statement",),
+        (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+    )
+)
+database_threads_count = int(os.environ.get('PURRCAFE_DB_THREADS', 16))
+database_executor = concurrent.futures.ThreadPoolExecutor(database_threads_count, thread_name_prefix="purrcafe-db")
+database_executor_tasks = metrics.gauge("purrcafe_db_executor_tasks", "Calls submitted to the database executor which haven't finished yet.")
+
+blob_store = BlobStore(os.environ.get('PURRCAFE_BLOBS_PATH', "purrcafe_blobs"))
+
+# XXX keyed by blob keys, which are content hashes, so entries never go stale and are only dropped to free memory
+payload_cache = PayloadCache(int(os.environ.get('PURRCAFE_PAYLOAD_CACHE_SIZE', 67108864)), int(os.environ.get('PURRCAFE_PAYLOAD_CACHE_MAX_ENTRY_SIZE', 4194304)))  # 64 MiB, 4 MiB
+
+expiry_scheduler = DeadlineScheduler(int(os.environ.get('PURRCAFE_EXPIRY_SCHEDULE_SIZE', 1024)))
+
+# XXX caches of rows are invalidated only in the process changing them, so with several workers they would keep serving revoked sessions and stale rows
+_are_row_caches_enabled = int(os.environ.get('PURRCAFE_WORKERS', 1)) <= 1
+
+# XXX maps session IDs to (session, owner) pairs of authorized requests
+auth_cache = LRUCache(int(os.environ.get('PURRCAFE_AUTH_CACHE_SIZE', 10000)) if _are_row_caches_enabled else 0, float(os.environ.get('PURRCAFE_AUTH_CACHE_TTL', 60)))
+
+# XXX opt-in identity maps of model objects keyed by their IDs, disabled unless PURRCAFE_IDENTITY_MAP_SIZE is set
+user_identity_map = LRUCache(int(os.environ.get('PURRCAFE_IDENTITY_MAP_SIZE', 0)) if _are_row_caches_enabled else 0, float(os.environ.get('PURRCAFE_IDENTITY_MAP_TTL', 60)))
+session_identity_map = LRUCache(int(os.environ.get('PURRCAFE_IDENTITY_MAP_SIZE', 0)) if _are_row_caches_enabled else 0, float(os.environ.get('PURRCAFE_IDENTITY_MAP_TTL', 60)))
+file_identity_map = LRUCache(int(os.environ.get('PURRCAFE_IDENTITY_MAP_SIZE', 0)) if _are_row_caches_enabled else 0, float(os.environ.get('PURRCAFE_IDENTITY_MAP_TTL', 60)))
+
+# XXX hash states of resumable uploads, keyed by upload ID, so appending a chunk doesn't mean rehashing everything before it
+upload_hashes = LRUCache(int(os.environ.get('PURRCAFE_UPLOAD_HASHES_SIZE', 1024)))
+
+# XXX flushed counters are added to the rows, so the counts cached files were loaded with become stale
+access_counters = CounterAccumulator(database_lock, "files", ("data_access_count", "meta_access_count"), int(os.environ.get('PURRCAFE_COUNTERS_FLUSH_THRESHOLD', 1024)), file_identity_map.discard)
+
+
+async def run_in_database_executor[**P, T](func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    database_executor_tasks.inc()
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(database_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        database_executor_tasks.dec()
 
 
 class _Nothing:
     pass
+
+
+def _check_columns(table: str, known_columns: tuple[str, ...], columns: Iterable[str]) -> tuple[str, ...]:
+    # XXX column names end up in the query text, so only known ones are allowed
+    columns = tuple(columns)
+
+    if unknown_columns := [column for column in columns if column not in known_columns]:
+        raise DatabaseInternalError(f"unknown column(s) of {table}: {', '.join(unknown_columns)}")
+
+    return columns
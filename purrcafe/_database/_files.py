@@ -1,215 +1,253 @@
 from __future__ import annotations
+import collections
+import contextlib
 import datetime
+import functools
 import os
-from typing import Final
+from typing import BinaryIO, Final, Iterable, Iterator, Literal
 
 from meowid import MeowID
 
 from . import User
-from ._database import _Nothing, database as db, database_lock as db_l
-from .exceptions import WrongHashLengthError, IDNotFoundError, ObjectIDUnknownError, WrongValueLengthError, ValueMismatchError
+from ._database import _Nothing, _check_columns, database as db, database_lock as db_l, blob_store, payload_cache, access_counters, expiry_scheduler, file_identity_map, run_in_database_executor
+from ._utils import BlobWriter, GZIP_ENCODING, choose_content_encoding, compress, decompress, iter_decompressed, iter_decompressed_ranges
+from ._model import Column, Model, as_datetime, as_meowid
+from .exceptions import WrongHashLengthError, IDNotFoundError, WrongValueLengthError, ValueMismatchError
 
+_DATA_ACCESS_COUNTER: Final[int] = 0
+_META_ACCESS_COUNTER: Final[int] = 1
+
+
+def _as_utc(datetime_: datetime.datetime) -> datetime.datetime:
+    # XXX timestamps are stored as UTC strings, so they only compare correctly against UTC ones
+    return datetime_.replace(tzinfo=datetime.UTC) if datetime_.tzinfo is None else datetime_.astimezone(datetime.UTC)
+
+
+class File(Model):
+    __slots__ = ("_uploader",)
+
+    NAME: Final[str] = "file"
+    TABLE: Final[str] = "files"
 
-class File:
     DEFAULT_GUEST_LIFETIME: Final[datetime.timedelta] = datetime.timedelta(weeks=1)
     DEFAULT_LIFETIME: Final[datetime.timedelta] = datetime.timedelta(weeks=4)
     DEFAULT_CONTENT_TYPE: Final[str] = "application/octet-stream"
     ENCRYPTED_DATA_HASH_LENGTH: Final[int] = 32
     GUEST_MAX_FILE_SIZE: Final[int] = int(os.environ.get('PURRCAFE_MAXSIZE_GUEST', 31457280))  # 30 MiB
     MAX_FILE_SIZE = int(os.environ.get('PURRCAFE_MAXSIZE', 73400320))  # 70 MiB
+    DATA_CHUNK_SIZE: Final[int] = 262144  # 256 KiB
+    EXPIRED_DELETION_BATCH_SIZE: Final[int] = int(os.environ.get('PURRCAFE_EXPIRED_BATCH_SIZE', 500))
+    COMPRESSION_LEVEL: Final[int] = int(os.environ.get('PURRCAFE_COMPRESSION_LEVEL', 1))  # 0 disables compression
 
-    _id: MeowID | type[_Nothing]
     _uploader_id: MeowID | type[_Nothing]
     _uploader_hidden: bool | type[_Nothing]
     _upload_datetime: datetime.datetime | type[_Nothing]
     _expiration_datetime: datetime.datetime | None | type[_Nothing]
     _filename: str | None | type[_Nothing]
-    _data: bytes | type[_Nothing]
+    _data_key: str | type[_Nothing]
     _decrypted_data_hash: str | None | type[_Nothing]
     _mime_type: str | type[_Nothing]
     _data_access_count: int | type[_Nothing]
     _max_access_count: int | None | type[_Nothing]
     _meta_access_count: int | type[_Nothing]
     _file_size: int | type[_Nothing]
+    _content_encoding: str | None | type[_Nothing]
+    _encoded_size: int | None | type[_Nothing]
+    _uploader: User | type[_Nothing]
 
-    @property
-    def id(self) -> MeowID:
-        if self._id is _Nothing:
-            raise ObjectIDUnknownError
-
-        return self._id
-
-    @property
-    def uploader_id(self) -> MeowID:
-        if self._uploader_id is _Nothing:
-            with db_l.reader:
-                self._uploader_id = MeowID.from_int(db.execute("SELECT uploader_id FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0])
-
-        return self._uploader_id
+    uploader_id = Column(as_meowid)
 
     @property
     def uploader(self) -> User:
-        return User.get(self.uploader_id)
+        if self._uploader is _Nothing:
+            return User.get(self.uploader_id)
 
-    @property
-    def uploader_hidden(self) -> bool:
-        if self._uploader_hidden is _Nothing:
-            with db_l.reader:
-                self._uploader_hidden = db.execute("SELECT uploader_hidden FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+        return self._uploader
 
-        return self._uploader_hidden
+    uploader_hidden = Column()
 
     @uploader_hidden.setter
     def uploader_hidden(self, new_uploader_hidden: bool) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET uploader_hidden=(?) WHERE id=(?)", (new_uploader_hidden, int(self.id)))
-            db.commit()
-
-        self._uploader_hidden = new_uploader_hidden
-
-    @property
-    def upload_datetime(self) -> datetime.datetime:
-        if self._upload_datetime is _Nothing:
-            with db_l.reader:
-                self._upload_datetime = datetime.datetime.fromisoformat(db.execute("SELECT upload_datetime FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0])
-
-        return self._upload_datetime
+        self._update_column("uploader_hidden", new_uploader_hidden)
 
-    @property
-    def expiration_datetime(self) -> datetime.datetime | None:
-        if self._expiration_datetime is _Nothing:
-            with db_l.reader:
-                self._expiration_datetime = datetime.datetime.fromisoformat(db.execute("SELECT expiration_datetime FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0])
+    upload_datetime = Column(as_datetime)
 
-        return self._expiration_datetime
+    expiration_datetime = Column(as_datetime)
 
     @expiration_datetime.setter
     def expiration_datetime(self, new_expiration_datetime: datetime.datetime | None ) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET expiration_datetime=(?) WHERE id=(?)", (new_expiration_datetime, int(self.id)))
-            db.commit()
+        self._update_column("expiration_datetime", new_expiration_datetime)
 
-        self._expiration_datetime = new_expiration_datetime
-
-    @property
-    def filename(self) -> str | None:
-        if self._filename is _Nothing:
-            with db_l.reader:
-                self._filename = db.execute("SELECT filename FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+        if new_expiration_datetime is not None:
+            db.on_commit(functools.partial(expiry_scheduler.schedule, new_expiration_datetime))
 
-        return self._filename
+    filename = Column()
 
     @filename.setter
     def filename(self, new_filename: str | None) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET filename=(?) WHERE id=(?)", (new_filename, int(self.id)))
-            db.commit()
+        self._update_column("filename", new_filename)
 
-        self._filename = _Nothing
+    data_key = Column()
 
     @property
     def data(self) -> bytes:
-        if self._data is _Nothing:
-            with db_l.reader:
-                self._data = db.execute("SELECT data FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+        # XXX not kept on the object, hot payloads are held by the byte-budgeted payload cache instead
+        if (data := self._get_cached_data()) is None:
+            data = blob_store.read(self.data_key)
 
-        return self._data
+        return decompress(data) if self.content_encoding is not None else data
 
     @data.setter
     def data(self, new_data: bytes) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET data=(?) WHERE id=(?)", (new_data, int(self.id)))
-            db.commit()
+        old_data_key = self.data_key
 
-        self._data = new_data
+        with blob_store.writer() as writer:
+            writer.write(new_data)
+            writer.finish()
 
-    @property
-    def decrypted_data_hash(self) -> str:
-        if self._decrypted_data_hash is _Nothing:
-            with db_l.reader:
-                self._decrypted_data_hash = db.execute("SELECT decrypted_data_hash FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+            with db_l.writer:
+                new_data_key = writer.commit()
 
-        return self._decrypted_data_hash
+                try:
+                    with db.transaction():
+                        db.execute("UPDATE files SET data_key=(?), file_size=(?), content_encoding=NULL, encoded_size=NULL WHERE id=(?)", (new_data_key, len(new_data), int(self.id)))
+                        self._acquire_data(new_data_key, len(new_data))
+                        self._release_data(old_data_key)
+                        self._apply_on_commit(data_key=new_data_key, file_size=len(new_data), content_encoding=None, encoded_size=None)
 
-    @decrypted_data_hash.setter
-    def decrypted_data_hash(self, new_decrypted_data_hash: str) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET decrypted_data_hash=(?) WHERE id=(?)", (new_decrypted_data_hash, int(self.id)))
-            db.commit()
+                        db.on_commit(functools.partial(payload_cache.discard, old_data_key))
+                except BaseException:
+                    self._discard_unreferenced_data(new_data_key)
 
-        self._decrypted_data_hash = new_decrypted_data_hash
+                    raise
 
-    @property
-    def mime_type(self) -> str:
-        if self._mime_type is _Nothing:
-            with db_l.reader:
-                self._mime_type = db.execute("SELECT mime_type FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+    def open_data(self) -> BinaryIO:
+        return blob_store.open(self.data_key)
+
+    def _get_cached_data(self) -> bytes | None:
+        if (data := payload_cache.get(self.data_key)) is None and payload_cache.would_admit(self.data_key, self.stored_size):
+            # XXX the blob may be released meanwhile, it's deleted before the payload is discarded, so a payload read before that is never put back
+            version = payload_cache.version
+
+            payload_cache.put(self.data_key, data := blob_store.read(self.data_key), version)
 
-        return self._mime_type
+        return data
+
+    def iter_stored_data(self, chunk_size: int = DATA_CHUNK_SIZE) -> Iterator[bytes]:
+        # XXX the data as it's kept in the blob store, still compressed if the file has a content encoding
+        if (data := self._get_cached_data()) is not None:
+            return (data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size))
+
+        # XXX the blob is opened right away so the data stays readable even if the file gets deleted mid-stream
+        return self._iter_blob(self.open_data(), 0, self.stored_size, chunk_size)
+
+    def iter_data(self, start: int = 0, stop: int | None = None, chunk_size: int = DATA_CHUNK_SIZE) -> Iterator[bytes]:
+        if stop is None:
+            stop = self.file_size
+
+        if self.content_encoding is not None:
+            return iter_decompressed(self.iter_stored_data(chunk_size), start, stop, chunk_size)
+
+        if (data := self._get_cached_data()) is not None:
+            return (data[offset:min(offset + chunk_size, stop)] for offset in range(start, stop, chunk_size))
+
+        return self._iter_blob(self.open_data(), start, stop, chunk_size)
+
+    def iter_data_ranges(self, ranges: list[tuple[int, int]], chunk_size: int = DATA_CHUNK_SIZE) -> Iterator[tuple[int, bytes]]:
+        # XXX compressed data is inflated once for all of the ranges, so they have to be ascending and disjoint
+        if self.content_encoding is not None:
+            return iter_decompressed_ranges(self.iter_stored_data(chunk_size), ranges, chunk_size)
+
+        # XXX every range opens the blob right away, like `iter_data` does on its own
+        parts = [self.iter_data(start, stop, chunk_size) for start, stop in ranges]
+
+        return ((index, chunk) for index, part in enumerate(parts) for chunk in part)
+
+    @staticmethod
+    def _iter_blob(blob: BinaryIO, start: int, stop: int, chunk_size: int) -> Iterator[bytes]:
+        with blob:
+            blob.seek(start)
+
+            while start < stop and (chunk := blob.read(min(chunk_size, stop - start))):
+                start += len(chunk)
+
+                yield chunk
+
+    decrypted_data_hash = Column()
+
+    @decrypted_data_hash.setter
+    def decrypted_data_hash(self, new_decrypted_data_hash: str) -> None:
+        self._update_column("decrypted_data_hash", new_decrypted_data_hash)
+
+    mime_type = Column()
 
     @mime_type.setter
     def mime_type(self, new_mime_type: str) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET mime_type=(?) WHERE id=(?)", (new_mime_type, int(self.id)))
-            db.commit()
+        self._update_column("mime_type", new_mime_type)
 
-        self._mime_type = new_mime_type
+    data_access_count = Column()
 
-    @property
+    @data_access_count.getter
     def data_access_count(self) -> int:
-        if self._data_access_count is _Nothing:
-            with db_l.reader:
-                self._data_access_count = db.execute("SELECT data_access_count FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
-
-        return self._data_access_count
+        return self._get_column("data_access_count") + access_counters.get_pending(int(self.id), _DATA_ACCESS_COUNTER)
 
     @data_access_count.setter
     def data_access_count(self, new_data_access_count: int) -> None:
         with db_l.writer:
-            db.execute("UPDATE files SET data_access_count=(?) WHERE id=(?)", (new_data_access_count, int(self.id)))
-            db.commit()
+            access_counters.discard(int(self.id), _DATA_ACCESS_COUNTER)
 
-        self._data_access_count = new_data_access_count
+            self._update_column("data_access_count", new_data_access_count)
 
-    @property
-    def max_access_count(self) -> int | None:
-        if self._max_access_count is _Nothing:
-            with db_l.reader:
-                self._max_access_count = db.execute("SELECT max_access_count FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
-
-        return self._max_access_count
+    max_access_count = Column()
 
     @max_access_count.setter
     def max_access_count(self, new_max_access_count: int | None) -> None:
-        with db_l.writer:
-            db.execute("UPDATE files SET max_access_count=(?) WHERE id=(?)", (new_max_access_count, int(self.id)))
-            db.commit()
+        access_counters.flush()
 
-        self._max_access_count = new_max_access_count
+        self._update_column("max_access_count", new_max_access_count)
 
-    @property
-    def meta_access_count(self) -> int:
-        if self._meta_access_count is _Nothing:
-            with db_l.reader:
-                self._meta_access_count = db.execute("SELECT meta_access_count FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+    meta_access_count = Column()
 
-        return self._meta_access_count
+    @meta_access_count.getter
+    def meta_access_count(self) -> int:
+        return self._get_column("meta_access_count") + access_counters.get_pending(int(self.id), _META_ACCESS_COUNTER)
 
     @meta_access_count.setter
     def meta_access_count(self, new_meta_access_count: int) -> None:
         with db_l.writer:
-            db.execute("UPDATE files SET meta_access_count=(?) WHERE id=(?)", (new_meta_access_count, int(self.id)))
+            access_counters.discard(int(self.id), _META_ACCESS_COUNTER)
+
+            self._update_column("meta_access_count", new_meta_access_count)
+
+    def register_data_access(self) -> int:
+        # XXX accesses of files with limited access count are written right away, so the limit is always enforced exactly
+        if self.max_access_count is None:
+            access_counters.add(int(self.id), _DATA_ACCESS_COUNTER)
+
+            return self.data_access_count
+
+        with db_l.writer:
+            data_access_count = db.execute("UPDATE files SET data_access_count=data_access_count + 1 WHERE id=(?) RETURNING data_access_count", (int(self.id),)).fetchall()[0][0]
             db.commit()
 
-        self._meta_access_count = new_meta_access_count
+        self._apply_on_commit(data_access_count=data_access_count)
 
-    @property
-    def file_size(self):
-        if self._file_size is _Nothing:
-            with db_l.reader:
-                self._file_size = db.execute("SELECT LENGTH(data) FROM files WHERE id=(?)", (int(self.id),)).fetchone()[0]
+        return data_access_count
+
+    def register_meta_access(self) -> int:
+        access_counters.add(int(self.id), _META_ACCESS_COUNTER)
+
+        return self.meta_access_count
+
+    file_size = Column()
+
+    content_encoding = Column()
 
-        return self._file_size
+    encoded_size = Column()
+
+    @property
+    def stored_size(self) -> int:
+        return self.encoded_size if self.content_encoding is not None else self.file_size
 
     def __init__(
             self,
@@ -219,27 +257,54 @@ class File:
             upload_datetime: datetime.datetime | str | type[_Nothing] = _Nothing,
             expiration_datetime: datetime.datetime | str | type[_Nothing] = _Nothing,
             filename: str | None | type[_Nothing] = _Nothing,
-            data: bytes | type[_Nothing] = _Nothing,
+            data_key: str | type[_Nothing] = _Nothing,
             decrypted_data_hash: str | None | type[_Nothing] = _Nothing,
             mime_type: str | type[_Nothing] = _Nothing,
             data_access_count: int | type[_Nothing] = _Nothing,
             max_access_count: int | None | type[_Nothing] = _Nothing,
             meta_access_count: int | type[_Nothing] = _Nothing,
-            file_size: int | type[_Nothing] = _Nothing
+            file_size: int | type[_Nothing] = _Nothing,
+            content_encoding: str | None | type[_Nothing] = _Nothing,
+            encoded_size: int | None | type[_Nothing] = _Nothing
     ) -> None:
-        self._id = MeowID.from_int(id) if isinstance(id, int) else id
-        self._uploader_id = MeowID.from_int(uploader_id) if isinstance(uploader_id, int) else uploader_id
-        self._uploader_hidden = uploader_hidden
-        self._upload_datetime = datetime.datetime.fromisoformat(upload_datetime) if isinstance(upload_datetime, str) else upload_datetime
-        self._expiration_datetime = datetime.datetime.fromisoformat(expiration_datetime) if isinstance(expiration_datetime, str) else expiration_datetime
-        self._filename = filename
-        self._data = data
-        self._decrypted_data_hash = decrypted_data_hash
-        self._mime_type = mime_type
-        self._data_access_count = data_access_count
-        self._max_access_count = max_access_count
-        self._meta_access_count = meta_access_count
-        self._file_size = file_size
+        super().__init__(
+            id,
+            uploader_id=uploader_id,
+            uploader_hidden=uploader_hidden,
+            upload_datetime=upload_datetime,
+            expiration_datetime=expiration_datetime,
+            filename=filename,
+            data_key=data_key,
+            decrypted_data_hash=decrypted_data_hash,
+            mime_type=mime_type,
+            data_access_count=data_access_count,
+            max_access_count=max_access_count,
+            meta_access_count=meta_access_count,
+            file_size=file_size,
+            content_encoding=content_encoding,
+            encoded_size=encoded_size
+        )
+
+        self._uploader = _Nothing
+
+    def _update_column(self, column: str, value: object) -> None:
+        with db_l.writer:
+            db.execute(f"UPDATE files SET {column}=(?) WHERE id=(?)", (value, int(self.id)))
+            db.commit()
+
+        self._apply_on_commit(**{column: value})
+
+    def _apply_on_commit(self, **values: object) -> None:
+        # XXX the object may be shared through the identity map, so new values only land on it once committed, a rolled back one never shows up
+        for column, value in values.items():
+            db.on_commit(functools.partial(setattr, self, f"_{column}", value))
+
+        self._discard_identity()
+
+    def _discard_identity(self) -> None:
+        # XXX discarded right away so uncommitted values don't leak out of a transaction, and once more on commit in case the old row got cached meanwhile
+        file_identity_map.discard(int(self.id))
+        db.on_commit(functools.partial(file_identity_map.discard, int(self.id)))
 
     @classmethod
     def does_exist(cls, id: MeowID) -> bool:
@@ -248,84 +313,278 @@ class File:
 
     @classmethod
     def get(cls, id_: MeowID) -> File:
+        if (file := file_identity_map.get(int(id_))) is not None:
+            return file
+
+        version = file_identity_map.version
+
         with db_l.reader:
-            raw_data = db.execute("SELECT id, uploader_id, uploader_hidden, upload_datetime, expiration_datetime, filename, decrypted_data_hash, mime_type, data_access_count, max_access_count, meta_access_count, LENGTH(data) FROM files WHERE id=(?)", (int(id_),)).fetchone()
+            raw_data = db.execute(f"SELECT {', '.join(cls.COLUMNS)} FROM files WHERE id=(?)", (int(id_),)).fetchone()
 
         if raw_data is None:
             raise IDNotFoundError("file", id_)
 
-        return cls(
-            raw_data[0],
-            raw_data[1],
-            raw_data[2],
-            raw_data[3],
-            raw_data[4],
-            raw_data[5],
-            _Nothing,
-            raw_data[6],
-            raw_data[7],
-            raw_data[8],
-            raw_data[9],
-            raw_data[10],
-            raw_data[11]
-        )
+        file = cls(id_, **dict(zip(cls.COLUMNS, raw_data)))
+
+        file_identity_map.put(int(id_), file, version)
+
+        return file
 
     @classmethod
-    def get_all(cls) -> list[File]:
-        with db_l.reader:
-            return [cls(file_id) for file_id in map(lambda q: q[0], db.execute("SELECT id FROM files").fetchall())]
+    async def aget(cls, id_: MeowID) -> File:
+        return await run_in_database_executor(cls.get, id_)
 
     @classmethod
-    def get_uploaded_by(cls, uploader: User) -> list[File]:
+    def _get_many(cls, columns: Iterable[str], condition: str = "", parameters: tuple = ()) -> list[File]:
+        columns = _check_columns("files", cls.COLUMNS, columns)
+
         with db_l.reader:
-            return [cls(file_id) for file_id in map(lambda q: q[0], db.execute("SELECT id FROM files WHERE uploader_id=(?)", (int(uploader.id),)).fetchall())]
+            return [cls(file_id, **dict(zip(columns, values))) for file_id, *values in db.execute(f"SELECT {', '.join(("id", *columns))} FROM files {condition}", parameters).fetchall()]
+
+    @classmethod
+    def get_all(cls, columns: Iterable[str] = ()) -> list[File]:
+        return cls._get_many(columns)
+
+    @classmethod
+    def get_uploaded_by(cls, uploader: User, columns: Iterable[str] = ()) -> list[File]:
+        return cls._get_many(columns, "WHERE uploader_id=(?)", (int(uploader.id),))
+
+    @classmethod
+    def get_uploaded_by_page(
+            cls,
+            uploader: User,
+            limit: int,
+            after: MeowID | None = None,
+            order: Literal["id", "upload_datetime"] = "id",
+            mime_type: str | None = None,
+            expires_after: datetime.datetime | None = None,
+            expires_before: datetime.datetime | None = None,
+            filename_prefix: str | None = None,
+            columns: Iterable[str] = ()
+    ) -> list[File]:
+        # XXX keyset pagination, every page is a range scan of an uploader's index starting right after the previous page
+        conditions = ["uploader_id=(?)"]
+        parameters = [int(uploader.id)]
+
+        if after is not None:
+            if order == "id":
+                conditions.append("id > (?)")
+                parameters.append(int(after))
+            else:
+                with db_l.reader:
+                    if (cursor := db.execute("SELECT upload_datetime FROM files WHERE id=(?) AND uploader_id=(?)", (int(after), int(uploader.id))).fetchone()) is None:
+                        raise IDNotFoundError("file", after)
+
+                conditions.append("(upload_datetime, id) > ((?), (?))")
+                parameters.extend((cursor[0], int(after)))
+
+        if mime_type is not None:
+            conditions.append("mime_type=(?)")
+            parameters.append(mime_type)
+
+        if expires_after is not None:
+            conditions.append("(expiration_datetime IS NULL OR expiration_datetime > (?))")
+            parameters.append(_as_utc(expires_after))
+
+        if expires_before is not None:
+            conditions.append("expiration_datetime < (?)")
+            parameters.append(_as_utc(expires_before))
+
+        if filename_prefix is not None:
+            conditions.append("substr(filename, 1, length(?))=(?)")
+            parameters.extend((filename_prefix, filename_prefix))
+
+        return cls._get_many(
+            columns,
+            f"WHERE {' AND '.join(conditions)} ORDER BY {"id" if order == "id" else "upload_datetime, id"} LIMIT (?)",
+            (*parameters, limit)
+        )
+
+    @staticmethod
+    def prefetch_uploaders(files: list[File]) -> None:
+        uploaders = User.get_many(file.uploader_id for file in files)
+
+        for file in files:
+            file._uploader = uploaders.get(file.uploader_id, _Nothing)
+
+    @classmethod
+    def get_max_file_size(cls, uploader: User) -> int | None:
+        if uploader.id == User.ADMIN_ID:
+            return None
+
+        return cls.MAX_FILE_SIZE if uploader.id != User.GUEST_ID else cls.GUEST_MAX_FILE_SIZE
 
     @classmethod
-    def create(cls, uploader: User, uploader_hidden: bool, lifetime: datetime.timedelta | None, filename: str | None, data: bytes, decrypted_data_hash: str | None, mime_type: str, max_access_count: int | None) -> File:
+    def spool(cls, uploader: User) -> BlobWriter:
+        return blob_store.writer(cls.get_max_file_size(uploader))
+
+    @classmethod
+    def create(cls, uploader: User, uploader_hidden: bool, lifetime: datetime.timedelta | None, filename: str | None, data: bytes | BlobWriter, decrypted_data_hash: str | None, mime_type: str, max_access_count: int | None) -> File:
         if uploader.id == User.GUEST_ID and uploader_hidden:
             raise ValueMismatchError("anonymous upload", False, uploader_hidden)
 
         if decrypted_data_hash is not None and len(decrypted_data_hash) != cls.ENCRYPTED_DATA_HASH_LENGTH:
             raise WrongHashLengthError("decrypted data", len(decrypted_data_hash), cls.ENCRYPTED_DATA_HASH_LENGTH)
 
-        if uploader.id != User.ADMIN_ID:
-            if len(data) > (max_file_size := (cls.MAX_FILE_SIZE if uploader.id != User.GUEST_ID else cls.GUEST_MAX_FILE_SIZE)):
-                raise WrongValueLengthError("data", "byte(s)", max_file_size, None, len(data))
-
-        file = cls(
-            MeowID.generate(),
-            uploader.id,
-            uploader_hidden,
-            (timestamp := datetime.datetime.now(datetime.UTC)),
-            lifetime and timestamp + lifetime,
-            filename,
-            data,
-            decrypted_data_hash,
-            mime_type,
-            0,
-            max_access_count,
-            0
+        with (cls.spool(uploader) if isinstance(data, bytes) else contextlib.nullcontext(data)) as writer:
+            if isinstance(data, bytes):
+                writer.write(data)
+
+            writer.finish()
+
+            if (max_file_size := cls.get_max_file_size(uploader)) is not None and writer.size > max_file_size:
+                raise WrongValueLengthError("data", "byte(s)", max_file_size, None, writer.size)
+
+            # XXX client-encrypted data is indistinguishable from random bytes, it's not worth even sampling
+            encoded_writer = cls._encode(writer, mime_type) if decrypted_data_hash is None else None
+
+            with (encoded_writer if encoded_writer is not None else contextlib.nullcontext(writer)) as stored_writer:
+                file = cls(
+                    MeowID.generate(),
+                    uploader.id,
+                    uploader_hidden,
+                    (timestamp := datetime.datetime.now(datetime.UTC)),
+                    lifetime and timestamp + lifetime,
+                    filename,
+                    stored_writer.key,
+                    decrypted_data_hash,
+                    mime_type,
+                    0,
+                    max_access_count,
+                    0,
+                    writer.size,
+                    GZIP_ENCODING if encoded_writer is not None else None,
+                    encoded_writer.size if encoded_writer is not None else None
+                )
+
+                with db_l.writer:
+                    stored_writer.commit()
+
+                    try:
+                        with db.transaction():
+                            db.execute(
+                                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (int(file._id), int(file._uploader_id), file._uploader_hidden, file._upload_datetime, file._expiration_datetime, file._filename, file._decrypted_data_hash, file._mime_type, file._data_access_count, file._max_access_count, file._meta_access_count, file._file_size, file._data_key, file._content_encoding, file._encoded_size)
+                            )
+                            cls._acquire_data(file._data_key, stored_writer.size)
+                    except BaseException:
+                        cls._discard_unreferenced_data(file._data_key)
+
+                        raise
+
+        if file._expiration_datetime is not None:
+            expiry_scheduler.schedule(file._expiration_datetime)
+
+        return file
+
+    @classmethod
+    def _encode(cls, writer: BlobWriter, mime_type: str) -> BlobWriter | None:
+        if not cls.COMPRESSION_LEVEL or choose_content_encoding(writer, mime_type) is None:
+            return None
+
+        encoded_writer = blob_store.writer()
+
+        try:
+            with writer.open() as data:
+                compress(data, encoded_writer, cls.COMPRESSION_LEVEL, cls.DATA_CHUNK_SIZE)
+        except BaseException:
+            encoded_writer.abort()
+
+            raise
+
+        # XXX the sample may have been misleading, data that doesn't shrink as a whole is stored as is
+        if encoded_writer.size >= writer.size:
+            encoded_writer.abort()
+
+            return None
+
+        return encoded_writer
+
+    @classmethod
+    async def acreate(cls, uploader: User, uploader_hidden: bool, lifetime: datetime.timedelta | None, filename: str | None, data: bytes | BlobWriter, decrypted_data_hash: str | None, mime_type: str, max_access_count: int | None) -> File:
+        return await run_in_database_executor(cls.create, uploader, uploader_hidden, lifetime, filename, data, decrypted_data_hash, mime_type, max_access_count)
+
+    @staticmethod
+    def _acquire_data(data_key: str, file_size: int) -> None:
+        # XXX blobs are keyed by their content hash, so identical uploads share one blob which is counted once per file
+        db.execute(
+            "INSERT INTO blobs VALUES (?, ?, 1) ON CONFLICT(data_key) DO UPDATE SET reference_count=reference_count + 1",
+            (data_key, file_size)
         )
 
-        with db_l.writer:
-            db.execute(
-                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (int(file._id), int(file._uploader_id), file._uploader_hidden, file._upload_datetime, file._expiration_datetime, file._filename, file._data, file._decrypted_data_hash, file._mime_type, file._data_access_count, file._max_access_count, file._meta_access_count)
-            )
-            db.commit()
+    @staticmethod
+    def _discard_unreferenced_data(data_key: str) -> None:
+        # XXX blobs are moved into the store before they're referenced, one whose reference didn't make it is removed unless some other file shares it
+        # XXX must be called while holding the writer lock, like `_release_data`
+        if db.execute("SELECT data_key FROM blobs WHERE data_key=(?)", (data_key,)).fetchone() is None:
+            blob_store.delete(data_key)
+            payload_cache.discard(data_key)
+
+    @staticmethod
+    def _release_data(data_key: str, references_count: int = 1) -> None:
+        # XXX must be called while holding the writer lock, otherwise a concurrent upload of the same data may lose its blob
+        if db.execute("UPDATE blobs SET reference_count=reference_count - (?) WHERE data_key=(?) RETURNING reference_count", (references_count, data_key)).fetchone()[0] <= 0:
+            db.execute("DELETE FROM blobs WHERE data_key=(?)", (data_key,))
+
+            # XXX in this order, see `_get_cached_data`
+            db.on_commit(functools.partial(blob_store.delete, data_key))
+            db.on_commit(functools.partial(payload_cache.discard, data_key))
+
+    @staticmethod
+    def get_storage_stats() -> dict[str, int | float]:
+        with db_l.reader:
+            blobs_count, files_count, stored_size, total_size = db.execute("SELECT count(*), total(reference_count), total(file_size), total(file_size * reference_count) FROM blobs").fetchone()
 
-        return file
+        return {
+            'files': int(files_count),
+            'blobs': blobs_count,
+            'total_size': int(total_size),
+            'stored_size': int(stored_size),
+            'deduplication_ratio': total_size / stored_size if stored_size else 1.0
+        }
 
     def delete(self) -> None:
-        with db_l.writer:
+        data_key = self.data_key
+
+        access_counters.discard(int(self.id))
+
+        with db.transaction():
             db.execute("DELETE FROM files WHERE id=(?)", (int(self.id),))
-            db.commit()
+            self._release_data(data_key)
+
+        self._discard_identity()
+
+    async def adelete(self) -> None:
+        await run_in_database_executor(self.delete)
 
     def is_expired(self) -> bool:
         return self.expiration_datetime is not None and datetime.datetime.now(datetime.UTC) > self.expiration_datetime
 
     @classmethod
-    def delete_all_expired(cls) -> None:
-        for file in cls.get_all():
-            if file.is_expired():
-                file.delete()
\ No newline at end of file
+    def get_next_expiration_datetimes(cls, count: int) -> list[datetime.datetime]:
+        with db_l.reader:
+            return [datetime.datetime.fromisoformat(expiration_datetime) for expiration_datetime, in db.execute("SELECT expiration_datetime FROM files WHERE expiration_datetime IS NOT NULL ORDER BY expiration_datetime LIMIT (?)", (count,)).fetchall()]
+
+    @classmethod
+    def delete_all_expired(cls) -> int:
+        deleted_count = 0
+        now = datetime.datetime.now(datetime.UTC)
+
+        while True:
+            with db.transaction():
+                deleted = db.execute(
+                    "DELETE FROM files WHERE id IN (SELECT id FROM files WHERE expiration_datetime < (?) LIMIT (?)) RETURNING id, data_key",
+                    (now, cls.EXPIRED_DELETION_BATCH_SIZE)
+                ).fetchall()
+
+                for data_key, references_count in collections.Counter(data_key for _, data_key in deleted).items():
+                    cls._release_data(data_key, references_count)
+
+            for file_id, _ in deleted:
+                access_counters.discard(file_id)
+                file_identity_map.discard(file_id)
+
+            deleted_count += len(deleted)
+
+            if len(deleted) < cls.EXPIRED_DELETION_BATCH_SIZE:
+                return deleted_count
\ No newline at end of file
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import datetime
+from typing import Any, Callable, Final
+
+from meowid import MeowID
+
+from ._database import _Nothing, database as db, database_lock as db_l
+from .exceptions import IDNotFoundError, ObjectIDUnknownError
+
+
+def as_meowid(value: MeowID | int) -> MeowID:
+    return MeowID.from_int(value) if isinstance(value, int) else value
+
+
+def as_datetime(value: datetime.datetime | str | None) -> datetime.datetime | None:
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class Column[T]:
+    _converter: Callable[[Any], T] | None
+    _getter: Callable[[Any], T] | None
+    _setter: Callable[[Any, T], None] | None
+
+    name: str
+    attribute: str
+
+    def __init__(
+            self,
+            converter: Callable[[Any], T] | None = None,
+            getter: Callable[[Any], T] | None = None,
+            setter: Callable[[Any, T], None] | None = None
+    ) -> None:
+        self._converter = converter
+        self._getter = getter
+        self._setter = setter
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+        self.attribute = f"_{name}"
+
+    def getter(self, getter: Callable[[Any], T]) -> Column[T]:
+        return Column(self._converter, getter, self._setter)
+
+    def setter(self, setter: Callable[[Any, T], None]) -> Column[T]:
+        return Column(self._converter, self._getter, setter)
+
+    def convert(self, value: Any) -> T | type[_Nothing]:
+        return value if value is _Nothing or self._converter is None else self._converter(value)
+
+    def __get__(self, instance: Model | None, owner: type | None = None) -> T | Column[T]:
+        if instance is None:
+            return self
+
+        if self._getter is not None:
+            return self._getter(instance)
+
+        if (value := getattr(instance, self.attribute)) is _Nothing:
+            instance._load_columns()
+
+            value = getattr(instance, self.attribute)
+
+        return value
+
+    def __set__(self, instance: Model, value: T) -> None:
+        if self._setter is None:
+            raise AttributeError(f"column {self.name} is read-only")
+
+        self._setter(instance, value)
+
+
+class _ModelMeta(type):
+    # XXX every column is stored in a slot named after it, so model objects don't carry a __dict__
+    def __new__(mcs, name: str, bases: tuple[type, ...], namespace: dict[str, Any]) -> _ModelMeta:
+        columns = {key: value for key, value in namespace.items() if isinstance(value, Column)}
+
+        namespace['__slots__'] = (*namespace.get('__slots__', ()), *(f"_{column}" for column in columns))
+        namespace['COLUMNS'] = tuple(columns)
+        namespace['_columns'] = tuple(columns.values())
+
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class Model(metaclass=_ModelMeta):
+    __slots__ = ("_id",)
+
+    NAME: str
+    TABLE: str
+    COLUMNS: Final[tuple[str, ...]]
+    _columns: tuple[Column, ...]
+
+    _id: MeowID | int | type[_Nothing]
+
+    @property
+    def id(self) -> MeowID:
+        if self._id is _Nothing:
+            raise ObjectIDUnknownError
+
+        # XXX IDs read from the database stay plain integers until needed, a MeowID takes more memory than the rest of the object
+        if isinstance(self._id, int):
+            self._id = MeowID.from_int(self._id)
+
+        return self._id
+
+    def __init__(self, id: MeowID | int | type[_Nothing] = _Nothing, **values: Any) -> None:
+        self._id = id
+
+        for column in self._columns:
+            setattr(self, column.attribute, column.convert(values.get(column.name, _Nothing)))
+
+    def _load_columns(self) -> None:
+        # XXX every missing column is loaded at once, touching a few fields of a partially loaded object costs a single query
+        columns = [column for column in self._columns if getattr(self, column.attribute) is _Nothing]
+
+        with db_l.reader:
+            raw_data = db.execute(f"SELECT {', '.join(column.name for column in columns)} FROM {self.TABLE} WHERE id=(?)", (int(self.id),)).fetchone()
+
+        if raw_data is None:
+            raise IDNotFoundError(self.NAME, self.id)
+
+        for column, value in zip(columns, raw_data):
+            setattr(self, column.attribute, column.convert(value))
+
+    def _get_column(self, name: str) -> Any:
+        if (value := getattr(self, f"_{name}")) is _Nothing:
+            self._load_columns()
+
+            value = getattr(self, f"_{name}")
+
+        return value
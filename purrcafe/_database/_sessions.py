@@ -1,56 +1,35 @@
 from __future__ import annotations
 import datetime
-from typing import Final
+import functools
+from typing import Final, Iterable
 
 from meowid import MeowID
 
 from . import User
-from ._database import _Nothing, database as db, database_lock as db_l
-from .exceptions import IDNotFoundError, ObjectIDUnknownError, OperationPermissionError
+from ._database import _Nothing, _check_columns, database as db, database_lock as db_l, auth_cache, session_identity_map, run_in_database_executor
+from ._model import Column, Model, as_datetime, as_meowid
+from .exceptions import IDNotFoundError, OperationPermissionError
 
 
-class Session:
+class Session(Model):
+    NAME: Final[str] = "session"
+    TABLE: Final[str] = "sessions"
+
     DEFAULT_LIFETIME: Final[datetime.timedelta] = datetime.timedelta(days=30)
 
-    _id: MeowID | type[_Nothing]
     _owner_id: MeowID | type[_Nothing]
     _creation_datetime: datetime.datetime | type[_Nothing]
     _expiration_datetime: datetime.datetime | None | type[_Nothing]
 
-    @property
-    def id(self) -> MeowID:
-        if self._id is _Nothing:
-            raise ObjectIDUnknownError
-
-        return self._id
-
-    @property
-    def owner_id(self) -> MeowID:
-        if self._owner_id is _Nothing:
-            with db_l.reader:
-                self._owner_id = MeowID.from_int(db.execute("SELECT owner_id FROM sessions WHERE id=(?)", (int(self.id),)).fetchone()[0])
-
-        return self._owner_id
+    owner_id = Column(as_meowid)
 
     @property
     def owner(self) -> User:
         return User.get(self.owner_id)
 
-    @property
-    def creation_datetime(self) -> datetime.datetime:
-        if self._creation_datetime is _Nothing:
-            with db_l.reader:
-                self._creation_datetime = datetime.datetime.fromisoformat(db.execute("SELECT creation_datetime FROM sessions WHERE id=(?)", (int(self.id),)).fetchone()[0])
-
-        return self._creation_datetime
-
-    @property
-    def expiration_datetime(self) -> datetime.datetime | None:
-        if self._expiration_datetime is _Nothing:
-            with db_l.reader:
-                self._expiration_datetime = datetime.datetime.fromisoformat(db.execute("SELECT expiration_datetime FROM sessions WHERE id=(?)", (int(self.id),)).fetchone()[0])
+    creation_datetime = Column(as_datetime)
 
-        return self._expiration_datetime
+    expiration_datetime = Column(as_datetime)
 
     @expiration_datetime.setter
     def expiration_datetime(self, new_expiration_datetime: datetime.datetime | None) -> None:
@@ -61,7 +40,11 @@ class Session:
             db.execute("UPDATE sessions SET expiration_datetime=(?) WHERE id=(?)", (new_expiration_datetime, int(self.id)))
             db.commit()
 
-        self._expiration_datetime = new_expiration_datetime
+        # XXX the object may be shared through the caches, so the new value only lands on it once committed
+        db.on_commit(functools.partial(setattr, self, "_expiration_datetime", new_expiration_datetime))
+
+        self._discard_identity()
+        db.on_commit(functools.partial(auth_cache.discard, int(self.id)))
 
     def __init__(
             self,
@@ -70,10 +53,11 @@ class Session:
             creation_datetime: datetime.datetime | str | type[_Nothing] = _Nothing,
             expiration_datetime: datetime.datetime | str | None | type[_Nothing] = _Nothing
     ) -> None:
-        self._id = MeowID.from_int(id) if isinstance(id, int) else id
-        self._owner_id = MeowID.from_int(owner_id) if isinstance(owner_id, int) else owner_id
-        self._creation_datetime = datetime.datetime.fromisoformat(creation_datetime) if isinstance(creation_datetime, str) else creation_datetime
-        self._expiration_datetime = datetime.datetime.fromisoformat(expiration_datetime) if isinstance(expiration_datetime, str) else expiration_datetime
+        super().__init__(id, owner_id=owner_id, creation_datetime=creation_datetime, expiration_datetime=expiration_datetime)
+
+    def _discard_identity(self) -> None:
+        session_identity_map.discard(int(self.id))
+        db.on_commit(functools.partial(session_identity_map.discard, int(self.id)))
 
     @classmethod
     def does_exist(cls, id: MeowID) -> bool:
@@ -82,13 +66,33 @@ class Session:
 
     @classmethod
     def get(cls, id_: MeowID) -> Session:
+        if (session := session_identity_map.get(int(id_))) is not None:
+            return session
+
+        version = session_identity_map.version
+
         with db_l.reader:
             raw_data = db.execute("SELECT * FROM sessions WHERE id=(?)", (int(id_),)).fetchone()
 
         if raw_data is None:
             raise IDNotFoundError("session", id_)
 
-        return cls(*raw_data)
+        session_identity_map.put(int(id_), session := cls(*raw_data), version)
+
+        return session
+
+    @classmethod
+    async def aget(cls, id_: MeowID) -> Session:
+        return await run_in_database_executor(cls.get, id_)
+
+    @classmethod
+    def get_with_owner(cls, id_: MeowID) -> tuple[Session, User]:
+        if (session_and_owner := auth_cache.get(int(id_))) is None:
+            version = auth_cache.version
+            session = cls.get(id_)
+            auth_cache.put(int(id_), session_and_owner := (session, session.owner), version)
+
+        return session_and_owner
 
     @classmethod
     def get_all(cls) -> list[Session]:
@@ -96,9 +100,24 @@ class Session:
             return [cls(*session_data) for session_data in db.execute("SELECT * FROM sessions").fetchall()]
 
     @classmethod
-    def get_owned_by(cls, owner: User) -> list[Session]:
+    def get_owned_by(cls, owner: User, columns: Iterable[str] = ()) -> list[Session]:
+        columns = _check_columns("sessions", cls.COLUMNS, columns)
+
+        with db_l.reader:
+            return [cls(session_id, **dict(zip(columns, values))) for session_id, *values in db.execute(f"SELECT {', '.join(("id", *columns))} FROM sessions WHERE owner_id=(?)", (int(owner.id),)).fetchall()]
+
+    @classmethod
+    def get_owned_by_page(cls, owner: User, limit: int, after: MeowID | None = None, columns: Iterable[str] = ()) -> list[Session]:
+        columns = _check_columns("sessions", cls.COLUMNS, columns)
+
         with db_l.reader:
-            return [cls(session_id) for session_id in map(lambda q: q[0], db.execute("SELECT id FROM sessions WHERE owner_id=(?)", (int(owner.id),)).fetchall())]
+            return [
+                cls(session_id, **dict(zip(columns, values)))
+                for session_id, *values in db.execute(
+                    f"SELECT {', '.join(("id", *columns))} FROM sessions WHERE owner_id=(?) AND id > (?) ORDER BY id LIMIT (?)",
+                    (int(owner.id), int(after) if after is not None else -1, limit)
+                ).fetchall()
+            ]
 
     @classmethod
     def create(cls, owner: User, lifetime: datetime.timedelta | None = DEFAULT_LIFETIME) -> Session:
@@ -125,3 +144,6 @@ class Session:
         with db_l.writer:
             db.execute("DELETE FROM sessions WHERE id=(?)", (int(self.id),))
             db.commit()
+
+        self._discard_identity()
+        db.on_commit(functools.partial(auth_cache.discard, int(self.id)))
@@ -0,0 +1,295 @@
+from __future__ import annotations
+import datetime
+import fcntl
+import functools
+import os
+from pathlib import Path
+from typing import BinaryIO, Final
+
+from meowid import MeowID
+
+from . import User, File
+from ._database import _Nothing, database as db, database_lock as db_l, blob_store, upload_hashes, run_in_database_executor
+from ._model import Column, Model, as_datetime, as_meowid
+from ._utils import BlobWriter
+from .exceptions import IDNotFoundError, OperationPermissionError, ValueMismatchError, WrongValueLengthError
+
+
+def _unlink(path: Path) -> None:
+    path.unlink(missing_ok=True)
+
+
+class Upload(Model):
+    __slots__ = ("_lock_file",)
+
+    NAME: Final[str] = "upload"
+    TABLE: Final[str] = "uploads"
+
+    LIFETIME: Final[datetime.timedelta] = datetime.timedelta(hours=int(os.environ.get('PURRCAFE_UPLOAD_LIFETIME', 24)))
+
+    _owner_id: MeowID | type[_Nothing]
+    _creation_datetime: datetime.datetime | type[_Nothing]
+    _update_datetime: datetime.datetime | type[_Nothing]
+    _upload_length: int | None | type[_Nothing]
+    _upload_offset: int | type[_Nothing]
+    _lock_file: BinaryIO | type[_Nothing]
+
+    owner_id = Column(as_meowid)
+
+    @property
+    def owner(self) -> User:
+        return User.get(self.owner_id)
+
+    creation_datetime = Column(as_datetime)
+
+    update_datetime = Column(as_datetime)
+
+    upload_length = Column()
+
+    upload_offset = Column()
+
+    @property
+    def path(self) -> Path:
+        return blob_store.uploads_path.joinpath(str(int(self.id)))
+
+    @property
+    def max_size(self) -> int | None:
+        max_sizes = [max_size for max_size in (File.get_max_file_size(self.owner), self.upload_length) if max_size is not None]
+
+        return min(max_sizes) if max_sizes else None
+
+    def __init__(
+            self,
+            id: MeowID | int | type[_Nothing] = _Nothing,
+            owner_id: MeowID | int | type[_Nothing] = _Nothing,
+            creation_datetime: datetime.datetime | str | type[_Nothing] = _Nothing,
+            update_datetime: datetime.datetime | str | type[_Nothing] = _Nothing,
+            upload_length: int | None | type[_Nothing] = _Nothing,
+            upload_offset: int | type[_Nothing] = _Nothing
+    ) -> None:
+        super().__init__(id, owner_id=owner_id, creation_datetime=creation_datetime, update_datetime=update_datetime, upload_length=upload_length, upload_offset=upload_offset)
+
+        self._lock_file = _Nothing
+
+    @classmethod
+    def get(cls, id_: MeowID) -> Upload:
+        with db_l.reader:
+            raw_data = db.execute(f"SELECT {', '.join(cls.COLUMNS)} FROM uploads WHERE id=(?)", (int(id_),)).fetchone()
+
+        if raw_data is None:
+            raise IDNotFoundError("upload", id_)
+
+        return cls(id_, **dict(zip(cls.COLUMNS, raw_data)))
+
+    @classmethod
+    def create(cls, owner: User, upload_length: int | None) -> Upload:
+        # XXX every guest shares the same user, so nothing would keep them from writing to each other's uploads
+        if owner.id == User.GUEST_ID:
+            raise OperationPermissionError("resumable upload by guest user")
+
+        if upload_length is not None and (max_file_size := File.get_max_file_size(owner)) is not None and upload_length > max_file_size:
+            raise WrongValueLengthError("data", "byte(s)", max_file_size, None, upload_length)
+
+        upload = cls(
+            MeowID.generate(),
+            owner.id,
+            (timestamp := datetime.datetime.now(datetime.UTC)),
+            timestamp,
+            upload_length,
+            0
+        )
+
+        upload.path.touch(exist_ok=False)
+
+        try:
+            with db_l.writer:
+                db.execute(
+                    "INSERT INTO uploads VALUES (?, ?, ?, ?, ?, ?)",
+                    (int(upload._id), int(upload._owner_id), upload._creation_datetime, upload._update_datetime, upload._upload_length, upload._upload_offset)
+                )
+                db.commit()
+        except BaseException:
+            _unlink(upload.path)
+
+            raise
+
+        return upload
+
+    def _lock(self) -> None:
+        # XXX the spooled data is locked for as long as it's written to or finalized, so a retried request can't interleave with the original one
+        try:
+            lock_file = self.path.open('rb')
+        except FileNotFoundError:
+            raise IDNotFoundError("upload", self.id) from None
+
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+
+            raise OperationPermissionError("concurrent writing to an upload") from None
+
+        self._lock_file = lock_file
+
+        # XXX the upload may have been written to, finalized or deleted before the lock was acquired
+        with db_l.reader:
+            raw_data = db.execute("SELECT upload_length, upload_offset FROM uploads WHERE id=(?)", (int(self.id),)).fetchone()
+
+        if raw_data is None:
+            self._unlock()
+
+            raise IDNotFoundError("upload", self.id)
+
+        self._upload_length, self._upload_offset = raw_data
+
+    def _unlock(self) -> None:
+        if self._lock_file is not _Nothing:
+            self._lock_file.close()
+            self._lock_file = _Nothing
+
+    def _resume_writer(self, max_size: int | None) -> BlobWriter:
+        hash_ = upload_hashes.get(int(self.id))
+
+        return blob_store.resume_writer(self.path, self._upload_offset, hash_[1].copy() if hash_ is not None and hash_[0] == self._upload_offset else None, max_size)
+
+    def open_writer(self, offset: int) -> BlobWriter:
+        self._lock()
+
+        try:
+            if offset != self._upload_offset:
+                raise ValueMismatchError("upload offset", self._upload_offset, offset)
+
+            return self._resume_writer(self.max_size)
+        except BaseException:
+            self._unlock()
+
+            raise
+
+    def close_writer(self, writer: BlobWriter) -> int:
+        # XXX everything that was written is kept, even if the request got interrupted, so the client can resume right after it
+        try:
+            writer.finish()
+
+            with db_l.writer:
+                db.execute("UPDATE uploads SET upload_offset=(?), update_datetime=(?) WHERE id=(?)", (writer.size, datetime.datetime.now(datetime.UTC), int(self.id)))
+                db.commit()
+
+            upload_hashes.put(int(self.id), (writer.size, writer.hash))
+
+            self._upload_offset = writer.size
+
+            return writer.size
+        finally:
+            self._unlock()
+
+    async def aopen_writer(self, offset: int) -> BlobWriter:
+        return await run_in_database_executor(self.open_writer, offset)
+
+    async def aclose_writer(self, writer: BlobWriter) -> int:
+        return await run_in_database_executor(self.close_writer, writer)
+
+    def finalize(self, uploader_hidden: bool, lifetime: datetime.timedelta | None, filename: str | None, decrypted_data_hash: str | None, mime_type: str, max_access_count: int | None) -> File:
+        self._lock()
+
+        try:
+            if self._upload_length is not None and self._upload_offset != self._upload_length:
+                raise ValueMismatchError("upload offset", self._upload_length, self._upload_offset)
+
+            writer = self._resume_writer(None)
+
+            try:
+                # XXX the spooled data is moved into the blob store as is, so finalizing doesn't copy the payload
+                file = File.create(self.owner, uploader_hidden, lifetime, filename, writer, decrypted_data_hash, mime_type, max_access_count)
+            except BaseException:
+                writer.finish()
+
+                raise
+
+            # XXX removes the spooled data unless it was moved into the blob store
+            writer.abort()
+
+            with db_l.writer:
+                db.execute("DELETE FROM uploads WHERE id=(?)", (int(self.id),))
+                db.commit()
+
+            upload_hashes.discard(int(self.id))
+
+            return file
+        finally:
+            self._unlock()
+
+    async def afinalize(self, uploader_hidden: bool, lifetime: datetime.timedelta | None, filename: str | None, decrypted_data_hash: str | None, mime_type: str, max_access_count: int | None) -> File:
+        return await run_in_database_executor(self.finalize, uploader_hidden, lifetime, filename, decrypted_data_hash, mime_type, max_access_count)
+
+    def delete(self) -> None:
+        self._lock()
+
+        try:
+            with db_l.writer:
+                db.execute("DELETE FROM uploads WHERE id=(?)", (int(self.id),))
+                db.commit()
+
+            _unlink(self.path)
+            upload_hashes.discard(int(self.id))
+        finally:
+            self._unlock()
+
+    @classmethod
+    def delete_owned_by(cls, owner: User) -> None:
+        with db.transaction():
+            for upload_id, in db.execute("DELETE FROM uploads WHERE owner_id=(?) RETURNING id", (int(owner.id),)).fetchall():
+                db.on_commit(functools.partial(_unlink, cls(upload_id).path))
+                db.on_commit(functools.partial(upload_hashes.discard, upload_id))
+
+    @classmethod
+    def delete_all_abandoned(cls) -> int:
+        threshold = datetime.datetime.now(datetime.UTC) - cls.LIFETIME
+
+        with db_l.reader:
+            abandoned = [cls(upload_id) for upload_id, in db.execute("SELECT id FROM uploads WHERE update_datetime < (?)", (threshold,)).fetchall()]
+
+        deleted_count = 0
+
+        for upload in abandoned:
+            # XXX uploads being written to or finalized right now are skipped, the next run gets to them if they stay abandoned
+            try:
+                upload._lock()
+            except OperationPermissionError:
+                continue
+            except IDNotFoundError:
+                pass
+
+            try:
+                with db_l.writer:
+                    is_deleted = bool(db.execute("DELETE FROM uploads WHERE id=(?) AND update_datetime < (?) RETURNING id", (int(upload.id), threshold)).fetchall())
+                    db.commit()
+
+                if is_deleted:
+                    _unlink(upload.path)
+                    upload_hashes.discard(int(upload.id))
+
+                    deleted_count += 1
+            finally:
+                upload._unlock()
+
+        # XXX spooled data left behind by an upload that failed to be created
+        for path in blob_store.uploads_path.iterdir():
+            try:
+                if datetime.datetime.fromtimestamp(path.stat().st_mtime, datetime.UTC) >= threshold or not path.name.isdigit():
+                    continue
+
+                lock_file = path.open('rb')
+            except FileNotFoundError:
+                continue
+
+            with lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                with db_l.reader:
+                    if db.execute("SELECT id FROM uploads WHERE id=(?)", (int(path.name),)).fetchone() is None:
+                        _unlink(path)
+
+        return deleted_count
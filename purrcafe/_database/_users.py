@@ -1,46 +1,39 @@
 from __future__ import annotations
 import datetime
+import functools
 import os
-from typing import Final
+import sqlite3
+from typing import Final, Iterable
 import typing
 
 from meowid import MeowID
 
-from .._utils import verify_password
-from ._database import database as db, database_lock as db_l, _Nothing
-from .exceptions import WrongHashLengthError, IDNotFoundError, ObjectIDUnknownError, WrongValueLengthError, ValueMismatchError, ObjectNotFound, OperationPermissionError, ValueAlreadyTakenError
+from .._utils import verify_password, averify_password
+from ._database import database as db, database_lock as db_l, _Nothing, auth_cache, user_identity_map, run_in_database_executor
+from ._model import Column, Model, as_datetime
+from .exceptions import WrongHashLengthError, IDNotFoundError, WrongValueLengthError, ValueMismatchError, ObjectNotFound, OperationPermissionError, ValueAlreadyTakenError
 if typing.TYPE_CHECKING:
     from ._sessions import Session
     from ._files import File
 
 
-class User:
+class User(Model):
+    NAME: Final[str] = "user"
+    TABLE: Final[str] = "users"
+
     GUEST_ID: Final[MeowID] = MeowID.from_int(0)
     ADMIN_ID: Final[MeowID] = MeowID.from_int(1)
 
     NAME_MAX_LENGTH: Final[int] = 32
     PASSWORD_HASH_LENGTH: Final[int] = 60
+    GET_MANY_BATCH_SIZE: Final[int] = 500
 
-    _id: MeowID | type[_Nothing]
     _name: str | type[_Nothing]
     _email: str | None | type[_Nothing]
     _password_hash: str | None | type[_Nothing]
     _creation_datetime: datetime.datetime | type[_Nothing]
 
-    @property
-    def id(self) -> MeowID:
-        if self._id is _Nothing:
-            raise ObjectIDUnknownError
-
-        return self._id
-
-    @property
-    def name(self) -> str:
-        if self._name is _Nothing:
-            with db_l.reader:
-                self._name = db.execute("SELECT name FROM users WHERE id=(?)", (int(self.id),)).fetchone()[0]
-
-        return self._name
+    name = Column()
 
     @name.setter
     def name(self, new_name: str) -> None:
@@ -50,38 +43,18 @@ class User:
         if len(new_name) > self.NAME_MAX_LENGTH:
             raise WrongValueLengthError("name", "characters", self.NAME_MAX_LENGTH, None, len(new_name))
 
-        with db_l.writer:
-            db.execute("UPDATE users SET name=(?) WHERE id=(?)", (new_name, int(self.id)))
-            db.commit()
+        self._update_column("name", new_name)
 
-        self._name = new_name
-
-    @property
-    def email(self) -> str | None:
-        if self._email is _Nothing:
-            with db_l.reader:
-                self._email = db.execute("SELECT email FROM users WHERE id=(?)", (int(self.id),)).fetchone()[0]
-
-        return self._email
+    email = Column()
 
     @email.setter
     def email(self, new_email: str | None) -> None:
         if int(self.id) == 0:
             raise OperationPermissionError("changing guest user properties")
 
-        with db_l.writer:
-            db.execute("UPDATE users SET email=(?) WHERE id=(?)", (new_email, int(self.id)))
-            db.commit()
-
-        self._email = new_email
+        self._update_column("email", new_email)
 
-    @property
-    def password_hash(self) -> str | None:
-        if self._password_hash is _Nothing:
-            with db_l.reader:
-                self._password_hash = db.execute("SELECT password_hash FROM users WHERE id=(?)", (int(self.id),)).fetchone()[0]
-
-        return self._password_hash
+    password_hash = Column()
 
     @password_hash.setter
     def password_hash(self, new_password_hash: str | None) -> None:
@@ -91,19 +64,9 @@ class User:
         if len(new_password_hash) != self.PASSWORD_HASH_LENGTH:
             raise WrongHashLengthError("password", self.PASSWORD_HASH_LENGTH, len(new_password_hash))
 
-        with db_l.writer:
-            db.execute("UPDATE users SET password_hash=(?) WHERE id=(?)", (new_password_hash, int(self.id)))
-            db.commit()
+        self._update_column("password_hash", new_password_hash)
 
-        self._password_hash = new_password_hash
-
-    @property
-    def creation_datetime(self):
-        if self._creation_datetime is _Nothing:
-            with db_l.reader:
-                self._creation_datetime = datetime.datetime.fromisoformat(db.execute("SELECT creation_datetime FROM users WHERE id=(?)", (int(self.id),)).fetchone()[0])
-
-        return self._creation_datetime
+    creation_datetime = Column(as_datetime)
 
     @property
     def sessions(self) -> list[Session]:
@@ -123,13 +86,9 @@ class User:
             name: str | type[_Nothing] = _Nothing,
             email: str | None | type[_Nothing] = _Nothing,
             password_hash: str | None | type[_Nothing] = _Nothing,
-            creation_datetime: datetime.datetime | type[_Nothing] = _Nothing
+            creation_datetime: datetime.datetime | str | type[_Nothing] = _Nothing
     ) -> None:
-        self._id = MeowID.from_int(id) if isinstance(id, int) else id
-        self._name = name
-        self._email = email
-        self._password_hash = password_hash
-        self._creation_datetime = datetime.datetime.fromisoformat(creation_datetime) if isinstance(creation_datetime, str) else creation_datetime
+        super().__init__(id, name=name, email=email, password_hash=password_hash, creation_datetime=creation_datetime)
 
     @classmethod
     def does_exist(cls, id: MeowID) -> bool:
@@ -177,30 +136,104 @@ class User:
 
         return user
 
+    @classmethod
+    async def acreate(cls, name: str, email: str | None, password_hash: str | None) -> User:
+        return await run_in_database_executor(cls.create, name, email, password_hash)
+
+    def _is_admin_password(self, password: str) -> bool:
+        return self.id == self.ADMIN_ID and (admin_password := os.environ.get('PURRCAFE_ADMIN_PASSWORD')) is not None and password == admin_password
+
     def authorize(self, password: str, lifetime: datetime.timedelta = datetime.timedelta(days=7)) -> Session:  # i LOVE circular dependency error
         from ._sessions import Session
 
-        if (
+        if not (
             (self.password_hash is not None and verify_password(password, self.password_hash)) or
-            (self.id == self.ADMIN_ID and (admin_password := os.environ.get('PURRCAFE_ADMIN_PASSWORD')) is not None and password == admin_password)
+            self._is_admin_password(password)
         ):
             raise ValueMismatchError("password", None, None)
 
         return Session.create(self, lifetime)
 
+    async def aauthorize(self, password: str, lifetime: datetime.timedelta = datetime.timedelta(days=7)) -> Session:
+        from ._sessions import Session
+
+        # XXX the password is verified by the hashing pool, only the session is created by the database executor
+        if not (
+            (self.password_hash is not None and await averify_password(password, self.password_hash)) or
+            self._is_admin_password(password)
+        ):
+            raise ValueMismatchError("password", None, None)
+
+        return await run_in_database_executor(Session.create, self, lifetime)
+
+    def _update_column(self, column: str, value: str | None) -> None:
+        try:
+            with db_l.writer:
+                db.execute(f"UPDATE users SET {column}=(?) WHERE id=(?)", (value, int(self.id)))
+                db.commit()
+        except sqlite3.IntegrityError:
+            raise ValueAlreadyTakenError(column, value) from None
+
+        # XXX the object may be shared through the caches, so the new value only lands on it once committed, a rolled back one never shows up
+        db.on_commit(functools.partial(setattr, self, f"_{column}", value))
+
+        self._discard_identity()
+        db.on_commit(self._discard_authorizations)
+
+    def _discard_identity(self) -> None:
+        user_identity_map.discard(int(self.id))
+        db.on_commit(functools.partial(user_identity_map.discard, int(self.id)))
+
+    def _discard_authorizations(self) -> None:
+        auth_cache.discard_where(lambda _, session_and_owner: session_and_owner[1].id == self.id)
+
     @property
     def is_critical(self) -> bool:
         return self.id in (self.ADMIN_ID, self.GUEST_ID)
 
     @classmethod
     def get(cls, id_: MeowID) -> User:
+        if (user := user_identity_map.get(int(id_))) is not None:
+            return user
+
+        version = user_identity_map.version
+
         with db_l.reader:
             raw_data = db.execute("SELECT * FROM users WHERE id=(?)", (int(id_),)).fetchone()
 
         if raw_data is None:
             raise IDNotFoundError("user", id_)
 
-        return cls(*raw_data)
+        user_identity_map.put(int(id_), user := cls(*raw_data), version)
+
+        return user
+
+    @classmethod
+    def get_many(cls, ids: Iterable[MeowID]) -> dict[MeowID, User]:
+        users = {}
+        missing_ids = []
+
+        for id_ in set(ids):
+            if (user := user_identity_map.get(int(id_))) is not None:
+                users[id_] = user
+            else:
+                missing_ids.append(int(id_))
+
+        version = user_identity_map.version
+
+        with db_l.reader:
+            for offset in range(0, len(missing_ids), cls.GET_MANY_BATCH_SIZE):
+                batch = missing_ids[offset:offset + cls.GET_MANY_BATCH_SIZE]
+
+                for raw_data in db.execute(f"SELECT * FROM users WHERE id IN ({', '.join('?' * len(batch))})", batch).fetchall():
+                    user_identity_map.put(raw_data[0], user := cls(*raw_data), version)
+                    users[user.id] = user
+
+        return users
+
+    @classmethod
+    async def aget(cls, id_: MeowID) -> User:
+        return await run_in_database_executor(cls.get, id_)
 
     @classmethod
     def get_all(cls) -> list[User]:
@@ -217,16 +250,28 @@ class User:
 
         return cls(*raw_data)
 
+    @classmethod
+    async def afind(cls, name: str) -> User:
+        return await run_in_database_executor(cls.find, name)
+
     def delete(self) -> None:
+        from ._files import File
+        from ._uploads import Upload
+
         if self.is_critical:
             raise OperationPermissionError("deletion of a critical user")
 
-        for session in self.sessions:
-            session.delete()
+        with db.transaction():
+            for session in self.sessions:
+                session.delete()
 
-        for file in self.uploaded_files:
-            file.delete()
+            Upload.delete_owned_by(self)
+
+            for file in File.get_uploaded_by(self, ("data_key",)):
+                file.delete()
 
-        with db_l.writer:
             db.execute("DELETE FROM users WHERE id=(?)", (int(self.id),))
             db.commit()
+
+        self._discard_identity()
+        db.on_commit(self._discard_authorizations)
@@ -1 +1,6 @@
 from ._migrations import complete_migrations
+from ._blob_store import BlobStore, BlobWriter
+from ._compression import GZIP_ENCODING, choose_content_encoding, compress, decompress, iter_decompressed, iter_decompressed_ranges
+from ._connection_pool import ConnectionPool, ConnectionProxy
+from ._counter_accumulator import CounterAccumulator
+from ._deadline_scheduler import DeadlineScheduler
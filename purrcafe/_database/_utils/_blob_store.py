@@ -0,0 +1,171 @@
+from __future__ import annotations
+from os import PathLike
+from pathlib import Path
+from typing import BinaryIO, Final
+import hashlib
+import os
+import tempfile
+
+from ..exceptions import WrongValueLengthError
+
+
+class BlobWriter:
+    _store: BlobStore
+    _file: BinaryIO
+    _hash: hashlib._Hash
+    _size: int
+    _max_size: int | None
+    _key: str | None
+    _committed: bool
+
+    def __init__(self, store: BlobStore, max_size: int | None = None, file: BinaryIO | None = None, size: int = 0, hash: hashlib._Hash | None = None) -> None:
+        self._store = store
+        self._max_size = max_size
+        self._file = file if file is not None else tempfile.NamedTemporaryFile(dir=store.temp_path, prefix="blob-", delete=False)
+        self._hash = hash if hash is not None else hashlib.new(store.HASH_NAME)
+        self._size = size
+        self._key = None
+        self._committed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def hash(self) -> hashlib._Hash:
+        return self._hash.copy()
+
+    @property
+    def key(self) -> str:
+        if self._key is None:
+            self._key = self._hash.hexdigest()
+
+        return self._key
+
+    def write(self, chunk: bytes) -> None:
+        if self._file.closed:
+            raise RuntimeError("writing to an already finished blob")
+
+        if self._max_size is not None and self._size + len(chunk) > self._max_size:
+            raise WrongValueLengthError("data", "byte(s)", self._max_size, None, self._size + len(chunk))
+
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self._size += len(chunk)
+
+    def finish(self) -> str:
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+        return self.key
+
+    def open(self) -> BinaryIO:
+        if not self._file.closed:
+            raise RuntimeError("reading from an unfinished blob")
+
+        return open(self._file.name, 'rb')
+
+    def commit(self) -> str:
+        key = self.finish()
+
+        if (path := self._store.path_of(key)).exists():
+            os.unlink(self._file.name)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._file.name, path)
+
+        self._committed = True
+
+        return key
+
+    def abort(self) -> None:
+        self._file.close()
+
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> BlobWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if not self._committed:
+            self.abort()
+
+
+class BlobStore:
+    HASH_NAME: Final[str] = "sha256"
+    SHARD_DEPTH: Final[int] = 2
+    SHARD_WIDTH: Final[int] = 2
+    RESUME_CHUNK_SIZE: Final[int] = 1048576  # 1 MiB
+
+    _path: Path
+
+    def __init__(self, path: PathLike | str) -> None:
+        self._path = Path(path)
+
+        self.temp_path.mkdir(parents=True, exist_ok=True)
+        self.uploads_path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def temp_path(self) -> Path:
+        return self._path.joinpath("tmp")
+
+    @property
+    def uploads_path(self) -> Path:
+        return self._path.joinpath("uploads")
+
+    def path_of(self, key: str) -> Path:
+        return self._path.joinpath(*(key[i * self.SHARD_WIDTH:(i + 1) * self.SHARD_WIDTH] for i in range(self.SHARD_DEPTH)), key)
+
+    def writer(self, max_size: int | None = None) -> BlobWriter:
+        return BlobWriter(self, max_size)
+
+    def resume_writer(self, path: Path, size: int, hash: hashlib._Hash | None = None, max_size: int | None = None) -> BlobWriter:
+        # XXX anything written past `size` by an interrupted writer is cut off, an unknown hash state is recomputed from the data
+        file = path.open('r+b')
+
+        try:
+            file.truncate(size)
+
+            if hash is None:
+                hash = hashlib.new(self.HASH_NAME)
+
+                while chunk := file.read(self.RESUME_CHUNK_SIZE):
+                    hash.update(chunk)
+
+            file.seek(size)
+        except BaseException:
+            file.close()
+
+            raise
+
+        return BlobWriter(self, max_size, file, size, hash)
+
+    def put(self, data: bytes) -> str:
+        with self.writer() as writer:
+            writer.write(data)
+
+            return writer.commit()
+
+    def exists(self, key: str) -> bool:
+        return self.path_of(key).exists()
+
+    def open(self, key: str) -> BinaryIO:
+        return self.path_of(key).open('rb')
+
+    def read(self, key: str) -> bytes:
+        return self.path_of(key).read_bytes()
+
+    def delete(self, key: str) -> None:
+        try:
+            self.path_of(key).unlink()
+        except FileNotFoundError:
+            pass
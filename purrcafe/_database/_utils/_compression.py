@@ -0,0 +1,131 @@
+from typing import BinaryIO, Final, Iterable, Iterator
+import zlib
+
+from ._blob_store import BlobWriter
+from ..exceptions import DatabaseInternalError
+
+GZIP_ENCODING: Final[str] = "gzip"
+
+_GZIP_WBITS: Final[int] = 31
+_SAMPLE_SIZE: Final[int] = 65536  # 64 KiB
+_SAMPLE_COMPRESSION_LEVEL: Final[int] = 1
+_MIN_SIZE: Final[int] = 1024  # 1 KiB
+_MAX_RATIO: Final[float] = 0.9
+
+_INCOMPRESSIBLE_MIME_TYPE_PREFIXES: Final[tuple[str, ...]] = ("image/", "video/", "audio/", "font/woff")
+_COMPRESSIBLE_MIME_TYPES: Final[frozenset[str]] = frozenset((
+    "image/svg+xml",
+    "image/bmp",
+    "image/x-icon",
+    "audio/wav",
+    "audio/x-wav"
+))
+_INCOMPRESSIBLE_MIME_TYPES: Final[frozenset[str]] = frozenset((
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/zstd",
+    "application/x-zstd",
+    "application/x-brotli",
+    "application/x-lzip",
+    "application/pdf",
+    "application/java-archive",
+    "application/epub+zip",
+    "application/vnd.android.package-archive"
+))
+
+
+def _is_compressible_mime_type(mime_type: str) -> bool:
+    mime_type = mime_type.partition(';')[0].strip().lower()
+
+    if mime_type in _COMPRESSIBLE_MIME_TYPES:
+        return True
+
+    # XXX office documents are zip archives in disguise
+    return not (
+        mime_type in _INCOMPRESSIBLE_MIME_TYPES or
+        mime_type.startswith(_INCOMPRESSIBLE_MIME_TYPE_PREFIXES) or
+        mime_type.startswith(("application/vnd.openxmlformats-", "application/vnd.oasis.opendocument."))
+    )
+
+
+def choose_content_encoding(writer: BlobWriter, mime_type: str) -> str | None:
+    # XXX the mime type rules out the obvious cases, the rest is decided by how well the beginning of the data compresses
+    if writer.size < _MIN_SIZE or not _is_compressible_mime_type(mime_type):
+        return None
+
+    with writer.open() as data:
+        sample = data.read(_SAMPLE_SIZE)
+
+    if len(zlib.compress(sample, _SAMPLE_COMPRESSION_LEVEL)) > len(sample) * _MAX_RATIO:
+        return None
+
+    return GZIP_ENCODING
+
+
+def compress(source: BinaryIO, writer: BlobWriter, level: int, chunk_size: int) -> None:
+    # XXX the gzip header has no timestamp, so identical data always compresses into an identical blob and still gets deduplicated
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+
+    while chunk := source.read(chunk_size):
+        writer.write(compressor.compress(chunk))
+
+    writer.write(compressor.flush())
+    writer.finish()
+
+
+def decompress(data: bytes) -> bytes:
+    return zlib.decompress(data, _GZIP_WBITS)
+
+
+def iter_decompressed_ranges(chunks: Iterable[bytes], ranges: list[tuple[int, int]], chunk_size: int) -> Iterator[tuple[int, bytes]]:
+    # XXX compressed data can't be seeked, ascending disjoint ranges are all sliced out of a single pass and yielded along with their indexes
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    offset = 0
+    index = 0
+
+    def split(decompressed: bytes) -> Iterator[tuple[int, bytes]]:
+        nonlocal index
+
+        end = offset + len(decompressed)
+
+        while index < len(ranges) and ranges[index][0] < end:
+            start, stop = ranges[index]
+
+            if part := decompressed[max(start - offset, 0):stop - offset]:
+                yield index, part
+
+            if stop > end:
+                break
+
+            index += 1
+
+    for chunk in chunks:
+        while chunk and index < len(ranges):
+            decompressed = decompressor.decompress(chunk, chunk_size)
+            chunk = decompressor.unconsumed_tail
+
+            yield from split(decompressed)
+
+            offset += len(decompressed)
+
+        if index == len(ranges):
+            return
+
+    yield from split(decompressed := decompressor.flush())
+
+    offset += len(decompressed)
+
+    # XXX a blob cut short would otherwise just end the response early
+    if not decompressor.eof or index < len(ranges):
+        raise DatabaseInternalError(f"compressed data ended unexpectedly after {offset} byte(s)")
+
+
+def iter_decompressed(chunks: Iterable[bytes], start: int, stop: int, chunk_size: int) -> Iterator[bytes]:
+    return (data for _, data in iter_decompressed_ranges(chunks, [(start, stop)], chunk_size))
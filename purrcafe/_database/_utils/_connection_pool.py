@@ -0,0 +1,385 @@
+from __future__ import annotations
+from os import PathLike
+from typing import Any, Callable, Final, Iterable
+import queue
+import sqlite3
+import threading
+import time
+
+from ..._utils import Histogram, RWLock
+from ..exceptions import DatabaseInternalError
+
+
+class PoolStats:
+    checkouts: int
+    waits: int
+    wait_time: float
+    max_wait_time: float
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record(self, wait_time: float | None) -> None:
+        self.checkouts += 1
+
+        if wait_time is not None:
+            self.waits += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'max_wait_time': self.max_wait_time
+        }
+
+
+class _Checkout:
+    _check_out_callback: Callable[[], None]
+    _check_in_callback: Callable[[], None]
+
+    def __init__(self, check_out_callback: Callable[[], None], check_in_callback: Callable[[], None]) -> None:
+        self._check_out_callback = check_out_callback
+        self._check_in_callback = check_in_callback
+
+    def __enter__(self) -> None:
+        self._check_out_callback()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._check_in_callback()
+
+
+class _Transaction:
+    _begin_callback: Callable[[], None]
+    _end_callback: Callable[[bool], None]
+
+    def __init__(self, begin_callback: Callable[[], None], end_callback: Callable[[bool], None]) -> None:
+        self._begin_callback = begin_callback
+        self._end_callback = end_callback
+
+    def __enter__(self) -> None:
+        self._begin_callback()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._end_callback(exc_type is None)
+
+
+class ConnectionPool:
+    BUSY_TIMEOUT: Final[float] = 30.0
+
+    _path: str
+    _readers_count: int
+    _local: threading.local
+
+    _maintenance_lock: RWLock
+
+    _writer_connection: sqlite3.Connection
+    _writer_lock: threading.Lock
+    _writer_owner: int | None
+
+    _idle_readers: queue.LifoQueue[sqlite3.Connection]
+    _readers_created: int
+    _readers_creation_lock: threading.Lock
+
+    reader_stats: PoolStats
+    writer_stats: PoolStats
+
+    reader: _Checkout
+    writer: _Checkout
+    exclusive: _Checkout
+    transaction: _Transaction
+
+    def __init__(self, path: PathLike | str, readers_count: int) -> None:
+        if readers_count < 1:
+            raise ValueError("connection pool needs at least one reader")
+
+        self._path = str(path)
+        self._readers_count = readers_count
+        self._local = threading.local()
+
+        self._maintenance_lock = RWLock()
+
+        self._writer_connection = self._connect()
+        self._writer_connection.execute("PRAGMA journal_mode=WAL")
+        self._writer_lock = threading.Lock()
+        self._writer_owner = None
+
+        self._idle_readers = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_creation_lock = threading.Lock()
+
+        self.reader_stats = PoolStats()
+        self.writer_stats = PoolStats()
+
+        self.reader = _Checkout(self._check_out_reader, self._check_in)
+        self.writer = _Checkout(self._check_out_writer, self._check_in)
+        self.exclusive = _Checkout(self._check_out_exclusive, self._check_in)
+        self.transaction = _Transaction(self._begin_transaction, self._end_transaction)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def readers_count(self) -> int:
+        return self._readers_count
+
+    @property
+    def idle_readers_count(self) -> int:
+        return self._idle_readers.qsize() + (self._readers_count - self._readers_created)
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        if read_only:
+            connection.execute("PRAGMA query_only=1")
+
+        return connection
+
+    def _stack(self) -> list[tuple[sqlite3.Connection, bool]]:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+
+            return self._local.stack
+
+    @property
+    def current(self) -> sqlite3.Connection:
+        if not (stack := self._stack()):
+            raise DatabaseInternalError("no database connection is checked out by this thread")
+
+        return stack[-1][0]
+
+    def _take_reader(self) -> sqlite3.Connection:
+        try:
+            connection = self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self.reader_stats.record(None)
+
+            return connection
+
+        with self._readers_creation_lock:
+            if self._readers_created < self._readers_count:
+                self._readers_created += 1
+                is_creating = True
+            else:
+                is_creating = False
+
+        if is_creating:
+            self.reader_stats.record(None)
+
+            return self._connect(read_only=True)
+
+        wait_start = time.perf_counter()
+        connection = self._idle_readers.get()
+        self.reader_stats.record(time.perf_counter() - wait_start)
+
+        return connection
+
+    def _check_out_reader(self) -> None:
+        if stack := self._stack():
+            stack.append((stack[-1][0], False))
+
+            return
+
+        self._maintenance_lock.acquire_reader()
+
+        try:
+            connection = self._take_reader()
+        except BaseException:
+            self._maintenance_lock.release_reader()
+
+            raise
+
+        stack.append((connection, True))
+
+    def _take_writer(self) -> None:
+        if not self._writer_lock.acquire(blocking=False):
+            wait_start = time.perf_counter()
+            self._writer_lock.acquire()
+            self.writer_stats.record(time.perf_counter() - wait_start)
+        else:
+            self.writer_stats.record(None)
+
+        self._writer_owner = threading.get_ident()
+
+    def _check_out_writer(self) -> None:
+        stack = self._stack()
+
+        if self._writer_owner == threading.get_ident():
+            stack.append((self._writer_connection, False))
+
+            return
+
+        if not stack:
+            self._maintenance_lock.acquire_reader()
+
+        self._take_writer()
+        stack.append((self._writer_connection, True))
+
+    def _check_out_exclusive(self) -> None:
+        if stack := self._stack():
+            raise DatabaseInternalError("exclusive database access can't be nested")
+
+        self._maintenance_lock.acquire_writer()
+        self._take_writer()
+
+        stack.append((self._writer_connection, True))
+        self._local.is_exclusive = True
+
+    def _check_in(self) -> None:
+        stack = self._stack()
+        connection, is_owned = stack.pop()
+
+        if is_owned:
+            if connection is self._writer_connection:
+                self._writer_owner = None
+                self._writer_lock.release()
+            else:
+                self._idle_readers.put(connection)
+
+        if not stack:
+            if getattr(self._local, 'is_exclusive', False):
+                self._local.is_exclusive = False
+                self._maintenance_lock.release_writer()
+            else:
+                self._maintenance_lock.release_reader()
+
+    @property
+    def transaction_depth(self) -> int:
+        return getattr(self._local, 'transaction_depth', 0)
+
+    def _begin_transaction(self) -> None:
+        self._check_out_writer()
+
+        try:
+            if (depth := self.transaction_depth) == 0:
+                self._local.commit_callbacks = []
+
+                if not self._writer_connection.in_transaction:
+                    self._writer_connection.execute("BEGIN IMMEDIATE")
+            else:
+                self._writer_connection.execute(f"SAVEPOINT transaction_{depth}")
+        except BaseException:
+            self._check_in()
+
+            raise
+
+        self._local.transaction_depth = depth + 1
+
+    def _end_transaction(self, is_successful: bool) -> None:
+        self._local.transaction_depth = depth = self.transaction_depth - 1
+
+        try:
+            if depth == 0:
+                commit_callbacks, self._local.commit_callbacks = self._local.commit_callbacks, []
+
+                if is_successful:
+                    # XXX a connection left in a failed transaction would have the next one quietly join it
+                    try:
+                        self._writer_connection.commit()
+                    except BaseException:
+                        self._writer_connection.rollback()
+
+                        raise
+
+                    for callback in commit_callbacks:
+                        callback()
+                else:
+                    self._writer_connection.rollback()
+            elif is_successful:
+                self._writer_connection.execute(f"RELEASE transaction_{depth}")
+            else:
+                self._writer_connection.execute(f"ROLLBACK TO transaction_{depth}")
+                self._writer_connection.execute(f"RELEASE transaction_{depth}")
+        finally:
+            self._check_in()
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        if self.transaction_depth:
+            self._local.commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'readers': self._readers_count,
+            'idle_readers': self.idle_readers_count,
+            'reader': self.reader_stats.as_dict(),
+            'writer': self.writer_stats.as_dict()
+        }
+
+
+class ConnectionProxy:
+    _pool: ConnectionPool
+    _statement_durations: Histogram | None
+
+    def __init__(self, pool: ConnectionPool, statement_durations: Histogram | None = None) -> None:
+        self._pool = pool
+        self._statement_durations = statement_durations
+
+    def _observe(self, statement: str, start_time: float) -> None:
+        # XXX statements are labeled by their verb only, the query text itself may contain any amount of placeholders
+        self._statement_durations.observe(time.perf_counter() - start_time, statement.split(None, 1)[0].upper())
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()) -> sqlite3.Cursor:
+        if self._statement_durations is None:
+            return self._pool.current.execute(sql, parameters)
+
+        start_time = time.perf_counter()
+
+        try:
+            return self._pool.current.execute(sql, parameters)
+        finally:
+            self._observe(sql, start_time)
+
+    def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]) -> sqlite3.Cursor:
+        if self._statement_durations is None:
+            return self._pool.current.executemany(sql, parameters)
+
+        start_time = time.perf_counter()
+
+        try:
+            return self._pool.current.executemany(sql, parameters)
+        finally:
+            self._observe(sql, start_time)
+
+    def executescript(self, sql_script: str) -> sqlite3.Cursor:
+        return self._pool.current.executescript(sql_script)
+
+    def commit(self) -> None:
+        # XXX inside of a transaction everything is committed at once when it ends
+        if not self._pool.transaction_depth:
+            if self._statement_durations is None:
+                self._pool.current.commit()
+
+                return
+
+            start_time = time.perf_counter()
+
+            try:
+                self._pool.current.commit()
+            finally:
+                self._observe("COMMIT", start_time)
+
+    def rollback(self) -> None:
+        # XXX it would roll back the outer transaction too, a scope is rolled back by leaving it with an exception
+        if self._pool.transaction_depth:
+            raise DatabaseInternalError("rolling back inside of a transaction")
+
+        self._pool.current.rollback()
+
+    def transaction(self) -> _Transaction:
+        return self._pool.transaction
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        self._pool.on_commit(callback)
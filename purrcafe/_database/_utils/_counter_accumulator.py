@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import Callable
+import threading
+
+from ._connection_pool import ConnectionPool, ConnectionProxy
+
+
+class CounterAccumulator:
+    _pool: ConnectionPool
+    _database: ConnectionProxy
+    _flush_query: str
+    _columns_count: int
+    _flush_threshold: int
+    _flush_callback: Callable[[int], None] | None
+
+    _lock: threading.Lock
+    _flush_lock: threading.Lock
+    _pending: dict[int, list[int]]
+    _flushing: dict[int, list[int]]
+    _threshold_reached: threading.Event
+
+    flushes_count: int
+    flushed_rows_count: int
+
+    def __init__(self, pool: ConnectionPool, table: str, columns: tuple[str, ...], flush_threshold: int, flush_callback: Callable[[int], None] | None = None) -> None:
+        self._pool = pool
+        self._database = ConnectionProxy(pool)
+        self._flush_query = f"UPDATE {table} SET {', '.join(f"{column}={column} + (?)" for column in columns)} WHERE id=(?)"
+        self._columns_count = len(columns)
+        self._flush_threshold = flush_threshold
+        self._flush_callback = flush_callback
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._threshold_reached = threading.Event()
+
+        self.flushes_count = 0
+        self.flushed_rows_count = 0
+
+    @property
+    def pending_rows_count(self) -> int:
+        return len(self._pending)
+
+    def add(self, id_: int, column: int, delta: int = 1) -> None:
+        with self._lock:
+            if (deltas := self._pending.get(id_)) is None:
+                deltas = self._pending[id_] = [0] * self._columns_count
+
+            deltas[column] += delta
+
+            if len(self._pending) >= self._flush_threshold:
+                self._threshold_reached.set()
+
+    def get_pending(self, id_: int, column: int) -> int:
+        with self._lock:
+            return sum(deltas[column] for deltas in (self._pending.get(id_), self._flushing.get(id_)) if deltas is not None)
+
+    def discard(self, id_: int, column: int | None = None) -> None:
+        # XXX writers hold the database writer while discarding, so a flush either wrote the counts already or hasn't read its batch yet
+        with self._lock:
+            for counters in (self._pending, self._flushing):
+                if column is None:
+                    counters.pop(id_, None)
+                elif (deltas := counters.get(id_)) is not None:
+                    deltas[column] = 0
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._threshold_reached.wait(timeout)
+
+    def _finish_flush(self) -> None:
+        # XXX called with the lock still held from before the commit, so the flushed counts stop being pending the very moment they're committed and readers never count them twice
+        try:
+            if self._flush_callback is not None:
+                for id_ in self._flushing:
+                    self._flush_callback(id_)
+
+            self.flushes_count += 1
+            self.flushed_rows_count += len(self._flushing)
+
+            self._flushing = {}
+        finally:
+            self._lock.release()
+
+    def flush(self) -> int:
+        # XXX inside of a transaction the flush waits for it to be committed, so the lock is never held across a transaction of somebody else
+        if self._pool.transaction_depth:
+            self._pool.on_commit(self.flush)
+
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+                self._threshold_reached.clear()
+
+                if not self._flushing:
+                    return 0
+
+            is_locked = is_finished = False
+
+            def finish() -> None:
+                nonlocal is_finished
+
+                is_finished = True
+                self._finish_flush()
+
+            try:
+                with self._pool.transaction:
+                    with self._lock:
+                        rows = [(*deltas, id_) for id_, deltas in self._flushing.items()]
+
+                    self._database.executemany(self._flush_query, rows)
+
+                    self._lock.acquire()
+                    is_locked = True
+                    self._pool.on_commit(finish)
+            except BaseException:
+                # XXX a batch which got committed is done with, only one that didn't make it goes back to the pending counts
+                if is_finished:
+                    raise
+
+                if not is_locked:
+                    self._lock.acquire()
+
+                try:
+                    for id_, deltas in self._flushing.items():
+                        if (pending_deltas := self._pending.get(id_)) is None:
+                            self._pending[id_] = deltas
+                        else:
+                            for column, delta in enumerate(deltas):
+                                pending_deltas[column] += delta
+
+                    self._flushing = {}
+                finally:
+                    self._lock.release()
+
+                raise
+
+            return len(rows)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+from typing import Iterable
+import datetime
+import heapq
+import threading
+import time
+
+
+class DeadlineScheduler:
+    _max_size: int
+    _heap: list[datetime.datetime]
+    _condition: threading.Condition
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._heap = []
+        self._condition = threading.Condition()
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def next_deadline(self) -> datetime.datetime | None:
+        with self._condition:
+            return self._heap[0] if self._heap else None
+
+    def schedule(self, deadline: datetime.datetime) -> None:
+        with self._condition:
+            # XXX later deadlines may be dropped when full, they will be picked up by the next `reset`
+            if len(self._heap) >= self._max_size and deadline >= self._heap[0]:
+                return
+
+            heapq.heappush(self._heap, deadline)
+
+            if self._heap[0] is deadline:
+                self._condition.notify_all()
+
+    def reset(self, deadlines: Iterable[datetime.datetime]) -> None:
+        with self._condition:
+            self._heap = heapq.nsmallest(self._max_size, set(self._heap).union(deadlines))
+
+            self._condition.notify_all()
+
+    def wait(self, max_delay: float) -> bool:
+        give_up_at = time.monotonic() + max_delay
+
+        with self._condition:
+            while True:
+                now = datetime.datetime.now(datetime.UTC)
+
+                if self._heap and self._heap[0] <= now:
+                    while self._heap and self._heap[0] <= now:
+                        heapq.heappop(self._heap)
+
+                    return True
+
+                if (timeout := give_up_at - time.monotonic()) <= 0:
+                    return False
+
+                self._condition.wait(min(timeout, (self._heap[0] - now).total_seconds()) if self._heap else timeout)
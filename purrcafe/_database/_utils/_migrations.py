@@ -3,9 +3,10 @@ from pathlib import Path
 import sqlite3
 
 from ..._logging import logger
+from ._connection_pool import ConnectionProxy
 
 
-def complete_migrations(database: sqlite3.Connection, migrations_path: PathLike | str | bytes, last_migration: int) -> int:
+def complete_migrations(database: sqlite3.Connection | ConnectionProxy, migrations_path: PathLike | str | bytes, last_migration: int) -> int:
     migrations_path = Path(migrations_path)
 
     logger.debug(f"applying migrations from {migrations_path}")
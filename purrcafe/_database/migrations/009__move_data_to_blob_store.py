@@ -0,0 +1,10 @@
+from purrcafe._database._database import blob_store
+
+database.execute("ALTER TABLE files ADD data_key CHAR(64) NULL")
+database.execute("ALTER TABLE files ADD file_size INTEGER NULL")
+
+for (file_id,) in database.execute("SELECT id FROM files").fetchall():
+    data = database.execute("SELECT data FROM files WHERE id=(?)", (file_id,)).fetchone()[0]
+
+    database.execute("UPDATE files SET data=(?), data_key=(?), file_size=(?) WHERE id=(?)", (b'', blob_store.put(data), len(data), file_id))
+    database.commit()
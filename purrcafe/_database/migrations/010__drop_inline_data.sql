@@ -0,0 +1,26 @@
+BEGIN TRANSACTION;
+
+CREATE TABLE new_files (
+    id INTEGER PRIMARY KEY NOT NULL,
+    uploader_id REFERENCES users(id) NOT NULL,
+    uploader_hidden BOOLEAN NOT NULL,
+    upload_datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    expiration_datetime TIMESTAMP NULL,
+    filename VARCHAR NULL,
+    decrypted_data_hash CHAR(32) NULL,
+    mime_type VARCHAR NOT NULL DEFAULT 'application/octet-stream',
+    data_access_count INTEGER NOT NULL DEFAULT 0,
+    max_access_count INTEGER NULL,
+    meta_access_count INTEGER NOT NULL DEFAULT 0,
+    file_size INTEGER NOT NULL,
+    data_key CHAR(64) NOT NULL
+);
+
+INSERT INTO new_files SELECT id, uploader_id, uploader_hidden, upload_datetime, expiration_datetime, filename, decrypted_data_hash, mime_type, data_access_count, max_access_count, meta_access_count, file_size, data_key FROM files;
+
+DROP TABLE files;
+ALTER TABLE new_files RENAME TO files;
+
+COMMIT;
+
+VACUUM;
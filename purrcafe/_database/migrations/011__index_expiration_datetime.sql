@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS files_expiration_datetime_idx ON files(expiration_datetime);
@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS files_uploader_id_idx ON files(uploader_id);
+CREATE INDEX IF NOT EXISTS sessions_owner_id_idx ON sessions(owner_id);
@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS files_uploader_id_upload_datetime_idx ON files(uploader_id, upload_datetime);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS blobs (
+    data_key CHAR(64) PRIMARY KEY NOT NULL,
+    file_size INTEGER NOT NULL,
+    reference_count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+INSERT INTO blobs SELECT data_key, MAX(file_size), COUNT(*) FROM files GROUP BY data_key;
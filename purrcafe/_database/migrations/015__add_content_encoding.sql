@@ -0,0 +1,2 @@
+ALTER TABLE files ADD content_encoding VARCHAR NULL;
+ALTER TABLE files ADD encoded_size INTEGER NULL;
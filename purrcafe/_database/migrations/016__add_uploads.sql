@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY NOT NULL,
+    owner_id REFERENCES users(id) NOT NULL,
+    creation_datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    update_datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    upload_length INTEGER NULL,
+    upload_offset INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS uploads_owner_id_idx ON uploads(owner_id);
+CREATE INDEX IF NOT EXISTS uploads_update_datetime_idx ON uploads(update_datetime);
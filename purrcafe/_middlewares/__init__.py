@@ -1 +1,2 @@
-from ._logging import LoggingMiddleware
+from ._logging import AccessLogWriter, LoggingMiddleware
+from ._metrics import MetricsMiddleware
@@ -1,69 +1,228 @@
-from typing import Callable, Awaitable
+from __future__ import annotations
+from os import PathLike
+from typing import Any
+import collections
+import datetime
+import fcntl
+import json
+import os
+import threading
 import time
-import logging
-import logging.handlers
-import queue
-import http
 
-from starlette.exceptions import HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .._logging import logger
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    _filename: str
-    _logger: logging.Logger
-    _logging_queue: queue.Queue
-    _queue_handler: logging.handlers.QueueHandler
-    _queue_listener: logging.handlers.QueueListener
-    _handler: logging.FileHandler
 
-    def __init__(self, app, filename: str = "requests.log"):
-        super().__init__(app)
+class AccessLogWriter:
+    # XXX records are only queued by requests, a separate thread turns them into JSON lines and writes them in batches
+    _path: str
+    _max_size: int
+    _rotation_interval: float
+    _backups_count: int
+    _flush_delay: float
+    _batch_size: int
 
-        self._filename = filename
+    _pending: collections.deque[tuple[Any, ...]]
+    _wakeup: threading.Event
+    _is_closing: bool
+    _thread: threading.Thread
 
-        self._logger = logging.getLogger("purrcafe_fastapi")
-        self._logger.setLevel(logging.INFO)
+    _file: Any
+    _file_open_time: float
 
-        self._logging_queue = queue.Queue()
-        self._queue_handler = logging.handlers.QueueHandler(self._logging_queue)
-        self._logger.addHandler(self._queue_handler)
+    written_records_count: int
+    rotations_count: int
 
-        self._handler = logging.FileHandler(self._filename)
-        self._handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s - %(message)s"))
+    def __init__(
+            self,
+            path: PathLike | str,
+            max_size: int,
+            rotation_interval: float,
+            backups_count: int,
+            flush_delay: float,
+            batch_size: int
+    ) -> None:
+        self._path = str(path)
+        self._max_size = max_size
+        self._rotation_interval = rotation_interval
+        self._backups_count = backups_count
+        self._flush_delay = flush_delay
+        self._batch_size = batch_size
 
-        self._queue_listener = logging.handlers.QueueListener(self._logging_queue, self._handler)
-        self._queue_listener.start()  # XXX should it be stoppable?
+        self._pending = collections.deque()
+        self._wakeup = threading.Event()
+        self._is_closing = False
 
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
-        callback_time_start = time.perf_counter()
+        self.written_records_count = 0
+        self.rotations_count = 0
 
-        base_msg = f"{(c := request.client)[0]}:{c[1]} - {request.method} {request.url.path} - "
+        self._open()
 
-        def time_taken() -> str:
-            nonlocal callback_time_start, callback_time_end
+        self._thread = threading.Thread(daemon=True, target=self._worker, name="purrcafe-access-log")
+        self._thread.start()
 
-            return f" - {(callback_time_end - callback_time_start) * 1000:.2f}ms"
+    def _open(self) -> None:
+        self._file = open(self._path, "ab")
+        self._file_open_time = time.monotonic()
 
+    def _is_current(self) -> bool:
         try:
-            response = await call_next(request)
-        except HTTPException as http_exc:
-            callback_time_end = time.perf_counter()
+            return os.stat(self._path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
 
-            self._logger.warning(base_msg + f"{(code := http_exc.status_code)} {http.HTTPStatus(code).phrase}{f' ({http_exc.detail})' if http_exc.detail is not None else ''}" + time_taken())
+    def _rotate(self) -> None:
+        # XXX workers share the log, whoever locks it first rotates it and the rest only reopen it
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
 
-            raise http_exc from http_exc.__context__
-        except Exception as exc:
-            callback_time_end = time.perf_counter()
+        try:
+            if self._is_current():
+                # XXX same naming as `logging.handlers.RotatingFileHandler`, the log becomes .1 and older backups are shifted by one
+                if self._backups_count > 0:
+                    for i in range(self._backups_count - 1, 0, -1):
+                        if os.path.exists(source := f"{self._path}.{i}"):
+                            os.replace(source, f"{self._path}.{i + 1}")
+
+                    os.replace(self._path, f"{self._path}.1")
+                else:
+                    os.truncate(self._path, 0)
+
+                self.rotations_count += 1
+        finally:
+            self._file.close()
+
+        self._open()
+
+    def _should_rotate(self) -> bool:
+        return (
+            (file_size := os.fstat(self._file.fileno()).st_size) > 0 and
+            (
+                (self._max_size > 0 and file_size >= self._max_size) or
+                (self._rotation_interval > 0 and time.monotonic() - self._file_open_time >= self._rotation_interval)
+            )
+        )
+
+    def _format(self, record: tuple[Any, ...]) -> bytes:
+        timestamp, client, method, path, status, sent_bytes, ttfb, duration, error = record
+
+        fields = {
+            'time': datetime.datetime.fromtimestamp(timestamp, datetime.UTC).isoformat(timespec='milliseconds'),
+            'client': f"{client[0]}:{client[1]}" if client is not None else None,
+            'method': method,
+            'path': path,
+            'status': status,
+            'sent_bytes': sent_bytes,
+            'ttfb_ms': round(ttfb * 1000, 3) if ttfb is not None else None,
+            'duration_ms': round(duration * 1000, 3)
+        }
+
+        if error is not None:
+            fields['error'] = error
+
+        return json.dumps(fields, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b"\n"
+
+    def _write_pending(self) -> None:
+        # XXX only this thread pops records, so taking as many as there were a moment ago never blocks or races the requests appending them
+        records_count = len(self._pending)
+
+        if not records_count:
+            return
+
+        batch = b"".join(self._format(self._pending.popleft()) for _ in range(records_count))
+
+        if not self._is_current():
+            self._file.close()
+            self._open()
+
+        if self._should_rotate():
+            self._rotate()
+
+        self._file.write(batch)
+        self._file.flush()
+
+        self.written_records_count += records_count
 
-            self._logger.warning(base_msg + f"500 Internal Server Error ({type(exc).__name__}: {exc})" + time_taken())
+    def _worker(self) -> None:
+        while True:
+            self._wakeup.wait(self._flush_delay)
+            self._wakeup.clear()
 
-            raise exc from exc.__context__
-        else:
-            callback_time_end = time.perf_counter()
+            try:
+                self._write_pending()
+            except Exception:
+                logger.exception("failed to write access log records")
 
-            self._logger.info(base_msg + f"{(code := response.status_code)} {http.HTTPStatus(code).phrase}" + time_taken())
+            if self._is_closing:
+                break
 
-            return response
+        self._file.close()
+
+    def add(self, record: tuple[Any, ...]) -> None:
+        self._pending.append(record)
+
+        if len(self._pending) >= self._batch_size:
+            self._wakeup.set()
+
+    def close(self) -> None:
+        if self._is_closing:
+            return
+
+        self._is_closing = True
+        self._wakeup.set()
+        self._thread.join()
+
+
+class LoggingMiddleware:
+    # XXX a plain ASGI middleware, `BaseHTTPMiddleware` runs every request in an extra task and passes streamed responses through a memory stream
+    _app: ASGIApp
+    _writer: AccessLogWriter
+
+    def __init__(self, app: ASGIApp, writer: AccessLogWriter) -> None:
+        self._app = app
+        self._writer = writer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != "http":
+            await self._app(scope, receive, send)
+
+            return
+
+        start_time = time.perf_counter()
+        first_byte_time = None
+        status = 500
+        sent_bytes = 0
+        error = None
+
+        async def timing_send(message: Message) -> None:
+            nonlocal first_byte_time, status, sent_bytes
+
+            if message['type'] == "http.response.start":
+                first_byte_time = time.perf_counter()
+                status = message['status']
+            elif message['type'] == "http.response.body":
+                sent_bytes += len(message.get('body', b''))
+
+            await send(message)
+
+        try:
+            await self._app(scope, receive, timing_send)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+
+            raise
+        finally:
+            end_time = time.perf_counter()
+
+            # XXX formatting is left to the writer thread, a request only builds a tuple
+            self._writer.add((
+                time.time(),
+                scope.get('client'),
+                scope['method'],
+                scope['path'],
+                status,
+                sent_bytes,
+                first_byte_time - start_time if first_byte_time is not None else None,
+                end_time - start_time,
+                error
+            ))
@@ -0,0 +1,72 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .._utils import metrics
+
+_requests = metrics.counter("purrcafe_http_requests_total", "Handled HTTP requests.", ("method", "route", "status"))
+_request_durations = metrics.histogram("purrcafe_http_request_duration_seconds", "Time taken to handle HTTP requests, including sending the response body.", ("method", "route"))
+_requests_in_flight = metrics.gauge("purrcafe_http_requests_in_flight", "HTTP requests being handled.")
+_received_bytes = metrics.counter("purrcafe_http_request_body_bytes_total", "Bytes of HTTP request bodies received.", ("method", "route"))
+_sent_bytes = metrics.counter("purrcafe_http_response_body_bytes_total", "Bytes of HTTP response bodies sent.", ("method", "route"))
+
+
+class MetricsMiddleware:
+    # XXX a plain ASGI middleware, unlike `BaseHTTPMiddleware` it doesn't put response bodies through an extra task and stream
+    UNMATCHED_ROUTE = "<unmatched>"
+
+    _app: ASGIApp
+
+    def __init__(self, app: ASGIApp) -> None:
+        self._app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != "http":
+            await self._app(scope, receive, send)
+
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+        received_bytes = 0
+        sent_bytes = 0
+
+        async def counting_receive() -> Message:
+            nonlocal received_bytes
+
+            message = await receive()
+
+            if message['type'] == "http.request":
+                received_bytes += len(message.get('body', b''))
+
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal status, sent_bytes
+
+            if message['type'] == "http.response.start":
+                status = message['status']
+            elif message['type'] == "http.response.body":
+                sent_bytes += len(message.get('body', b''))
+
+            await send(message)
+
+        _requests_in_flight.inc()
+
+        try:
+            await self._app(scope, counting_receive, counting_send)
+        finally:
+            _requests_in_flight.dec()
+
+            # XXX the router puts the matched route into the scope, its path template keeps the label count bounded unlike the requested path
+            route = route.path if (route := scope.get('route')) is not None else self.UNMATCHED_ROUTE
+            method = scope['method']
+
+            _requests.inc(method, route, str(status))
+            _request_durations.observe(time.perf_counter() - start_time, method, route)
+
+            if received_bytes:
+                _received_bytes.inc(method, route, amount=received_bytes)
+
+            if sent_bytes:
+                _sent_bytes.inc(method, route, amount=sent_bytes)
@@ -5,7 +5,6 @@ from slowapi.util import get_remote_address
 from starlette.requests import Request
 
 from .._database import User
-from .._routers.v1._common import authorize_user, authorize_token
 
 
 def _jesus_christ_pls_somebody_kill_fastapi_devs_putting_async_in_VERY_unnecessary_places_thx(request: Request) -> str | None:
@@ -21,7 +20,9 @@ def _jesus_christ_pls_somebody_kill_fastapi_devs_putting_async_in_VERY_unnecessa
 
 
 def get_request_identifier(request: Request) -> str:
-    user = authorize_user(authorize_token(_jesus_christ_pls_somebody_kill_fastapi_devs_putting_async_in_VERY_unnecessary_places_thx(request)))
+    from .._routers.v1._common import authorize_user, authorize_token  # XXX circular import, the routers import `limiter` from the package
+
+    user = authorize_user(request, authorize_token(request, _jesus_christ_pls_somebody_kill_fastapi_devs_putting_async_in_VERY_unnecessary_places_thx(request)))
 
     if user.id == User.ADMIN_ID:
         return ''
@@ -3,6 +3,8 @@ from fastapi import APIRouter
 from .accounts import router as accounts_api
 from .session import router as session_api
 from .files import router as files_api
+from .stats import router as stats_api
+from .uploads import router as uploads_api
 
 router = APIRouter()
 
@@ -10,3 +12,5 @@ router = APIRouter()
 router.include_router(accounts_api, prefix="/accounts")
 router.include_router(session_api, prefix="/session")
 router.include_router(files_api, prefix="/files")
+router.include_router(stats_api, prefix="/stats")
+router.include_router(uploads_api, prefix="/uploads")
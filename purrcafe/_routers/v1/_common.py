@@ -1,16 +1,25 @@
-from typing import Annotated
+import dataclasses
+import datetime
+import email.utils
+from typing import Annotated, Callable, Final, Iterator, Literal
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect, Request
 
 import meowid
 from meowid import MeowID
 
-from ..._database import Session as m_Session, User as m_User, File as m_File
+from ..._database import Session as m_Session, User as m_User, File as m_File, Upload as m_Upload
+from ..._database._utils import BlobWriter
 from ..._database.exceptions import IDNotFoundError
 
 _oauth2_scheme = OAuth2PasswordBearer(tokenUrl='v1/session/oauth2', auto_error=False)
 
+PAGE_MAX_SIZE: Final[int] = 1000
+
 
 def parse_meowid(meowid_str: str) -> MeowID:
     try:
@@ -22,12 +31,13 @@ def parse_meowid(meowid_str: str) -> MeowID:
         )
 
 
-def authorize_token(token: Annotated[str | None, Depends(_oauth2_scheme)]) -> m_Session:
+def authorize_token(request: Request, token: Annotated[str | None, Depends(_oauth2_scheme)]) -> m_Session:
+    # XXX the rate limiter authorizes the request before the endpoint does, so the result is memoized in request's state
+    if (session := getattr(request.state, 'session', None)) is not None:
+        return session
+
     try:
-        if token is not None:
-            return m_Session.get(parse_meowid(token))
-        else:
-            return m_Session.get(MeowID.from_int(0))
+        request.state.session, request.state.user = m_Session.get_with_owner(parse_meowid(token) if token is not None else MeowID.from_int(0))
     except IDNotFoundError:
         raise HTTPException(
             status_code=401,
@@ -35,6 +45,8 @@ def authorize_token(token: Annotated[str | None, Depends(_oauth2_scheme)]) -> m_
             headers={'WWW-Authenticate': "Bearer"}
         ) from None
 
+    return request.state.session
+
 
 def get_user(id: str) -> m_User:
     try:
@@ -46,8 +58,8 @@ def get_user(id: str) -> m_User:
         )
 
 
-def authorize_user(session: Annotated[m_Session, Depends(authorize_token)]) -> m_User:
-    return session.owner
+def authorize_user(request: Request, session: Annotated[m_Session, Depends(authorize_token)]) -> m_User:
+    return request.state.user
 
 
 def get_file(id: str) -> m_File:
@@ -68,3 +80,133 @@ def get_file(id: str) -> m_File:
             )
 
         return file
+
+
+def get_upload(id: str, user: Annotated[m_User, Depends(authorize_user)]) -> m_Upload:
+    if user.id == m_User.GUEST_ID:
+        raise HTTPException(
+            status_code=403,
+            detail="guests cannot use resumable uploads"
+        )
+
+    try:
+        upload = m_Upload.get(parse_meowid(id))
+    except IDNotFoundError:
+        upload = None
+
+    # XXX other users' uploads are reported as missing, so their IDs can't be probed
+    if upload is None or upload.owner_id != user.id:
+        raise HTTPException(
+            status_code=404,
+            detail="upload was not found"
+        )
+
+    return upload
+
+
+async def write_body(request: Request, writer: BlobWriter) -> None:
+    # XXX writing and hashing block, so they're done in a worker thread, received chunks are gathered first so it doesn't take a thread hop per few KiB
+    buffer = bytearray()
+
+    async def write_buffer() -> None:
+        data = bytes(buffer)
+        buffer.clear()
+
+        await run_in_threadpool(writer.write, data)
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+
+            if len(buffer) >= m_File.DATA_CHUNK_SIZE:
+                await write_buffer()
+    except ClientDisconnect:
+        # XXX whatever was received is still written, resumable uploads keep it
+        if buffer:
+            await write_buffer()
+
+        raise
+
+    if buffer:
+        await write_buffer()
+
+
+def compute_lifetime(user: m_User, expiration_datetime: str | None, life_time: int | None) -> datetime.timedelta | None:
+    if expiration_datetime is not None and life_time is not None:
+        raise HTTPException(
+            status_code=422,
+            detail="headers 'Expiration-Datetime' and 'Life-Time' are mutually exclusive"
+        )
+
+    try:
+        if life_time is not None:
+            computed_lifetime = datetime.timedelta(seconds=life_time)
+        elif expiration_datetime is not None:
+            computed_lifetime = email.utils.parsedate_to_datetime(expiration_datetime)
+        elif user.id != m_User.ADMIN_ID:
+            computed_lifetime = m_File.DEFAULT_GUEST_LIFETIME if user.id == m_User.GUEST_ID else m_File.DEFAULT_LIFETIME
+        else:
+            computed_lifetime = None
+    except OverflowError:
+        raise HTTPException(
+            status_code=400,
+            detail="computed lifetime is actually too freaking huge"
+        ) from None
+
+    if (
+            computed_lifetime is not None and
+            (user.id == m_User.GUEST_ID and computed_lifetime > m_File.DEFAULT_GUEST_LIFETIME) or
+            (user.id != m_User.ADMIN_ID and computed_lifetime > m_File.DEFAULT_LIFETIME)
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="file's lifetime is too long"
+        )
+
+    return computed_lifetime
+
+
+@dataclasses.dataclass
+class Page:
+    limit: Annotated[int | None, Query(ge=1, le=PAGE_MAX_SIZE)] = None
+    after: str | None = None
+
+
+@dataclasses.dataclass
+class FileFilters:
+    order: Literal["id", "upload_datetime"] = "id"
+    mime_type: str | None = None
+    expires_after: datetime.datetime | None = None
+    expires_before: datetime.datetime | None = None
+    filename_prefix: str | None = None
+
+
+def stream_ids(page: Page, get_page: Callable[[MeowID | None, int], list[m_File] | list[m_Session]]) -> StreamingResponse:
+    # XXX the first page is loaded right away so its errors still turn into proper responses, without a limit the rest is streamed page by page
+    try:
+        objects = get_page(parse_meowid(page.after) if page.after is not None else None, page.limit or PAGE_MAX_SIZE)
+    except IDNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="cursor was not found"
+        ) from None
+
+    def iter_ids(objects: list[m_File] | list[m_Session]) -> Iterator[str]:
+        separator = ""
+
+        yield "["
+
+        while True:
+            for object_ in objects:
+                yield f'{separator}"{object_.id}"'
+
+                separator = ","
+
+            if page.limit is not None or len(objects) < PAGE_MAX_SIZE:
+                break
+
+            objects = get_page(objects[-1].id, PAGE_MAX_SIZE)
+
+        yield "]"
+
+    return StreamingResponse(iter_ids(objects), media_type="application/json")
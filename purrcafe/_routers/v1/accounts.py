@@ -1,36 +1,38 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from slowapi.util import get_remote_address
 from starlette.requests import Request
 
 from meowid import MeowID
 
-from ._common import authorize_user, parse_meowid, get_user
+from ._common import authorize_user, parse_meowid, get_user, stream_ids, Page, FileFilters
 from ._schemas import CreateUser as s_CreateUser, User as s_User, ForeignUser as s_ForeignUser, UpdateUser as s_UpdateUser
 from ... import limiter
-from ..._database import User as m_User
-from ..._database._database import _Nothing
+from ..._database import User as m_User, File as m_File
+from ..._database._database import _Nothing, database, run_in_database_executor
 from ..._database.exceptions import WrongHashLengthError, IDNotFoundError, ValueAlreadyTakenError, \
-    OperationPermissionError
-from ..._utils import hash_password
+    OperationPermissionError, WrongValueLengthError
+from ..._utils import ahash_password
 
 router = APIRouter()
 
 
 @router.post("/", response_class=PlainTextResponse)
 @limiter.limit("3/hour", key_func=get_remote_address)
-def create_account(
+async def create_account(
         request: Request,
         user_info: s_CreateUser
 ) -> str:
+    password_hash = await ahash_password(user_info.password)
+
     try:
-        return str(m_User.create(
+        return str((await m_User.acreate(
             name=user_info.name,
             email=user_info.email,
-            password_hash=hash_password(user_info.password)
-        ).id)
+            password_hash=password_hash
+        )).id)
     except WrongHashLengthError as e:
         raise HTTPException(
             status_code=422,
@@ -53,29 +55,44 @@ def get_account(user: Annotated[m_User, Depends(authorize_user)]) -> s_User:
     )
 
 
-@router.get("/me/files")
-def get_uploaded_files(user: Annotated[m_User, Depends(authorize_user)]) -> list[str]:
+@router.get("/me/files", response_model=list[str])
+def get_uploaded_files(
+        user: Annotated[m_User, Depends(authorize_user)],
+        page: Annotated[Page, Depends()],
+        filters: Annotated[FileFilters, Depends()]
+) -> StreamingResponse:
     if int(user.id) == 0:
         raise HTTPException(
             status_code=403,
             detail="can't view uploaded files if a guest",
         )
 
-    return [str(file.id) for file in user.uploaded_files]
+    return stream_ids(page, lambda after, limit: m_File.get_uploaded_by_page(
+        user,
+        limit,
+        after,
+        filters.order,
+        filters.mime_type,
+        filters.expires_after,
+        filters.expires_before,
+        filters.filename_prefix
+    ))
 
 
-@router.get("/{id}/files")
+@router.get("/{id}/files", response_model=list[str])
 def get_uploaded_files_of_arbitriary_account(
         user: Annotated[m_User, Depends(authorize_user)],
         targeted_user: Annotated[m_User, Depends(get_user)],
-) -> list[str]:
+        page: Annotated[Page, Depends()],
+        filters: Annotated[FileFilters, Depends()]
+) -> StreamingResponse:
     if user.id != m_User.ADMIN_ID:
         raise HTTPException(
             status_code=403,
             detail="only admins can view uploaded files of arbitrary user",
         )
 
-    return get_uploaded_files(targeted_user)
+    return get_uploaded_files(targeted_user, page, filters)
 
 
 @router.get("/{id}")
@@ -101,34 +118,57 @@ def get_full_user(
     return get_account(targeted_user)
 
 
-@router.patch("/me")
-@limiter.limit("20/minute")
-def update_account(
-        request: Request,
-        user: Annotated[m_User, Depends(authorize_user)],
-        patch: s_UpdateUser
-) -> None:
+def _update_user(user: m_User, patch: s_UpdateUser, password_hash: str | type[_Nothing]) -> None:
+    with database.transaction():
+        if patch.name is not _Nothing:
+            user.name = patch.name
+
+        if patch.email is not _Nothing:
+            user.email = patch.email
+
+        if password_hash is not _Nothing:
+            user.password_hash = password_hash
+
+
+async def _update_account(user: m_User, patch: s_UpdateUser) -> None:
     if user.is_critical:
         raise HTTPException(
             status_code=403,
             detail="cannot patch critical users"
         )
 
-    if patch.name is not _Nothing:
-        user.name = patch.name
+    password_hash = await ahash_password(patch.password) if patch.password is not _Nothing else _Nothing
+
+    try:
+        await run_in_database_executor(_update_user, user, patch, password_hash)
+    except (WrongHashLengthError, WrongValueLengthError) as e:
+        raise HTTPException(
+            status_code=422,
+            detail=str(e)
+        ) from None
+    except ValueAlreadyTakenError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e)
+        ) from None
 
-    if patch.email is not _Nothing:
-        user.email = patch.email
 
-    if patch.password is not _Nothing:
-        user.password_hash = hash_password(patch.password)
+@router.patch("/me")
+@limiter.limit("20/minute")
+async def update_account(
+        request: Request,
+        user: Annotated[m_User, Depends(authorize_user)],
+        patch: s_UpdateUser
+) -> None:
+    await _update_account(user, patch)
 
 
 @router.patch("/{id}")
-def update_arbitrary_account(
+async def update_arbitrary_account(
         request: Request,
         user: Annotated[m_User, Depends(authorize_user)],
         targeted_user: Annotated[m_User, Depends(get_user)],
+        patch: s_UpdateUser
 ) -> None:
     if user.id != m_User.ADMIN_ID:
         raise HTTPException(
@@ -136,7 +176,7 @@ def update_arbitrary_account(
             detail="only admins can update arbitrary account"
         )
 
-    update_account(request, targeted_user)
+    await _update_account(targeted_user, patch)
 
 
 @router.delete("/me")
@@ -1,13 +1,15 @@
 import datetime
 import email.utils
-from typing import Annotated
+import secrets
+from typing import Annotated, Iterator
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Body
-from fastapi.responses import Response, PlainTextResponse
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response, PlainTextResponse, StreamingResponse
 from slowapi.util import get_remote_address
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 
-from ._common import authorize_user, get_file
+from ._common import authorize_user, compute_lifetime, get_file, write_body
 from ._schemas import FileMetadata as s_FileMetadata
 from ... import limiter
 from ..._database import File as m_File, User as m_User
@@ -15,13 +17,22 @@ from ..._database.exceptions import WrongHashLengthError, WrongValueLengthError,
 
 router = APIRouter()
 
+_MAX_RANGES_COUNT = 16
+_IMMUTABLE_MAX_AGE = 31536000  # 1 year
 
-@router.post('/', response_class=PlainTextResponse)
-@router.post("/{filename}", response_class=PlainTextResponse)
+_upload_openapi_extra = {
+    'requestBody': {
+        'content': {'application/octet-stream': {'schema': {'type': "string", 'format': "binary"}}},
+        'required': True
+    }
+}
+
+
+@router.post('/', response_class=PlainTextResponse, openapi_extra=_upload_openapi_extra)
+@router.post("/{filename}", response_class=PlainTextResponse, openapi_extra=_upload_openapi_extra)
 @limiter.limit("2/minute")
 async def upload_file(
         request: Request,
-        data: Annotated[bytes, Body(media_type="application/octet-stream")],
         user: Annotated[m_User, Depends(authorize_user)],
         mime_type: Annotated[str, Header(alias="Content-Type")] = m_File.DEFAULT_CONTENT_TYPE,
         filename: str = None,
@@ -31,48 +42,34 @@ async def upload_file(
         life_time: Annotated[int, Header()] = None,
         anonymous: bool = False
 ) -> str:
-    if expiration_datetime is not None and life_time is not None:
-        raise HTTPException(
-            status_code=422,
-            detail="headers 'Expiration-Datetime' and 'Life-Time' are mutually exclusive"
-        )
-
-    try:
-        if life_time is not None:
-            computed_lifetime = datetime.timedelta(seconds=life_time)
-        elif expiration_datetime is not None:
-            computed_lifetime = email.utils.parsedate_to_datetime(expiration_datetime)
-        elif user.id != m_User.ADMIN_ID:
-            computed_lifetime = m_File.DEFAULT_GUEST_LIFETIME if user.id == m_User.GUEST_ID else m_File.DEFAULT_LIFETIME
-        else:
-            computed_lifetime = None
-    except OverflowError:
-        raise HTTPException(
-            status_code=400,
-            detail="computed lifetime is actually too freaking huge"
-        ) from None
+    computed_lifetime = compute_lifetime(user, expiration_datetime, life_time)
 
     if (
-            computed_lifetime is not None and
-            (user.id == m_User.GUEST_ID and computed_lifetime > m_File.DEFAULT_GUEST_LIFETIME) or
-            (user.id != m_User.ADMIN_ID and computed_lifetime > m_File.DEFAULT_LIFETIME)
+            (max_file_size := m_File.get_max_file_size(user)) is not None and
+            (content_length := request.headers.get('Content-Length')) is not None and
+            content_length.isdigit() and int(content_length) > max_file_size
     ):
         raise HTTPException(
-            status_code=400,
-            detail="file's lifetime is too long"
+            status_code=413,
+            detail=str(WrongValueLengthError("data", "byte(s)", max_file_size, None, int(content_length)))
         )
 
     try:
-        return str(m_File.create(
-            uploader=user,
-            uploader_hidden=anonymous,
-            filename=filename,
-            lifetime=computed_lifetime,
-            data=data,
-            decrypted_data_hash=decrypted_data_hash,
-            mime_type=mime_type,
-            max_access_count=max_access_count
-        ).id)
+        with m_File.spool(user) as data:
+            await write_body(request, data)
+
+            await run_in_threadpool(data.finish)
+
+            return str((await m_File.acreate(
+                uploader=user,
+                uploader_hidden=anonymous,
+                filename=filename,
+                lifetime=computed_lifetime,
+                data=data,
+                decrypted_data_hash=decrypted_data_hash,
+                mime_type=mime_type,
+                max_access_count=max_access_count
+            )).id)
     except WrongHashLengthError as e:
         raise HTTPException(
             status_code=422,
@@ -90,6 +87,95 @@ async def upload_file(
         ) from None
 
 
+def _parse_range(range_: str, file_size: int) -> list[tuple[int, int]] | None:
+    unit, _, range_set = range_.partition('=')
+
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for range_spec in range_set.split(','):
+        first, separator, last = range_spec.strip().partition('-')
+
+        if not separator or not (first.isdigit() or first == '') or not (last.isdigit() or last == '') or first == last == '':
+            return None
+
+        if first == '':
+            if int(last) != 0 and file_size != 0:
+                ranges.append((max(file_size - int(last), 0), file_size))
+        else:
+            if last != '' and int(last) < int(first):
+                return None
+
+            if int(first) < file_size:
+                ranges.append((int(first), min(int(last) + 1, file_size) if last != '' else file_size))
+
+    return ranges if len(ranges) <= _MAX_RANGES_COUNT else None
+
+
+def _are_ascending(ranges: list[tuple[int, int]]) -> bool:
+    return all(stop <= next_start for (_, stop), (next_start, _) in zip(ranges, ranges[1:]))
+
+
+def _iter_multipart(parts: Iterator[tuple[int, bytes]], headers: list[bytes], closing: bytes) -> Iterator[bytes]:
+    # XXX every range is non-empty, so each one yields at least one chunk, which is where its header goes
+    current_index = None
+
+    for index, chunk in parts:
+        if index != current_index:
+            if current_index is not None:
+                yield b"\r\n"
+
+            yield headers[index]
+
+            current_index = index
+
+        yield chunk
+
+    if current_index is not None:
+        yield b"\r\n"
+
+    yield closing
+
+
+def _get_etag(file: m_File, is_encoded: bool) -> str:
+    # XXX blob keys are hashes of the stored data, the decompressed representation of a compressed file gets a tag of its own
+    return f'"{file.data_key}"' if is_encoded or file.content_encoding is None else f'"{file.data_key}-identity"'
+
+
+def _does_if_none_match(etag: str, if_none_match: str) -> bool:
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(','))
+
+
+def _does_if_range_match(file: m_File, if_range: str) -> bool:
+    # XXX ranges are always served from the decompressed data, so only its tag can match
+    if if_range.startswith('"'):
+        return if_range.strip() == _get_etag(file, False)
+
+    if if_range.startswith('W/'):
+        return False
+
+    try:
+        return email.utils.parsedate_to_datetime(if_range) == file.upload_datetime.replace(microsecond=0)
+    except (TypeError, ValueError):
+        return False
+
+
+def _does_accept_encoding(accept_encoding: str, content_encoding: str) -> bool:
+    qualities = {}
+
+    for coding in accept_encoding.split(','):
+        name, _, parameters = coding.partition(';')
+        key, _, value = parameters.partition('=')
+
+        try:
+            qualities[name.strip().lower()] = float(value) if key.strip().lower() == "q" else 1.0
+        except ValueError:
+            qualities[name.strip().lower()] = 0.0
+
+    return qualities.get(content_encoding, qualities.get("*", 0.0)) > 0
+
+
 @router.get("/{id}")
 @router.get("/{id}/n/{name}")
 @limiter.limit("1/second", key_func=get_remote_address)
@@ -97,17 +183,82 @@ def get_file_data(
         request: Request,
         file: Annotated[m_File, Depends(get_file)],
         if_modified_since: Annotated[str, Header()] = None,
+        range_: Annotated[str, Header(alias="Range")] = None,
+        if_range: Annotated[str, Header()] = None,
+        if_none_match: Annotated[str, Header()] = None,
+        accept_encoding: Annotated[str, Header()] = None,
         t: bool = False
 ) -> Response:
-    file.data_access_count += 1
+    # XXX ranges are not served for files with limited access count, so every access is still a full download
+    if range_ is not None and file.max_access_count is None and (if_range is None or _does_if_range_match(file, if_range)):
+        ranges = _parse_range(range_, file.file_size)
+    else:
+        ranges = None
 
-    response = get_file_head(file, if_modified_since, t)
+    # XXX compressed data can only be read from the beginning, so it's served in full rather than inflated again for every out of order range
+    if ranges is not None and file.content_encoding is not None and not _are_ascending(ranges):
+        ranges = None
+
+    # XXX partial downloads are counted once per download, by the range starting from the beginning of the file
+    if ranges is None or any(start == 0 for start, _ in ranges):
+        data_access_count = file.register_data_access()
+    else:
+        data_access_count = file.data_access_count
+
+    if file.max_access_count is not None and data_access_count > file.max_access_count:
+        raise HTTPException(
+            status_code=404,
+            detail="file was not found"
+        )
+
+    response = get_file_head(file, if_modified_since, if_none_match, accept_encoding if ranges is None else None, t)
 
     if response.status_code == 200:
-        response.body = file.data
-        response.headers['Content-Length'] = str(file.file_size)
+        if ranges is not None and not ranges:
+            response = Response(
+                status_code=416,
+                headers={'Content-Range': f"bytes */{file.file_size}"}
+            )
+        else:
+            try:
+                if 'Content-Encoding' in response.headers:
+                    content = file.iter_stored_data()
+                    content_length = file.encoded_size
+                elif ranges is None:
+                    content = file.iter_data()
+                    content_length = file.file_size
+                elif len(ranges) == 1:
+                    content = file.iter_data(*ranges[0])
+                    content_length = ranges[0][1] - ranges[0][0]
+
+                    response.headers['Content-Range'] = f"bytes {ranges[0][0]}-{ranges[0][1] - 1}/{file.file_size}"
+                else:
+                    boundary = secrets.token_hex(16)
+                    headers = [
+                        f"--{boundary}\r\nContent-Type: {response.headers['Content-Type']}\r\nContent-Range: bytes {start}-{stop - 1}/{file.file_size}\r\n\r\n".encode()
+                        for start, stop in ranges
+                    ]
+                    closing = f"--{boundary}--\r\n".encode()
 
-    if file.max_access_count is not None and file.data_access_count + 1 > file.max_access_count:
+                    content = _iter_multipart(file.iter_data_ranges(ranges), headers, closing)
+                    content_length = sum(len(header) + stop - start + 2 for header, (start, stop) in zip(headers, ranges)) + len(closing)
+
+                    response.headers['Content-Type'] = f"multipart/byteranges; boundary={boundary}"
+            except FileNotFoundError:
+                # XXX the file got deleted since it was looked up and its blob went along with it
+                raise HTTPException(
+                    status_code=404,
+                    detail="file was not found"
+                ) from None
+
+            response = StreamingResponse(
+                content,
+                status_code=206 if ranges is not None else 200,
+                headers=response.headers
+            )
+            response.headers['Content-Length'] = str(content_length)
+
+    if file.max_access_count is not None and data_access_count >= file.max_access_count:
         file.delete()
 
     return response
@@ -118,9 +269,19 @@ def get_file_data(
 def get_file_head(
         file: Annotated[m_File, Depends(get_file)],
         if_modified_since: Annotated[str, Header()] = None,
+        if_none_match: Annotated[str, Header()] = None,
+        accept_encoding: Annotated[str, Header()] = None,
         t: bool = False
 ) -> Response:
-    if if_modified_since is not None and email.utils.parsedate_to_datetime(if_modified_since) > file.upload_datetime:
+    # XXX compressed files are sent as stored to clients accepting their encoding
+    is_encoded = file.content_encoding is not None and accept_encoding is not None and _does_accept_encoding(accept_encoding, file.content_encoding)
+    etag = _get_etag(file, is_encoded)
+
+    # XXX If-None-Match takes precedence, If-Modified-Since is only honored for clients without a cached tag
+    if (
+            _does_if_none_match(etag, if_none_match) if if_none_match is not None else
+            if_modified_since is not None and email.utils.parsedate_to_datetime(if_modified_since) > file.upload_datetime
+    ):
         response = Response(
             status_code=304
         )
@@ -132,11 +293,30 @@ def get_file_head(
         if file.decrypted_data_hash is not None:
             response.headers['Decrypted-Data-Hash'] = file.decrypted_data_hash
 
+        if is_encoded:
+            response.headers['Content-Encoding'] = file.content_encoding
+
+    # XXX file data never changes, so unless every access has to be counted it can be cached until the file expires
+    if file.max_access_count is None:
+        max_age = _IMMUTABLE_MAX_AGE
+
+        if file.expiration_datetime is not None:
+            max_age = max(min(int((file.expiration_datetime - datetime.datetime.now(datetime.UTC)).total_seconds()), max_age), 0)
+
+        cache_control = f"public, max-age={max_age}, immutable"
+    else:
+        cache_control = "public, no-cache"
+
     response.headers.update({
-        'Cache-Control': "public, no-cache",
+        'Accept-Ranges': "bytes" if file.max_access_count is None else "none",
+        'Cache-Control': cache_control,
+        'ETag': etag,
         'Last-Modified': email.utils.format_datetime(file.upload_datetime)
     })
 
+    if file.content_encoding is not None:
+        response.headers['Vary'] = "Accept-Encoding"
+
     return response
 
 
@@ -154,7 +334,7 @@ def get_file_meta(
         request: Request,
         file: Annotated[m_File, Depends(get_file)]
 ) -> s_FileMetadata:
-    file.meta_access_count += 1
+    file.register_meta_access()
 
     return s_FileMetadata(
         uploader_id=str(file.uploader_id) if not file.uploader_hidden else None,
@@ -3,11 +3,11 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from slowapi.util import get_remote_address
 from starlette.requests import Request
 
-from ._common import authorize_token, authorize_user
+from ._common import authorize_token, authorize_user, stream_ids, Page
 from ._schemas import CreateSession as s_CreateSession, Session as s_Session, OAuth2LoginInfo
 from ... import limiter
 from ..._database import User as m_User, Session as m_Session
@@ -24,9 +24,12 @@ def session_info(session: Annotated[m_Session, Depends(authorize_token)]) -> s_S
     )
 
 
-@router.get("/all")
-def get_all_sessions(user: Annotated[m_User, Depends(authorize_user)]) -> list[str]:
-    return [str(session.id) for session in user.sessions]
+@router.get("/all", response_model=list[str])
+def get_all_sessions(
+        user: Annotated[m_User, Depends(authorize_user)],
+        page: Annotated[Page, Depends()]
+) -> StreamingResponse:
+    return stream_ids(page, lambda after, limit: m_Session.get_owned_by_page(user, limit, after))
 
 
 # @router.post("/", response_class=PlainTextResponse)
@@ -46,12 +49,14 @@ def get_all_sessions(user: Annotated[m_User, Depends(authorize_user)]) -> list[s
 
 @router.post("/")
 @limiter.limit("20/minute", key_func=get_remote_address)
-def login_oauth2(
+async def login_oauth2(
         request: Request,
         credentials: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> OAuth2LoginInfo:
     try:
-        return OAuth2LoginInfo(access_token=str(m_User.find(credentials.username).authorize(hashlib.sha3_512(credentials.password.encode('utf-8')).hexdigest()).id))
+        user = await m_User.afind(credentials.username)
+
+        return OAuth2LoginInfo(access_token=str((await user.aauthorize(hashlib.sha3_512(credentials.password.encode('utf-8')).hexdigest())).id))
     except (ObjectNotFound, ValueMismatchError):
         raise HTTPException(
             status_code=401,
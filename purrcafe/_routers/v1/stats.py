@@ -0,0 +1,68 @@
+from typing import Annotated, Any
+
+import anyio.to_thread
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response
+
+from ._common import authorize_user
+from ..._database import User as m_User, File as m_File
+from ..._utils import hashing_pool, metrics
+from ..._database._database import database_threads_count, database_executor_tasks, database_lock, auth_cache, payload_cache, user_identity_map, session_identity_map, file_identity_map, access_counters
+
+router = APIRouter()
+
+
+def _get_threadpools_stats() -> dict[str, tuple[float, float, float]]:
+    # XXX maps pools to their busy workers, waiting tasks and workers limit, the requests threadpool is the one sync endpoints and dependencies run in
+    requests_threadpool = anyio.to_thread.current_default_thread_limiter().statistics()
+    database_tasks = database_executor_tasks.get()
+
+    return {
+        'requests': (requests_threadpool.borrowed_tokens, requests_threadpool.tasks_waiting, requests_threadpool.total_tokens),
+        'database': (min(database_tasks, database_threads_count), max(database_tasks - database_threads_count, 0), database_threads_count),
+        'password_hashing': (min(hashing_pool.queue_depth, hashing_pool.workers_count), max(hashing_pool.queue_depth - hashing_pool.workers_count, 0), hashing_pool.workers_count)
+    }
+
+
+metrics.callback_gauge("purrcafe_threadpool_busy_workers", "Workers of a pool running a task.", ("pool",), lambda: {(pool,): stats[0] for pool, stats in _get_threadpools_stats().items()})
+metrics.callback_gauge("purrcafe_threadpool_waiting_tasks", "Tasks waiting for a free worker of a pool.", ("pool",), lambda: {(pool,): stats[1] for pool, stats in _get_threadpools_stats().items()})
+metrics.callback_gauge("purrcafe_threadpool_max_workers", "Workers limit of a pool.", ("pool",), lambda: {(pool,): stats[2] for pool, stats in _get_threadpools_stats().items()})
+
+
+@router.get("/")
+def get_stats(user: Annotated[m_User, Depends(authorize_user)]) -> dict[str, Any]:
+    if user.id != m_User.ADMIN_ID:
+        raise HTTPException(
+            status_code=403,
+            detail="only admins can view server stats"
+        )
+
+    return {
+        'database': database_lock.stats(),
+        'storage': m_File.get_storage_stats(),
+        'payload_cache': payload_cache.stats(),
+        'auth_cache': auth_cache.stats(),
+        'password_hashing': hashing_pool.stats(),
+        'identity_maps': {
+            'users': user_identity_map.stats(),
+            'sessions': session_identity_map.stats(),
+            'files': file_identity_map.stats()
+        },
+        'access_counters': {
+            'pending_rows': access_counters.pending_rows_count,
+            'flushes': access_counters.flushes_count,
+            'flushed_rows': access_counters.flushed_rows_count
+        }
+    }
+
+
+@router.get("/metrics")
+async def get_metrics(user: Annotated[m_User, Depends(authorize_user)]) -> Response:
+    if user.id != m_User.ADMIN_ID:
+        raise HTTPException(
+            status_code=403,
+            detail="only admins can view server metrics"
+        )
+
+    # XXX rendered in the event loop, reading the requests threadpool limiter needs it
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
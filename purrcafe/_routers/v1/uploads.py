@@ -0,0 +1,168 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response, PlainTextResponse
+from starlette.requests import ClientDisconnect, Request
+
+from ._common import authorize_user, compute_lifetime, get_upload, write_body
+from ... import limiter
+from ..._database import File as m_File, Upload as m_Upload, User as m_User
+from ..._database.exceptions import IDNotFoundError, OperationPermissionError, WrongHashLengthError, WrongValueLengthError, ValueMismatchError
+
+router = APIRouter()
+
+
+def _upload_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=404,
+        detail="upload was not found"
+    )
+
+
+def _upload_busy() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="upload is being written to by another request"
+    )
+
+
+@router.post("/", response_class=PlainTextResponse, status_code=201)
+@limiter.limit("2/minute")
+def create_upload(
+        request: Request,
+        user: Annotated[m_User, Depends(authorize_user)],
+        upload_length: Annotated[int, Header(ge=0)] = None
+) -> str:
+    try:
+        return str(m_Upload.create(user, upload_length).id)
+    except OperationPermissionError as e:
+        raise HTTPException(
+            status_code=403,
+            detail=str(e)
+        ) from None
+    except WrongValueLengthError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        ) from None
+
+
+@router.head("/{id}")
+@limiter.limit("5/second")
+def get_upload_offset(
+        request: Request,
+        upload: Annotated[m_Upload, Depends(get_upload)]
+) -> Response:
+    response = Response(
+        headers={
+            'Upload-Offset': str(upload.upload_offset),
+            'Cache-Control': "no-store"
+        }
+    )
+
+    if upload.upload_length is not None:
+        response.headers['Upload-Length'] = str(upload.upload_length)
+
+    return response
+
+
+@router.patch("/{id}", status_code=204)
+@limiter.limit("60/minute")
+async def append_upload(
+        request: Request,
+        upload: Annotated[m_Upload, Depends(get_upload)],
+        upload_offset: Annotated[int, Header(ge=0)]
+) -> Response:
+    try:
+        writer = await upload.aopen_writer(upload_offset)
+    except IDNotFoundError:
+        raise _upload_not_found() from None
+    except OperationPermissionError:
+        raise _upload_busy() from None
+    except ValueMismatchError:
+        raise HTTPException(
+            status_code=409,
+            detail="upload offset does not match",
+            headers={'Upload-Offset': str(upload.upload_offset)}
+        ) from None
+
+    try:
+        try:
+            await write_body(request, writer)
+        except ClientDisconnect:
+            pass
+        finally:
+            await upload.aclose_writer(writer)
+    except WrongValueLengthError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e),
+            headers={'Upload-Offset': str(upload.upload_offset)}
+        ) from None
+
+    return Response(
+        status_code=204,
+        headers={'Upload-Offset': str(upload.upload_offset)}
+    )
+
+
+@router.post("/{id}/finalize", response_class=PlainTextResponse)
+@router.post("/{id}/finalize/{filename}", response_class=PlainTextResponse)
+@limiter.limit("10/minute")
+async def finalize_upload(
+        request: Request,
+        user: Annotated[m_User, Depends(authorize_user)],
+        upload: Annotated[m_Upload, Depends(get_upload)],
+        mime_type: Annotated[str, Header(alias="Content-Type")] = m_File.DEFAULT_CONTENT_TYPE,
+        filename: str = None,
+        decrypted_data_hash: Annotated[str, Header()] = None,
+        max_access_count: Annotated[int, Header()] = None,
+        expiration_datetime: Annotated[str, Header()] = None,
+        life_time: Annotated[int, Header()] = None,
+        anonymous: bool = False
+) -> str:
+    computed_lifetime = compute_lifetime(user, expiration_datetime, life_time)
+
+    try:
+        return str((await upload.afinalize(
+            uploader_hidden=anonymous,
+            lifetime=computed_lifetime,
+            filename=filename,
+            decrypted_data_hash=decrypted_data_hash,
+            mime_type=mime_type,
+            max_access_count=max_access_count
+        )).id)
+    except IDNotFoundError:
+        raise _upload_not_found() from None
+    except OperationPermissionError:
+        raise _upload_busy() from None
+    except WrongHashLengthError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=str(e)
+        ) from None
+    except WrongValueLengthError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        ) from None
+    except ValueMismatchError as e:
+        raise HTTPException(
+            status_code=409 if e.name == "upload offset" else 412,
+            detail=str(e),
+            headers={'Upload-Offset': str(upload.upload_offset)}
+        ) from None
+
+
+@router.delete("/{id}")
+@limiter.limit("5/minute")
+def delete_upload(
+        request: Request,
+        upload: Annotated[m_Upload, Depends(get_upload)]
+) -> None:
+    try:
+        upload.delete()
+    except IDNotFoundError:
+        raise _upload_not_found() from None
+    except OperationPermissionError:
+        raise _upload_busy() from None
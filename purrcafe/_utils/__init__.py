@@ -1,2 +1,5 @@
 from ._rwlock import RWLock
-from ._hashing import hash_password, verify_password
+from ._file_lock import FileLock
+from ._hashing import HashingPoolFullError, hashing_pool, hash_password, ahash_password, verify_password, averify_password
+from ._cache import LRUCache, PayloadCache
+from ._metrics import Counter, Gauge, Histogram, CallbackGauge, MetricsRegistry, metrics
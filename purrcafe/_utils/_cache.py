@@ -0,0 +1,273 @@
+from collections import OrderedDict
+from typing import Callable, Final
+import threading
+import time
+
+_HALVING_TABLE: Final[bytes] = bytes(count >> 1 for count in range(256))
+
+
+class LRUCache[K, V]:
+    _max_size: int
+    _ttl: float | None
+    _entries: OrderedDict[K, tuple[V, float | None]]
+    _lock: threading.Lock
+    _version: int
+
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int, ttl: float | None = None) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def version(self) -> int:
+        # XXX bumped by every invalidation, values read from the source before it changed must not be put anymore
+        return self._version
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / requests_count if (requests_count := self.hits + self.misses) else 0.0
+
+    def get[D](self, key: K, default: D = None) -> V | D:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None or (entry[1] is not None and entry[1] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+
+                self.misses += 1
+
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, key: K, value: V, version: int | None = None) -> None:
+        if self._max_size <= 0:
+            return
+
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+
+            self._entries[key] = (value, time.monotonic() + self._ttl if self._ttl is not None else None)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[K, V], bool]) -> None:
+        with self._lock:
+            self._version += 1
+
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            'size': len(self._entries),
+            'max_size': self._max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio
+        }
+
+
+class _FrequencySketch:
+    # XXX count-min sketch of saturating counters, they are halved every `sample_size` increments so old popularity fades away
+    DEPTH: Final[int] = 4
+    MAX_COUNT: Final[int] = 15
+
+    _width: int
+    _sample_size: int
+    _rows: list[bytearray]
+    _increments_count: int
+
+    def __init__(self, width: int) -> None:
+        self._width = width
+        self._sample_size = width * 10
+        self._rows = [bytearray(width) for _ in range(self.DEPTH)]
+        self._increments_count = 0
+
+    def _indexes(self, key: object) -> list[int]:
+        return [hash((seed, key)) % self._width for seed in range(self.DEPTH)]
+
+    def increment(self, key: object) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+
+        self._increments_count += 1
+
+        if self._increments_count >= self._sample_size:
+            for row in self._rows:
+                row[:] = row.translate(_HALVING_TABLE)
+
+            self._increments_count //= 2
+
+    def estimate(self, key: object) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+
+class PayloadCache[K]:
+    # XXX size-aware TinyLFU: a new payload is only admitted if it's at least as popular as every entry it would evict
+
+    _max_size: int
+    _max_entry_size: int
+    _size: int
+    _entries: OrderedDict[K, bytes]
+    _sketch: _FrequencySketch
+    _lock: threading.Lock
+    _version: int
+
+    hits: int
+    misses: int
+    admissions: int
+    rejections: int
+
+    def __init__(self, max_size: int, max_entry_size: int, sketch_width: int = 16384) -> None:
+        self._max_size = max_size
+        self._max_entry_size = min(max_entry_size, max_size)
+        self._size = 0
+        self._entries = OrderedDict()
+        self._sketch = _FrequencySketch(sketch_width)
+        self._lock = threading.Lock()
+        self._version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.rejections = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def version(self) -> int:
+        # XXX bumped by every discard, payloads read before their blob got deleted must not be put anymore
+        return self._version
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / requests_count if (requests_count := self.hits + self.misses) else 0.0
+
+    def get(self, key: K) -> bytes | None:
+        with self._lock:
+            self._sketch.increment(key)
+
+            if (value := self._entries.get(key)) is None:
+                self.misses += 1
+
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def _find_victims(self, key: K, size: int) -> list[K] | None:
+        if size > self._max_entry_size:
+            return None
+
+        frequency = self._sketch.estimate(key)
+        free_size = self._max_size - self._size
+        victims = []
+
+        for victim_key, victim in self._entries.items():
+            if free_size >= size:
+                break
+
+            if self._sketch.estimate(victim_key) > frequency:
+                return None
+
+            victims.append(victim_key)
+            free_size += len(victim)
+
+        return victims
+
+    def would_admit(self, key: K, size: int) -> bool:
+        with self._lock:
+            return key in self._entries or self._find_victims(key, size) is not None
+
+    def put(self, key: K, value: bytes, version: int | None = None) -> bool:
+        with self._lock:
+            if version is not None and version != self._version:
+                return False
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+                return True
+
+            if (victims := self._find_victims(key, len(value))) is None:
+                self.rejections += 1
+
+                return False
+
+            for victim_key in victims:
+                self._size -= len(self._entries.pop(victim_key))
+
+            self._entries[key] = value
+            self._size += len(value)
+            self.admissions += 1
+
+            return True
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            self._version += 1
+
+            if (value := self._entries.pop(key, None)) is not None:
+                self._size -= len(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            'entries': len(self._entries),
+            'size': self._size,
+            'max_size': self._max_size,
+            'max_entry_size': self._max_entry_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'admissions': self.admissions,
+            'rejections': self.rejections
+        }
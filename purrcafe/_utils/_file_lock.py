@@ -0,0 +1,52 @@
+from __future__ import annotations
+from os import PathLike
+from typing import BinaryIO
+import fcntl
+
+
+class FileLock:
+    # XXX an flock of a file is shared by every process using the same path and is dropped by the OS once its holder exits, even if it crashes
+    _path: str
+    _file: BinaryIO | None
+
+    def __init__(self, path: PathLike | str) -> None:
+        self._path = str(path)
+        self._file = None
+
+    @property
+    def is_held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._file is not None:
+            raise RuntimeError(f"lock {self._path} is already held")
+
+        file = open(self._path, 'ab')
+
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+
+            return False
+        except BaseException:
+            file.close()
+
+            raise
+
+        self._file = file
+
+        return True
+
+    def release(self) -> None:
+        if self._file is None:
+            raise RuntimeError(f"lock {self._path} is not held")
+
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
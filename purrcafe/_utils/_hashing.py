@@ -1,11 +1,150 @@
-import passlib.context
+from typing import Any, Callable, Final
+import asyncio
+import concurrent.futures
+import functools
+import math
+import multiprocessing
+import os
+import threading
+import time
 
-_pwd_context = passlib.context.CryptContext(schemes=["bcrypt"], deprecated="auto")
+import bcrypt
+
+_BCRYPT_MAX_PASSWORD_LENGTH: Final[int] = 72
+_BCRYPT_ROUNDS: Final[int] = int(os.environ.get('PURRCAFE_BCRYPT_ROUNDS', 12))
+
+
+class HashingPoolFullError(RuntimeError):
+    retry_after: int
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__()
+
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return "password hashing queue is full"
+
+
+class HashingPool:
+    # XXX bcrypt is deliberately slow, running it in separate processes keeps bursts of logins from taking the threads requests are served by
+    RECENT_LATENCY_WEIGHT: Final[float] = 0.1
+
+    _workers_count: int
+    _max_queue_size: int
+    _executor: concurrent.futures.ProcessPoolExecutor
+    _lock: threading.Lock
+
+    queue_depth: int
+    completed: int
+    rejections: int
+    total_latency: float
+    max_latency: float
+    recent_latency: float
+
+    def __init__(self, workers_count: int, max_queue_size: int) -> None:
+        self._workers_count = workers_count
+        self._max_queue_size = max_queue_size
+        # XXX forkserver workers only import bcrypt, neither the application nor its threads get copied into them
+        self._executor = concurrent.futures.ProcessPoolExecutor(workers_count, mp_context=multiprocessing.get_context("forkserver"))
+        self._lock = threading.Lock()
+
+        self.queue_depth = 0
+        self.completed = 0
+        self.rejections = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.recent_latency = 0.0
+
+    @property
+    def workers_count(self) -> int:
+        return self._workers_count
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.completed if self.completed else 0.0
+
+    def _on_done(self, submit_time: float, _: concurrent.futures.Future) -> None:
+        latency = time.perf_counter() - submit_time
+
+        with self._lock:
+            self.queue_depth -= 1
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.recent_latency += (latency - self.recent_latency) * self.RECENT_LATENCY_WEIGHT if self.completed > 1 else latency
+
+    def submit[T](self, func: Callable[..., T], *args: Any) -> concurrent.futures.Future[T]:
+        with self._lock:
+            if self.queue_depth >= self._max_queue_size:
+                self.rejections += 1
+
+                raise HashingPoolFullError(max(math.ceil(self.recent_latency), 1))
+
+            self.queue_depth += 1
+
+        submit_time = time.perf_counter()
+
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            with self._lock:
+                self.queue_depth -= 1
+
+            raise
+
+        future.add_done_callback(functools.partial(self._on_done, submit_time))
+
+        return future
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            'workers': self._workers_count,
+            'rounds': _BCRYPT_ROUNDS,
+            'queue_depth': self.queue_depth,
+            'max_queue_size': self._max_queue_size,
+            'completed': self.completed,
+            'rejections': self.rejections,
+            'average_latency': self.average_latency,
+            'recent_latency': self.recent_latency,
+            'max_latency': self.max_latency
+        }
+
+
+hashing_pool = HashingPool(
+    # XXX by default half of the CPUs are split between the workers, each of them has its own pool
+    int(os.environ.get('PURRCAFE_HASHING_PROCESSES', max((os.cpu_count() or 1) // 2 // int(os.environ.get('PURRCAFE_WORKERS', 1)), 1))),
+    int(os.environ.get('PURRCAFE_HASHING_QUEUE_SIZE', 32))
+)
+
+
+def _encode_password(password: str) -> bytes:
+    # XXX bcrypt only looks at the first 72 bytes, newer versions refuse longer passwords instead of truncating them like passlib did
+    return password.encode('utf-8')[:_BCRYPT_MAX_PASSWORD_LENGTH]
+
+
+def _submit_hash(password: str) -> concurrent.futures.Future[bytes]:
+    return hashing_pool.submit(bcrypt.hashpw, _encode_password(password), bcrypt.gensalt(_BCRYPT_ROUNDS))
+
+
+def _submit_verify(plain_password: str, hashed_password: str) -> concurrent.futures.Future[bool]:
+    return hashing_pool.submit(bcrypt.checkpw, _encode_password(plain_password), hashed_password.encode('ascii'))
 
 
 def hash_password(password: str) -> str:
-    return _pwd_context.hash(password)
+    return _submit_hash(password).result().decode('ascii')
+
+
+async def ahash_password(password: str) -> str:
+    return (await asyncio.wrap_future(_submit_hash(password))).decode('ascii')
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return _pwd_context.verify(plain_password, hashed_password)
+    return _submit_verify(plain_password, hashed_password).result()
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(_submit_verify(plain_password, hashed_password))
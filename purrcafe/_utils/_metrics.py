@@ -0,0 +1,217 @@
+from __future__ import annotations
+from typing import Callable, Final, Iterable
+import bisect
+import math
+import threading
+
+DEFAULT_BUCKETS: Final[tuple[float, ...]] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    if not (pairs := [f'{name}="{value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')}"' for name, value in zip(names, values)]):
+        return ""
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def _add_rows(totals: dict[tuple[str, ...], list[float]], rows: dict[tuple[str, ...], list[float]]) -> None:
+    for labels, row in rows.items():
+        if (total := totals.get(labels)) is None:
+            totals[labels] = list(row)
+        else:
+            for i, value in enumerate(row):
+                total[i] += value
+
+
+class _Metric:
+    TYPE: str
+
+    _width: int
+    _local: threading.local
+    _lock: threading.Lock
+    _shards: list[tuple[threading.Thread, dict[tuple[str, ...], list[float]]]]
+    _retired: dict[tuple[str, ...], list[float]]
+
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...], width: int) -> None:
+        self._width = width
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+
+    def _row(self, labels: tuple[str, ...]) -> list[float]:
+        # XXX every thread only ever updates its own shard, so the hot path takes no locks, shards are summed up when the metrics are rendered
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+
+        if (row := shard.get(labels)) is None:
+            row = shard[labels] = [0] * self._width
+
+        return row
+
+    def collect(self) -> dict[tuple[str, ...], list[float]]:
+        totals = {}
+
+        with self._lock:
+            # XXX shards of finished threads won't change anymore, they are folded together so short-lived threads don't pile up
+            for thread, shard in self._shards:
+                if not thread.is_alive():
+                    _add_rows(self._retired, shard)
+
+            self._shards = [(thread, shard) for thread, shard in self._shards if thread.is_alive()]
+
+            _add_rows(totals, self._retired)
+
+            for _, shard in self._shards:
+                _add_rows(totals, shard.copy())
+
+        return totals
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}" for labels, (value,) in sorted(self.collect().items())]
+
+
+class Counter(_Metric):
+    TYPE: Final[str] = "counter"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, label_names, 1)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._row(labels)[0] += amount
+
+
+class Gauge(_Metric):
+    TYPE: Final[str] = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, label_names, 1)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._row(labels)[0] += amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._row(labels)[0] -= amount
+
+    def get(self, *labels: str) -> float:
+        return row[0] if (row := self.collect().get(labels)) is not None else 0
+
+
+class Histogram(_Metric):
+    TYPE: Final[str] = "histogram"
+
+    _buckets: tuple[float, ...]
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        # XXX a row holds a non-cumulative count per bucket, one for +Inf and the sum of the observed values
+        super().__init__(name, help, label_names, len(buckets) + 2)
+
+        self._buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        row = self._row(labels)
+        row[bisect.bisect_left(self._buckets, value)] += 1
+        row[-1] += value
+
+    def render(self) -> list[str]:
+        lines = []
+
+        for labels, row in sorted(self.collect().items()):
+            count = 0
+
+            for bound, bucket_count in zip((*self._buckets, math.inf), row):
+                count += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels((*self.label_names, 'le'), (*labels, _format_value(bound)))} {_format_value(count)}")
+
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {_format_value(count)}")
+
+        return lines
+
+
+class CallbackGauge:
+    TYPE: Final[str] = "gauge"
+
+    _callback: Callable[[], dict[tuple[str, ...], float]]
+
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...], callback: Callable[[], dict[tuple[str, ...], float]]) -> None:
+        self._callback = callback
+
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}" for labels, value in sorted(self._callback().items())]
+
+
+class MetricsRegistry:
+    CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+
+    _metrics: dict[str, _Metric | CallbackGauge]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register[M: _Metric | CallbackGauge](self, metric: M) -> M:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def callback_gauge(self, name: str, help: str, label_names: tuple[str, ...], callback: Callable[[], dict[tuple[str, ...], float]]) -> CallbackGauge:
+        return self._register(CallbackGauge(name, help, label_names, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
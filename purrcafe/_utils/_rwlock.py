@@ -1,81 +1,225 @@
-from collections import deque
+from __future__ import annotations
 from typing import Callable
 import threading
+import time
 
 
 class _LockContextManager:
-    _acquire_callback: Callable[[Callable[[], None]], None]
-    _decquire_callback: Callable[[], None]
+    _acquire_callback: Callable[[float | None], bool]
+    _release_callback: Callable[[], None]
+    _timeout: float | None
 
     def __init__(
             self,
-            acquire_callback: Callable[[Callable[[], None]], None],
-            decquire_callback: Callable[[], None]
+            acquire_callback: Callable[[float | None], bool],
+            release_callback: Callable[[], None],
+            timeout: float | None = None
     ) -> None:
         self._acquire_callback = acquire_callback
-        self._decquire_callback = decquire_callback
+        self._release_callback = release_callback
+        self._timeout = timeout
 
     def __enter__(self) -> None:
-        is_acquired = threading.Event()
+        if not self._acquire_callback(self._timeout):
+            raise TimeoutError(f"lock was not acquired in {self._timeout} second(s)")
 
-        self._acquire_callback(is_acquired.set)
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._release_callback()
 
-        is_acquired.wait()
 
-    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        self._decquire_callback()
+class RWLockStats:
+    reader_acquisitions: int
+    reader_contentions: int
+    reader_timeouts: int
+    reader_wait_time: float
+    read_hold_time: float
+
+    writer_acquisitions: int
+    writer_contentions: int
+    writer_timeouts: int
+    writer_wait_time: float
+    write_hold_time: float
+
+    def __init__(self) -> None:
+        self.reader_acquisitions = 0
+        self.reader_contentions = 0
+        self.reader_timeouts = 0
+        self.reader_wait_time = 0.0
+        self.read_hold_time = 0.0
+
+        self.writer_acquisitions = 0
+        self.writer_contentions = 0
+        self.writer_timeouts = 0
+        self.writer_wait_time = 0.0
+        self.write_hold_time = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return dict(vars(self))
 
 
 class RWLock:
+    # XXX phase-fair: new readers queue up behind waiting writers, but a releasing writer admits every queued reader at once
+
+    _mutex: threading.Lock
+    _readers_condition: threading.Condition
+    _writers_condition: threading.Condition
+
     _writer_present: bool
     _readers_count: int
+    _waiting_readers_count: int
+    _waiting_writers_count: int
+    _read_phase: int
 
-    _writer_queue: deque[Callable[[], None]]
-    _reader_queue: deque[Callable[[], None]]
+    _hold_start: float
+
+    stats: RWLockStats | None
 
     reader: _LockContextManager
     writer: _LockContextManager
 
-    def __init__(self) -> None:
+    def __init__(self, instrumented: bool = False) -> None:
+        self._mutex = threading.Lock()
+        self._readers_condition = threading.Condition(self._mutex)
+        self._writers_condition = threading.Condition(self._mutex)
+
         self._writer_present = False
         self._readers_count = 0
+        self._waiting_readers_count = 0
+        self._waiting_writers_count = 0
+        self._read_phase = 0
+
+        self._hold_start = 0.0
+
+        self.stats = RWLockStats() if instrumented else None
+
+        self.reader = _LockContextManager(self.acquire_reader, self.release_reader)
+        self.writer = _LockContextManager(self.acquire_writer, self.release_writer)
+
+    def reading(self, timeout: float | None = None) -> _LockContextManager:
+        return _LockContextManager(self.acquire_reader, self.release_reader, timeout)
+
+    def writing(self, timeout: float | None = None) -> _LockContextManager:
+        return _LockContextManager(self.acquire_writer, self.release_writer, timeout)
+
+    def _admit_waiting_readers(self) -> None:
+        if self.stats is not None and self._readers_count == 0:
+            self._hold_start = time.perf_counter()
+
+        self._readers_count += self._waiting_readers_count
+        self._waiting_readers_count = 0
+        self._read_phase += 1
+
+        self._readers_condition.notify_all()
+
+    def acquire_reader(self, timeout: float | None = None) -> bool:
+        with self._mutex:
+            if not self._writer_present and not self._waiting_writers_count:
+                if self.stats is not None:
+                    self.stats.reader_acquisitions += 1
+
+                    if self._readers_count == 0:
+                        self._hold_start = time.perf_counter()
 
-        self._writer_queue = deque()
-        self._reader_queue = deque()
+                self._readers_count += 1
 
-        self.reader = _LockContextManager(self._acquire_reader, self._decquire_reader)
-        self.writer = _LockContextManager(self._acquire_writer, self._decquire_writer)
+                return True
 
-    def _acquire_reader(self, success_callback: Callable[[], None]) -> None:
-        if self._writer_present:
-            self._reader_queue.append(lambda: self._acquire_reader(success_callback))
-        else:
-            self._readers_count += 1
+            phase = self._read_phase
+            wait_start = time.perf_counter()
+            deadline = wait_start + timeout if timeout is not None else None
 
-            success_callback()
+            self._waiting_readers_count += 1
+
+            while self._read_phase == phase:
+                if deadline is not None and (remaining := deadline - time.perf_counter()) <= 0:
+                    self._waiting_readers_count -= 1
+
+                    if self.stats is not None:
+                        self.stats.reader_timeouts += 1
+
+                    if not self._waiting_readers_count and not self._readers_count and not self._writer_present and self._waiting_writers_count:
+                        self._writers_condition.notify()
+
+                    return False
+
+                self._readers_condition.wait(remaining if deadline is not None else None)
+
+            if self.stats is not None:
+                self.stats.reader_acquisitions += 1
+                self.stats.reader_contentions += 1
+                self.stats.reader_wait_time += time.perf_counter() - wait_start
+
+            return True
+
+    def release_reader(self) -> None:
+        with self._mutex:
+            if self._readers_count == 0:
+                raise RuntimeError("released a non-existent reader (counter is negative)")
 
-    def _decquire_reader(self) -> None:
-        if self._readers_count == 0:
-            raise RuntimeError("decquired a non-existant reader (counter is negative)")
-        else:
             self._readers_count -= 1
 
-            if self._readers_count == 0 and self._writer_queue:
-                self._writer_queue.popleft()()
+            if self._readers_count == 0:
+                if self.stats is not None:
+                    self.stats.read_hold_time += time.perf_counter() - self._hold_start
+
+                if self._waiting_writers_count:
+                    self._writers_condition.notify()
+
+    def acquire_writer(self, timeout: float | None = None) -> bool:
+        with self._mutex:
+            if not self._writer_present and not self._readers_count and not self._waiting_writers_count:
+                self._writer_present = True
+
+                if self.stats is not None:
+                    self.stats.writer_acquisitions += 1
+                    self._hold_start = time.perf_counter()
 
-    def _acquire_writer(self, success_callback: Callable[[], None]) -> None:
-        if self._readers_count or self._writer_present:
-            self._writer_queue.append(lambda: self._acquire_writer(success_callback))
-        else:
+                return True
+
+            wait_start = time.perf_counter()
+            deadline = wait_start + timeout if timeout is not None else None
+
+            self._waiting_writers_count += 1
+
+            while self._writer_present or self._readers_count:
+                if deadline is not None and (remaining := deadline - time.perf_counter()) <= 0:
+                    self._waiting_writers_count -= 1
+
+                    if self.stats is not None:
+                        self.stats.writer_timeouts += 1
+
+                    if not self._writer_present:
+                        if not self._waiting_writers_count and self._waiting_readers_count:
+                            self._admit_waiting_readers()
+                        elif not self._readers_count and self._waiting_writers_count:
+                            self._writers_condition.notify()
+
+                    return False
+
+                self._writers_condition.wait(remaining if deadline is not None else None)
+
+            self._waiting_writers_count -= 1
             self._writer_present = True
 
-            success_callback()
+            if self.stats is not None:
+                self.stats.writer_acquisitions += 1
+                self.stats.writer_contentions += 1
+                self._hold_start = time.perf_counter()
+                self.stats.writer_wait_time += self._hold_start - wait_start
+
+            return True
+
+    def release_writer(self) -> None:
+        with self._mutex:
+            if not self._writer_present:
+                raise RuntimeError("releasing a non-existent writer (there are no writers present)")
 
-    def _decquire_writer(self) -> None:
-        if not self._writer_present:
-            raise RuntimeError("decquiring a non-existant writer (there are no writers present)")
-        else:
             self._writer_present = False
 
-            if self._reader_queue:
-                self._reader_queue.popleft()()
+            if self.stats is not None:
+                self.stats.write_hold_time += time.perf_counter() - self._hold_start
+
+            if self._waiting_readers_count:
+                self._admit_waiting_readers()
+            elif self._waiting_writers_count:
+                self._writers_condition.notify()
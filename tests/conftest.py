@@ -0,0 +1,41 @@
+import hashlib
+import os
+import secrets
+import tempfile
+
+import pytest
+
+# XXX the package applies the migrations and opens its files on import, so it has to be pointed at scratch ones before any test imports it
+_directory = tempfile.mkdtemp(prefix="purrcafe-tests-")
+
+os.environ['PURRCAFE_DB_PATH'] = os.path.join(_directory, "purrcafe.sqlite3")
+os.environ['PURRCAFE_BLOBS_PATH'] = os.path.join(_directory, "purrcafe_blobs")
+os.environ['PURRCAFE_ACCESS_LOG_PATH'] = os.path.join(_directory, "requests.log")
+os.environ['PURRCAFE_BCRYPT_ROUNDS'] = "4"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from purrcafe import app, limiter
+
+    # XXX every request comes from the same address, the limits aren't what's being tested
+    limiter.enabled = False
+
+    # XXX used without entering it, so the background jobs aren't started for the tests
+    return TestClient(app)
+
+
+@pytest.fixture
+def create_user():
+    from purrcafe._database import User
+    from purrcafe._utils import hash_password
+
+    def create_user(email: str | None = None) -> tuple[User, dict[str, str]]:
+        password = hashlib.sha3_512(secrets.token_bytes(16)).hexdigest()
+        user = User.create(f"cat-{secrets.token_hex(8)}", email, hash_password(password))
+
+        return user, {'Authorization': f"Bearer {user.authorize(password).id}"}
+
+    return create_user
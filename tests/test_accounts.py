@@ -0,0 +1,81 @@
+import hashlib
+
+from meowid import MeowID
+
+from purrcafe._database import Session
+from purrcafe._database._database import auth_cache
+
+
+def test_taken_email_is_refused_without_applying_the_patch(client, create_user) -> None:
+    create_user("taken@purrshare.net")
+    user, headers = create_user()
+
+    response = client.patch("/v1/accounts/me", headers=headers, json={'name': "renamed", 'email': "taken@purrshare.net"})
+
+    assert response.status_code == 409
+
+    account = client.get("/v1/accounts/me", headers=headers).json()
+
+    assert account['name'] == user.name != "renamed"
+    assert account['email'] is None
+
+
+def test_patch_is_applied(client, create_user) -> None:
+    _, headers = create_user()
+
+    assert client.patch("/v1/accounts/me", headers=headers, json={'email': "new@purrshare.net"}).status_code == 200
+    assert client.get("/v1/accounts/me", headers=headers).json()['email'] == "new@purrshare.net"
+
+
+def test_too_long_name_is_refused(client, create_user) -> None:
+    _, headers = create_user()
+
+    assert client.patch("/v1/accounts/me", headers=headers, json={'name': "meow" * 16}).status_code == 422
+
+
+def _get_session_id(headers: dict[str, str]) -> int:
+    return int(MeowID.from_str(headers['Authorization'].removeprefix("Bearer ")))
+
+
+def test_password_change_drops_cached_authorization(client, create_user) -> None:
+    user, headers = create_user()
+
+    assert client.get("/v1/accounts/me", headers=headers).status_code == 200
+    assert auth_cache.get(_get_session_id(headers)) is not None
+
+    assert client.patch("/v1/accounts/me", headers=headers, json={'password': hashlib.sha3_512(b"purr").hexdigest()}).status_code == 200
+    assert auth_cache.get(_get_session_id(headers)) is None
+
+    assert client.post("/v1/session/", data={'username': user.name, 'password': "purr"}).status_code == 200
+
+
+def test_logout_drops_cached_authorization(client, create_user) -> None:
+    _, headers = create_user()
+
+    assert client.get("/v1/session/", headers=headers).status_code == 200
+    assert client.delete("/v1/session/", headers=headers).status_code == 200
+
+    assert auth_cache.get(_get_session_id(headers)) is None
+    assert client.get("/v1/session/", headers=headers).status_code == 401
+
+
+def test_session_deletion_drops_cached_authorization(client, create_user) -> None:
+    user, headers = create_user()
+    session = Session.create(user)
+    other_headers = {'Authorization': f"Bearer {session.id}"}
+
+    assert client.get("/v1/session/", headers=other_headers).status_code == 200
+
+    session.delete()
+
+    assert client.get("/v1/session/", headers=other_headers).status_code == 401
+    assert client.get("/v1/session/", headers=headers).status_code == 200
+
+
+def test_account_deletion_drops_cached_authorization(client, create_user) -> None:
+    _, headers = create_user()
+
+    assert client.get("/v1/session/", headers=headers).status_code == 200
+    assert client.delete("/v1/accounts/me", headers=headers).status_code == 200
+
+    assert client.get("/v1/session/", headers=headers).status_code == 401
@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+from purrcafe._database._utils import ConnectionPool, ConnectionProxy
+from purrcafe._database.exceptions import DatabaseInternalError
+
+
+@pytest.fixture
+def pool(tmp_path) -> ConnectionPool:
+    pool = ConnectionPool(tmp_path / "pool.sqlite3", 2)
+
+    with pool.writer:
+        pool.current.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+        pool.current.execute("CREATE TABLE children (id INTEGER PRIMARY KEY, parent_id REFERENCES parents(id) DEFERRABLE INITIALLY DEFERRED)")
+        pool.current.commit()
+
+    return pool
+
+
+def _count_children(pool: ConnectionPool) -> int:
+    with pool.reader:
+        return pool.current.execute("SELECT count(*) FROM children").fetchone()[0]
+
+
+def test_failed_commit_rolls_back(pool: ConnectionPool) -> None:
+    database = ConnectionProxy(pool)
+
+    with pool.writer:
+        pool.current.execute("PRAGMA foreign_keys=ON")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.transaction:
+            database.execute("INSERT INTO children VALUES (1, 1)")
+
+    with pool.transaction:
+        database.execute("INSERT INTO parents VALUES (1)")
+
+    assert _count_children(pool) == 0
+
+
+def test_rollback_inside_of_transaction_is_refused(pool: ConnectionPool) -> None:
+    database = ConnectionProxy(pool)
+
+    with pool.transaction:
+        database.execute("INSERT INTO parents VALUES (1)")
+
+        with pytest.raises(DatabaseInternalError):
+            database.rollback()
+
+    with pool.reader:
+        assert pool.current.execute("SELECT count(*) FROM parents").fetchone()[0] == 1
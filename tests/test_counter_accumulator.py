@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+from typing import Callable
+
+import pytest
+
+from purrcafe._database._utils import ConnectionPool, ConnectionProxy, CounterAccumulator
+
+
+@pytest.fixture
+def pool(tmp_path) -> ConnectionPool:
+    pool = ConnectionPool(tmp_path / "counters.sqlite3", 2)
+
+    with pool.writer:
+        pool.current.execute("CREATE TABLE counters (id INTEGER PRIMARY KEY, hits INTEGER NOT NULL)")
+        pool.current.execute("INSERT INTO counters VALUES (1, 0)")
+        pool.current.commit()
+
+    return pool
+
+
+def _get_hits(pool: ConnectionPool) -> int:
+    with pool.reader:
+        return ConnectionProxy(pool).execute("SELECT hits FROM counters WHERE id=1").fetchone()[0]
+
+
+def test_flushed_counts_are_no_longer_pending(pool: ConnectionPool) -> None:
+    flushed_ids = []
+    counters = CounterAccumulator(pool, "counters", ("hits",), 1024, flushed_ids.append)
+
+    counters.add(1, 0, 3)
+
+    assert counters.flush() == 1
+    assert _get_hits(pool) == 3
+    assert counters.get_pending(1, 0) == 0
+    assert flushed_ids == [1]
+
+
+def test_failed_flush_keeps_its_batch(pool: ConnectionPool) -> None:
+    counters = CounterAccumulator(pool, "counters", ("hits",), 1024)
+
+    with pool.writer:
+        pool.current.execute("CREATE TRIGGER refuse BEFORE UPDATE ON counters BEGIN SELECT RAISE(ABORT, 'refused'); END")
+        pool.current.commit()
+
+    counters.add(1, 0, 2)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        counters.flush()
+
+    counters.add(1, 0)
+
+    assert counters.get_pending(1, 0) == 3
+
+    with pool.writer:
+        pool.current.execute("DROP TRIGGER refuse")
+        pool.current.commit()
+
+    counters.flush()
+
+    assert _get_hits(pool) == 3
+    assert counters.get_pending(1, 0) == 0
+
+
+def test_discarded_counts_are_not_flushed(pool: ConnectionPool) -> None:
+    counters = CounterAccumulator(pool, "counters", ("hits",), 1024)
+
+    counters.add(1, 0, 5)
+    counters.discard(1, 0)
+    counters.flush()
+
+    assert _get_hits(pool) == 0
+
+
+class _CommitHook:
+    def __init__(self, connection: sqlite3.Connection, on_commit: Callable[[], None]) -> None:
+        self._connection = connection
+        self._on_commit = on_commit
+
+    def __getattr__(self, name: str):
+        return getattr(self._connection, name)
+
+    def commit(self) -> None:
+        self._connection.commit()
+        self._on_commit()
+
+
+def test_counts_read_during_flush_are_not_counted_twice(pool: ConnectionPool, monkeypatch) -> None:
+    counters = CounterAccumulator(pool, "counters", ("hits",), 1024)
+    readers = []
+    readings = []
+
+    def read() -> None:
+        # XXX the stored count first and the pending one after it, the way the counter getters of files add them up
+        hits = _get_hits(pool)
+
+        readings.append(hits + counters.get_pending(1, 0))
+
+    def read_after_commit() -> None:
+        # XXX the reader gets as far as it can while the flush has committed its batch but hasn't finished yet
+        readers.append(reader := threading.Thread(target=read))
+        reader.start()
+        reader.join(0.5)
+
+    monkeypatch.setattr(pool, "_writer_connection", _CommitHook(pool._writer_connection, read_after_commit))
+
+    counters.add(1, 0, 3)
+    counters.flush()
+
+    for reader in readers:
+        reader.join()
+
+    assert readings == [3]
+
+
+def test_flush_inside_of_transaction_waits_for_its_commit(pool: ConnectionPool) -> None:
+    counters = CounterAccumulator(pool, "counters", ("hits",), 1024)
+
+    counters.add(1, 0, 2)
+
+    with pool.transaction:
+        assert counters.flush() == 0
+        assert counters.get_pending(1, 0) == 2
+
+    assert _get_hits(pool) == 2
+    assert counters.get_pending(1, 0) == 0
@@ -0,0 +1,249 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+from meowid import MeowID
+
+from purrcafe._database import File
+from purrcafe._database._database import blob_store, database
+from purrcafe._database._utils import iter_decompressed
+from purrcafe._database.exceptions import DatabaseInternalError
+from purrcafe._utils import PayloadCache
+
+DATA = b"".join(b"%08d meow\n" % i for i in range(100000))
+
+
+@pytest.fixture(scope="module")
+def compressed_file_id(client) -> str:
+    return client.post("/v1/files/", content=DATA, headers={'Content-Type': "text/plain"}).text
+
+
+def test_file_is_stored_compressed(client, compressed_file_id: str) -> None:
+    response = client.get(f"/v1/files/{compressed_file_id}", headers={'Accept-Encoding': "gzip"})
+
+    assert response.headers['Content-Encoding'] == "gzip"
+    assert response.content == DATA
+
+
+def test_ascending_ranges_of_compressed_file(client, compressed_file_id: str) -> None:
+    ranges = [(10, 20), (300000, 300100), (999990, 999999)]
+
+    response = client.get(f"/v1/files/{compressed_file_id}", headers={'Range': "bytes=" + ",".join(f"{start}-{stop}" for start, stop in ranges)})
+
+    assert response.status_code == 206
+    assert int(response.headers['Content-Length']) == len(response.content)
+
+    for start, stop in ranges:
+        assert f"Content-Range: bytes {start}-{stop}/{len(DATA)}\r\n\r\n".encode() + DATA[start:stop + 1] + b"\r\n" in response.content
+
+
+def test_unordered_ranges_of_compressed_file_are_served_in_full(client, compressed_file_id: str) -> None:
+    response = client.get(f"/v1/files/{compressed_file_id}", headers={'Range': "bytes=500-600,0-10"})
+
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_unordered_ranges_of_plain_file(client) -> None:
+    file_id = client.post("/v1/files/", content=DATA, headers={'Content-Type': "image/png"}).text
+
+    response = client.get(f"/v1/files/{file_id}", headers={'Range': "bytes=500-600,0-10"})
+
+    assert response.status_code == 206
+    assert int(response.headers['Content-Length']) == len(response.content)
+    assert response.content.index(DATA[500:601]) < response.content.index(DATA[0:11])
+
+
+def _gzip(data: bytes) -> bytes:
+    compressor = zlib.compressobj(wbits=31)
+
+    return compressor.compress(data) + compressor.flush()
+
+
+def test_truncated_data_is_refused() -> None:
+    assert b"".join(iter_decompressed((_gzip(DATA),), 0, len(DATA), 65536)) == DATA
+
+    with pytest.raises(DatabaseInternalError):
+        b"".join(iter_decompressed((_gzip(DATA)[:-100],), 0, len(DATA), 65536))
+
+
+def test_payload_read_before_release_is_not_cached() -> None:
+    cache = PayloadCache(1024, 1024)
+    version = cache.version
+
+    cache.discard("key")
+
+    assert not cache.put("key", b"meow", version)
+    assert cache.get("key") is None
+
+
+def test_vanished_blob_is_not_found(client, monkeypatch) -> None:
+    file_id = client.post("/v1/files/", content=os.urandom(65536), headers={'Content-Type': "image/png"}).text
+
+    def open_missing(key):
+        raise FileNotFoundError(key)
+
+    monkeypatch.setattr(blob_store, "open", open_missing)
+    monkeypatch.setattr(blob_store, "read", open_missing)
+
+    assert client.get(f"/v1/files/{file_id}").status_code == 404
+    assert client.get(f"/v1/files/{file_id}", headers={'Range': "bytes=0-10,20-30"}).status_code == 404
+
+
+def test_rolled_back_changes_do_not_reach_the_object(client) -> None:
+    file = File.get(MeowID.from_str(client.post("/v1/files/", content=b"meow").text))
+
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            file.filename = "renamed.txt"
+            file.mime_type = "text/plain"
+
+            raise RuntimeError
+
+    assert file.filename is None
+    assert file.mime_type == File.DEFAULT_CONTENT_TYPE
+    assert File.get(file.id).filename is None
+
+    file.filename = "renamed.txt"
+
+    assert file.filename == "renamed.txt"
+
+
+def test_replaced_data_is_not_kept_on_the_object(client) -> None:
+    file = File.get(MeowID.from_str(client.post("/v1/files/", content=os.urandom(1024), headers={'Content-Type': "image/png"}).text))
+    old_data_key = file.data_key
+
+    file.data = new_data = os.urandom(1024)
+
+    assert not hasattr(file, "_data")
+    assert file.data == new_data
+    assert not blob_store.exists(old_data_key)
+
+
+def test_unreferenced_blob_is_removed_when_insert_fails(client, monkeypatch) -> None:
+    data = os.urandom(1024)
+
+    def fail(*args) -> None:
+        raise RuntimeError
+
+    monkeypatch.setattr(File, "_acquire_data", staticmethod(fail))
+
+    with pytest.raises(RuntimeError):
+        client.post("/v1/files/", content=data, headers={'Content-Type': "image/png"})
+
+    assert not blob_store.exists(hashlib.sha256(data).hexdigest())
+
+
+@pytest.fixture(scope="module")
+def plain_data() -> bytes:
+    return os.urandom(65536)
+
+
+@pytest.fixture(scope="module")
+def plain_file_id(client, plain_data: bytes) -> str:
+    return client.post("/v1/files/", content=plain_data, headers={'Content-Type': "image/png"}).text
+
+
+def test_single_range(client, plain_file_id: str, plain_data: bytes) -> None:
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 100-199/{len(plain_data)}"
+    assert response.content == plain_data[100:200]
+
+
+def test_suffix_range(client, plain_file_id: str, plain_data: bytes) -> None:
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=-500"})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes {len(plain_data) - 500}-{len(plain_data) - 1}/{len(plain_data)}"
+    assert response.content == plain_data[-500:]
+
+
+def test_multipart_ranges(client, plain_file_id: str, plain_data: bytes) -> None:
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=0-9,1000-1099"})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Type'].startswith("multipart/byteranges; boundary=")
+    assert int(response.headers['Content-Length']) == len(response.content)
+
+    boundary = response.headers['Content-Type'].removeprefix("multipart/byteranges; boundary=").encode()
+
+    assert response.content == (
+        b"--" + boundary + b"\r\nContent-Type: image/png\r\nContent-Range: bytes 0-9/%d\r\n\r\n" % len(plain_data) + plain_data[0:10] + b"\r\n"
+        + b"--" + boundary + b"\r\nContent-Type: image/png\r\nContent-Range: bytes 1000-1099/%d\r\n\r\n" % len(plain_data) + plain_data[1000:1100] + b"\r\n"
+        + b"--" + boundary + b"--\r\n"
+    )
+
+
+def test_if_range(client, plain_file_id: str, plain_data: bytes) -> None:
+    etag = client.head(f"/v1/files/{plain_file_id}").headers['ETag']
+
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=0-9", 'If-Range': etag})
+
+    assert response.status_code == 206
+    assert response.content == plain_data[:10]
+
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=0-9", 'If-Range': '"outdated"'})
+
+    assert response.status_code == 200
+    assert response.content == plain_data
+
+
+def test_unsatisfiable_range(client, plain_file_id: str, plain_data: bytes) -> None:
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'Range': f"bytes={len(plain_data)}-"})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(plain_data)}"
+
+
+def test_strong_etag(client, plain_file_id: str) -> None:
+    full = client.get(f"/v1/files/{plain_file_id}")
+    partial = client.get(f"/v1/files/{plain_file_id}", headers={'Range': "bytes=0-9"})
+
+    assert full.status_code == 200
+    assert partial.status_code == 206
+    assert full.headers['ETag'].startswith('"')
+    assert partial.headers['ETag'] == full.headers['ETag']
+
+
+def test_if_none_match(client, plain_file_id: str) -> None:
+    etag = client.head(f"/v1/files/{plain_file_id}").headers['ETag']
+
+    response = client.get(f"/v1/files/{plain_file_id}", headers={'If-None-Match': f'"outdated", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers['ETag'] == etag
+
+    assert client.get(f"/v1/files/{plain_file_id}", headers={'If-None-Match': '"outdated"'}).status_code == 200
+
+
+def test_only_unlimited_files_are_immutable(client, plain_file_id: str) -> None:
+    limited_file_id = client.post("/v1/files/", content=os.urandom(1024), headers={'Content-Type': "image/png", 'Max-Access-Count': "5"}).text
+
+    assert "immutable" in client.head(f"/v1/files/{plain_file_id}").headers['Cache-Control']
+
+    response = client.get(f"/v1/files/{limited_file_id}")
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == "public, no-cache"
+    assert response.headers['Accept-Ranges'] == "none"
+
+
+def test_shared_blob_outlives_one_of_its_files(client, create_user) -> None:
+    _, headers = create_user()
+    data = os.urandom(1024)
+
+    first_file_id, second_file_id = (client.post("/v1/files/", content=data, headers={**headers, 'Content-Type': "image/png"}).text for _ in range(2))
+    data_key = File.get(MeowID.from_str(first_file_id)).data_key
+
+    assert File.get(MeowID.from_str(second_file_id)).data_key == data_key
+
+    assert client.delete(f"/v1/files/{first_file_id}", headers=headers).status_code == 200
+    assert blob_store.exists(data_key)
+    assert client.get(f"/v1/files/{second_file_id}").content == data
+
+    assert client.delete(f"/v1/files/{second_file_id}", headers=headers).status_code == 200
+    assert not blob_store.exists(data_key)
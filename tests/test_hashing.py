@@ -0,0 +1,37 @@
+import hashlib
+
+from purrcafe._utils import hashing_pool, hash_password, verify_password
+
+# XXX sha3-512 hex digest of "meow" as the login sends it, hashed the way passlib did, which cut passwords off at 72 bytes
+OLD_PASSWORD = hashlib.sha3_512(b"meow").hexdigest()
+OLD_HASH = "$2b$04$AX/8A9DhRBgBQqpE97Wz8eIXnKJRSIkLJXdvzENMnY4NCGu9omGpW"
+
+
+def test_full_pool_answers_503(client, create_user, monkeypatch) -> None:
+    user, _ = create_user()
+    rejections = hashing_pool.rejections
+
+    monkeypatch.setattr(hashing_pool, "_max_queue_size", 0)
+    monkeypatch.setattr(hashing_pool, "recent_latency", 2.5)
+
+    response = client.post("/v1/session/", data={'username': user.name, 'password': "meow"})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == "3"
+    assert hashing_pool.rejections == rejections + 1
+
+
+def test_old_hashes_still_verify() -> None:
+    assert verify_password(OLD_PASSWORD, OLD_HASH)
+    assert not verify_password(hashlib.sha3_512(b"purr").hexdigest(), OLD_HASH)
+
+
+def test_passwords_are_truncated_to_72_bytes() -> None:
+    # XXX like passlib did, only the first 72 bytes count, so longer passwords don't get refused
+    assert verify_password(OLD_PASSWORD[:72] + "purr", OLD_HASH)
+    assert not verify_password(OLD_PASSWORD[:71], OLD_HASH)
+
+    new_hash = hash_password(OLD_PASSWORD)
+
+    assert verify_password(OLD_PASSWORD, new_hash)
+    assert verify_password(OLD_PASSWORD[:72], new_hash)
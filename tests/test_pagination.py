@@ -0,0 +1,138 @@
+import datetime
+import os
+
+import pytest
+from meowid import MeowID
+
+from purrcafe._database import Session
+from purrcafe._database._database import database, database_lock
+from purrcafe._routers.v1 import _common
+
+
+def _upload(client, headers: dict[str, str], filename: str = "meow.png", mime_type: str = "image/png") -> str:
+    return client.post(f"/v1/files/{filename}", content=os.urandom(256), headers={**headers, 'Content-Type': mime_type}).text
+
+
+def _sorted_by_id(ids: list[str]) -> list[str]:
+    return sorted(ids, key=lambda id_: int(MeowID.from_str(id_)))
+
+
+def _update_files(file_ids: list[str], column: str, value: datetime.datetime | None) -> None:
+    with database_lock.writer:
+        database.executemany(f"UPDATE files SET {column}=(?) WHERE id=(?)", ((value, int(MeowID.from_str(file_id))) for file_id in file_ids))
+        database.commit()
+
+
+def _get_all_pages(client, url: str, headers: dict[str, str], limit: int, **params: str) -> list[list[str]]:
+    pages = []
+    after = None
+
+    while True:
+        response = client.get(url, headers=headers, params={**params, 'limit': limit, **({'after': after} if after is not None else {})})
+
+        assert response.status_code == 200
+
+        if not (page := response.json()):
+            return pages
+
+        pages.append(page)
+        after = page[-1]
+
+
+@pytest.fixture
+def uploader(client, create_user) -> tuple[dict[str, str], list[str]]:
+    _, headers = create_user()
+
+    return headers, [_upload(client, headers) for _ in range(5)]
+
+
+def test_pages_by_id(client, uploader) -> None:
+    headers, file_ids = uploader
+
+    pages = _get_all_pages(client, "/v1/accounts/me/files", headers, 2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == client.get("/v1/accounts/me/files", headers=headers).json() == _sorted_by_id(file_ids)
+
+
+def test_pages_by_upload_datetime_with_ties(client, uploader) -> None:
+    headers, file_ids = uploader
+    upload_datetime = datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC)
+
+    # XXX two distinct times with several files each, so pages have to continue in the middle of a tie
+    _update_files(file_ids[:3], "upload_datetime", upload_datetime + datetime.timedelta(hours=1))
+    _update_files(file_ids[3:], "upload_datetime", upload_datetime)
+
+    expected = _sorted_by_id(file_ids[3:]) + _sorted_by_id(file_ids[:3])
+
+    for limit in (1, 2, 3):
+        assert sum(_get_all_pages(client, "/v1/accounts/me/files", headers, limit, order="upload_datetime"), []) == expected
+
+    assert client.get("/v1/accounts/me/files", headers=headers, params={'order': "upload_datetime"}).json() == expected
+
+
+def test_pages_without_limit_are_streamed_in_full(client, uploader, monkeypatch) -> None:
+    headers, file_ids = uploader
+
+    monkeypatch.setattr(_common, "PAGE_MAX_SIZE", 2)
+
+    assert sorted(client.get("/v1/accounts/me/files", headers=headers).json()) == sorted(file_ids)
+
+
+@pytest.mark.parametrize("limit", [0, -1, _common.PAGE_MAX_SIZE + 1])
+def test_limit_out_of_bounds_is_refused(client, uploader, limit: int) -> None:
+    headers, _ = uploader
+
+    assert client.get("/v1/accounts/me/files", headers=headers, params={'limit': limit}).status_code == 422
+
+
+def test_unknown_cursor_is_not_found(client, uploader, create_user) -> None:
+    headers, _ = uploader
+    _, other_headers = create_user()
+    other_file_id = _upload(client, other_headers)
+
+    assert client.get("/v1/accounts/me/files", headers=headers, params={'after': other_file_id, 'order': "upload_datetime"}).status_code == 404
+
+
+def test_filters(client, create_user) -> None:
+    _, headers = create_user()
+    now = datetime.datetime.now(datetime.UTC)
+
+    text_file_id = _upload(client, headers, "notes.txt", "text/plain")
+    soon_file_id = _upload(client, headers, "meow-soon.png")
+    later_file_id = _upload(client, headers, "meow-later.png")
+    never_file_id = _upload(client, headers, "purr.png")
+
+    _update_files([text_file_id, soon_file_id], "expiration_datetime", now + datetime.timedelta(hours=1))
+    _update_files([later_file_id], "expiration_datetime", now + datetime.timedelta(days=10))
+    _update_files([never_file_id], "expiration_datetime", None)
+
+    def list_ids(**params: str) -> set[str]:
+        response = client.get("/v1/accounts/me/files", headers=headers, params={**params, 'limit': 1})
+        ids = set(response.json())
+
+        # XXX filters have to hold on every page, not only the first one
+        while response.json():
+            response = client.get("/v1/accounts/me/files", headers=headers, params={**params, 'limit': 1, 'after': response.json()[-1]})
+            ids.update(response.json())
+
+        return ids
+
+    assert list_ids(mime_type="text/plain") == {text_file_id}
+    assert list_ids(filename_prefix="meow-") == {soon_file_id, later_file_id}
+    assert list_ids(expires_before=(now + datetime.timedelta(days=1)).isoformat()) == {text_file_id, soon_file_id}
+    assert list_ids(expires_after=(now + datetime.timedelta(days=1)).isoformat()) == {later_file_id, never_file_id}
+    assert list_ids(mime_type="image/png", expires_before=(now + datetime.timedelta(days=1)).isoformat()) == {soon_file_id}
+
+
+def test_session_pages(client, create_user) -> None:
+    user, headers = create_user()
+    session_ids = [str(Session.create(user).id) for _ in range(4)]
+
+    pages = _get_all_pages(client, "/v1/session/all", headers, 2)
+    listed_ids = sum(pages, [])
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert set(session_ids) < set(listed_ids)
+    assert listed_ids == _sorted_by_id(listed_ids)
+    assert client.get("/v1/session/all", headers=headers).json() == listed_ids
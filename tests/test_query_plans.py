@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from purrcafe._database import File, Upload
+from purrcafe._database._database import access_counters, database_lock
+from purrcafe._database._utils import ConnectionProxy
+
+# XXX statements reading whole tables on purpose, none of them is on a request's path
+FULL_SCANS = frozenset((
+    "SELECT name FROM sqlite_master WHERE type='table'",
+    "SELECT * FROM users",
+    "SELECT * FROM sessions",
+    "SELECT count(*), total(reference_count), total(file_size), total(file_size * reference_count) FROM blobs"
+))
+
+
+@pytest.fixture
+def statements(monkeypatch) -> dict[str, tuple]:
+    statements = {}
+    execute = ConnectionProxy.execute
+    executemany = ConnectionProxy.executemany
+
+    def recording_execute(self, sql, parameters=()):
+        statements.setdefault(sql, tuple(parameters))
+
+        return execute(self, sql, parameters)
+
+    def recording_executemany(self, sql, parameters):
+        parameters = [tuple(row) for row in parameters]
+
+        if parameters:
+            statements.setdefault(sql, parameters[0])
+
+        return executemany(self, sql, parameters)
+
+    monkeypatch.setattr(ConnectionProxy, "execute", recording_execute)
+    monkeypatch.setattr(ConnectionProxy, "executemany", recording_executemany)
+
+    return statements
+
+
+def _run_workload(client, create_user) -> None:
+    user, headers = create_user("planned@purrshare.net")
+
+    file_ids = [
+        client.post(f"/v1/files/{i}.txt", headers={**headers, 'Content-Type': "text/plain", 'Life-Time': "3600"}, content=os.urandom(2048).hex().encode()).text
+        for i in range(3)
+    ]
+
+    client.get(f"/v1/files/{file_ids[0]}")
+    client.get(f"/v1/files/{file_ids[0]}/meta")
+    client.get("/v1/accounts/me/files", headers=headers, params={'after': file_ids[0], 'mime_type': "text/plain", 'filename_prefix': "1"})
+    client.get("/v1/accounts/me/files", headers=headers, params={'after': file_ids[0], 'order': "upload_datetime", 'expires_after': "2000-01-01T00:00:00Z", 'expires_before': "2100-01-01T00:00:00Z"})
+    client.get("/v1/session/all", headers=headers)
+    client.patch("/v1/accounts/me", headers=headers, json={'name': user.name, 'email': "replanned@purrshare.net"})
+    client.delete(f"/v1/files/{file_ids[1]}", headers=headers)
+
+    upload_id = client.post("/v1/uploads/", headers=headers).text
+    client.patch(f"/v1/uploads/{upload_id}", headers={**headers, 'Upload-Offset': "0"}, content=b"meow" * 1024)
+    client.head(f"/v1/uploads/{upload_id}", headers=headers)
+    client.post(f"/v1/uploads/{client.post('/v1/uploads/', headers=headers).text}/finalize", headers=headers)
+
+    access_counters.flush()
+    Upload.delete_all_abandoned()
+    File.delete_all_expired()
+    File.get_next_expiration_datetimes(16)
+
+    client.delete("/v1/accounts/me", headers=headers)
+
+
+def _explain(sql: str, parameters: tuple) -> list[str]:
+    with database_lock.writer:
+        return [detail for *_, detail in database_lock.current.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()]
+
+
+def test_statements_use_indexes(client, create_user, statements: dict[str, tuple]) -> None:
+    _run_workload(client, create_user)
+
+    # XXX makes sure the lookups the indexes were added for actually ran
+    for fragment in ("FROM files WHERE uploader_id=(?)", "FROM sessions WHERE owner_id=(?)", "expiration_datetime < (?)", "DELETE FROM uploads WHERE owner_id=(?)"):
+        assert any(fragment in sql for sql in statements), fragment
+
+    scans = {}
+
+    for sql, parameters in statements.items():
+        if sql in FULL_SCANS or sql.startswith(("PRAGMA", "BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK")):
+            continue
+
+        plan = _explain(sql, parameters)
+
+        if any(detail.startswith("SCAN") and not detail.startswith("SCAN CONSTANT ROW") for detail in plan):
+            scans[sql] = plan
+        else:
+            assert all(detail.startswith(("SEARCH", "USE TEMP B-TREE", "SCAN CONSTANT ROW", "LIST SUBQUERY", "CORRELATED")) for detail in plan), (sql, plan)
+
+    assert not scans
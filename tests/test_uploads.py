@@ -0,0 +1,56 @@
+import datetime
+import os
+
+from meowid import MeowID
+
+from purrcafe._database import Upload
+from purrcafe._database._database import database, database_lock
+
+
+def test_guests_cannot_use_uploads(client) -> None:
+    assert client.post("/v1/uploads/").status_code == 403
+    assert client.head(f"/v1/uploads/{MeowID.generate()}").status_code == 403
+
+
+def test_chunks_are_written_and_finalized(client, create_user) -> None:
+    _, headers = create_user()
+    data = os.urandom(600000)
+
+    upload_id = client.post("/v1/uploads/", headers=headers, content=b"").text
+
+    response = client.patch(f"/v1/uploads/{upload_id}", headers={**headers, 'Upload-Offset': "0"}, content=data[:400000])
+    assert response.status_code == 204
+    assert response.headers['Upload-Offset'] == "400000"
+
+    response = client.patch(f"/v1/uploads/{upload_id}", headers={**headers, 'Upload-Offset': "400000"}, content=data[400000:])
+    assert response.headers['Upload-Offset'] == str(len(data))
+
+    file_id = client.post(f"/v1/uploads/{upload_id}/finalize", headers=headers).text
+
+    assert client.get(f"/v1/files/{file_id}").content == data
+
+
+def _abandon(upload: Upload) -> None:
+    with database_lock.writer:
+        database.execute("UPDATE uploads SET update_datetime=(?) WHERE id=(?)", (datetime.datetime.now(datetime.UTC) - Upload.LIFETIME * 2, int(upload.id)))
+        database.commit()
+
+
+def test_abandoned_uploads_being_written_to_are_kept(create_user) -> None:
+    user, _ = create_user()
+    upload = Upload.create(user, None)
+    _abandon(upload)
+
+    writer = upload.open_writer(0)
+
+    try:
+        Upload.delete_all_abandoned()
+
+        assert upload.path.exists()
+    finally:
+        upload.close_writer(writer)
+
+    _abandon(upload)
+
+    assert Upload.delete_all_abandoned() >= 1
+    assert not upload.path.exists()
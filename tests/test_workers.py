@@ -0,0 +1,120 @@
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import os
+import pathlib
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+from meowid import MeowID
+
+ADMIN_PASSWORD = "meow"
+REQUESTS_COUNT = 64
+EXPIRY_POLL_DELAY = 1
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server_url(tmp_path: pathlib.Path):
+    port = _get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "purrcafe"],
+        cwd=pathlib.Path(__file__).parents[1],
+        env={
+            **os.environ,
+            'PURRCAFE_WORKERS': "2",
+            'PURRCAFE_PORT': str(port),
+            'PURRCAFE_DB_PATH': str(tmp_path / "purrcafe.sqlite3"),
+            'PURRCAFE_BLOBS_PATH': str(tmp_path / "purrcafe_blobs"),
+            'PURRCAFE_ACCESS_LOG_PATH': str(tmp_path / "requests.log"),
+            'PURRCAFE_EXPIRY_POLL_DELAY': str(EXPIRY_POLL_DELAY),
+            'PURRCAFE_ADMIN_PASSWORD': hashlib.sha3_512(ADMIN_PASSWORD.encode('utf-8')).hexdigest()
+        }
+    )
+
+    url = f"http://localhost:{port}"
+
+    try:
+        deadline = time.monotonic() + 30
+
+        while True:
+            try:
+                httpx.get(f"{url}/v1/session/").raise_for_status()
+
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise
+
+                time.sleep(0.1)
+
+        yield url
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def _get_statuses(url: str, token: str) -> list[int]:
+    # XXX every request gets a connection of its own and they are sent at once, so both workers end up accepting some
+    def get_status(_: int) -> int:
+        return httpx.get(f"{url}/v1/session/", headers={'Authorization': f"Bearer {token}"}).status_code
+
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+        return list(executor.map(get_status, range(REQUESTS_COUNT)))
+
+
+def _login(url: str) -> str:
+    response = httpx.post(f"{url}/v1/session/", data={'username': "Admin", 'password': ADMIN_PASSWORD})
+    response.raise_for_status()
+
+    return response.json()['access_token']
+
+
+def test_logout_is_seen_by_every_worker(server_url: str) -> None:
+    token = _login(server_url)
+
+    assert _get_statuses(server_url, token) == [200] * REQUESTS_COUNT
+
+    httpx.delete(f"{server_url}/v1/session/", headers={'Authorization': f"Bearer {token}"}).raise_for_status()
+
+    assert _get_statuses(server_url, token) == [401] * REQUESTS_COUNT
+
+
+def test_files_expiring_in_any_worker_are_deleted(server_url: str, tmp_path: pathlib.Path) -> None:
+    headers = {'Authorization': f"Bearer {_login(server_url)}"}
+    life_time = 2
+
+    response = httpx.post(f"{server_url}/v1/files/", content=os.urandom(64), headers={**headers, 'Content-Type': "image/png"})
+    response.raise_for_status()
+
+    file_id = response.text
+
+    # XXX changed behind the workers' backs, so like a deadline scheduled by a worker that isn't the leader, none of them has it scheduled
+    with contextlib.closing(sqlite3.connect(tmp_path / "purrcafe.sqlite3")) as connection, connection:
+        connection.execute(
+            "UPDATE files SET expiration_datetime=(?) WHERE id=(?)",
+            (str(datetime.datetime.now(datetime.UTC) + datetime.timedelta(seconds=life_time)), int(MeowID.from_str(file_id)))
+        )
+
+    # XXX listing doesn't delete expired files on its own, unlike downloading them
+    def is_listed() -> bool:
+        return file_id in httpx.get(f"{server_url}/v1/accounts/me/files", headers=headers).json()
+
+    deadline = time.monotonic() + life_time + EXPIRY_POLL_DELAY + 3
+
+    while is_listed() and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    assert not is_listed()